@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""Denormalized per-member attendance summary.
+
+One document per member in ``attendance_summaries``::
+
+    {user_id, last_check_in, last_check_in_date, first_check_in,
+     total_visits, current_streak, longest_streak, recent_dates}
+
+``recent_dates`` holds the last RECENT_DATES_KEPT distinct check-in dates
+(YYYY-MM-DD), which is enough to answer "visits in the last 30 days" without
+touching the attendance collection. The summary is updated by
+``record_check_in`` when attendance is marked and can be rebuilt from the
+attendance collection at any time:
+
+    python attendance_summary.py --rebuild
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional
+
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+from retention import LOCKS_COLLECTION, acquire_daily_lease, release_daily_lease
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_COLLECTION = "attendance_summaries"
+RECENT_DATES_KEPT = 31
+BACKFILL_LEASE = "attendance_summary_backfill"
+BACKFILL_DONE = "done"
+
+
+def _to_date(value: str) -> Optional[date]:
+    try:
+        return datetime.fromisoformat(str(value)[:10]).date()
+    except (TypeError, ValueError):
+        return None
+
+
+async def record_check_in(db, user_id: str, check_in_time: str) -> None:
+    """Fold one check-in into the member's summary.
+
+    Each step is a single atomic update: extend the streak if the previous
+    visit was yesterday, restart it after a gap, otherwise create the first
+    summary. A second check-in on the same day matches none of them and does
+    not change anything. A check-in dated before the last one (a backdated
+    entry) cannot be folded in incrementally, so the member's summary is
+    rebuilt from the attendance collection instead.
+    """
+    collection = db[SUMMARY_COLLECTION]
+    day = check_in_time[:10]
+    yesterday = (_to_date(day) - timedelta(days=1)).isoformat()
+    common = {
+        "$inc": {"total_visits": 1},
+        "$max": {"last_check_in": check_in_time},
+        "$push": {"recent_dates": {"$each": [day], "$slice": -RECENT_DATES_KEPT}},
+    }
+
+    extended = await collection.update_one(
+        {"user_id": user_id, "last_check_in_date": yesterday},
+        {**common, "$inc": {"total_visits": 1, "current_streak": 1}, "$set": {"last_check_in_date": day}},
+    )
+    if extended.matched_count:
+        # $max is monotonic, so reading the new streak back separately is safe
+        summary = await collection.find_one({"user_id": user_id}, {"_id": 0, "current_streak": 1})
+        if summary:
+            await collection.update_one(
+                {"user_id": user_id}, {"$max": {"longest_streak": summary.get("current_streak", 1)}}
+            )
+        return
+
+    restarted = await collection.update_one(
+        {"user_id": user_id, "last_check_in_date": {"$lt": yesterday}},
+        {
+            **common,
+            "$set": {"last_check_in_date": day, "current_streak": 1},
+            "$max": {"last_check_in": check_in_time, "longest_streak": 1},
+        },
+    )
+    if restarted.matched_count:
+        return
+
+    try:
+        created = await collection.update_one(
+            {"user_id": user_id},
+            {"$setOnInsert": {
+                "user_id": user_id,
+                "first_check_in": check_in_time,
+                "last_check_in": check_in_time,
+                "last_check_in_date": day,
+                "total_visits": 1,
+                "current_streak": 1,
+                "longest_streak": 1,
+                "recent_dates": [day],
+            }},
+            upsert=True,
+        )
+        if created.upserted_id is not None:
+            return
+    except DuplicateKeyError:
+        # A concurrent first check-in created the summary (unique user_id index)
+        pass
+
+    summary = await collection.find_one({"user_id": user_id}, {"_id": 0, "last_check_in_date": 1})
+    if summary and summary.get("last_check_in_date") == day:
+        return  # today's visit is already counted
+    await rebuild_attendance_summaries(db, user_ids=[user_id])
+
+
+async def remove_summaries(db, user_ids: Iterable[str]) -> None:
+    ids = list(user_ids)
+    if ids:
+        await db[SUMMARY_COLLECTION].delete_many({"user_id": {"$in": ids}})
+
+
+def _streaks(days: List[date]) -> tuple:
+    """(current streak ending on the last day, longest streak) for sorted distinct days."""
+    longest = current = 0
+    previous = None
+    for day in days:
+        current = current + 1 if previous and (day - previous).days == 1 else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest
+
+
+def build_summary(user_id: str, check_in_times: List[str]) -> dict:
+    times = sorted(t for t in check_in_times if t)
+    days = sorted({d for d in (_to_date(t) for t in times) if d})
+    current, longest = _streaks(days)
+    return {
+        "user_id": user_id,
+        "first_check_in": times[0] if times else None,
+        "last_check_in": times[-1] if times else None,
+        "last_check_in_date": days[-1].isoformat() if days else None,
+        "total_visits": len(times),
+        "current_streak": current,
+        "longest_streak": longest,
+        "recent_dates": [d.isoformat() for d in days[-RECENT_DATES_KEPT:]],
+    }
+
+
+async def rebuild_attendance_summaries(db, user_ids: Optional[List[str]] = None, batch_size: int = 500) -> int:
+    """Recompute summaries from the attendance collection; returns members written."""
+    pipeline = []
+    if user_ids is not None:
+        pipeline.append({"$match": {"user_id": {"$in": list(user_ids)}}})
+    pipeline.append({"$group": {"_id": "$user_id", "times": {"$push": "$check_in_time"}}})
+
+    collection = db[SUMMARY_COLLECTION]
+    ops = []
+    written = 0
+    async for row in db.attendance.aggregate(pipeline, allowDiskUse=True):
+        if not row.get("_id"):
+            continue
+        ops.append(ReplaceOne({"user_id": row["_id"]}, build_summary(row["_id"], row["times"]), upsert=True))
+        if len(ops) >= batch_size:
+            await collection.bulk_write(ops, ordered=False)
+            written += len(ops)
+            ops = []
+    if ops:
+        await collection.bulk_write(ops, ordered=False)
+        written += len(ops)
+    return written
+
+
+async def ensure_attendance_summaries(db, lease_seconds: float = 3600) -> None:
+    """One-time backfill when summaries were never built for an existing database.
+
+    Every worker calls this at boot; a lease in ``maintenance_locks`` lets
+    exactly one of them rebuild, and is only marked done once the rebuild
+    finished, so a run cut short (shutdown, crash) starts over after the
+    lease expires. Check-ins recorded while the rebuild's snapshot was being
+    written are folded in by rebuilding those members once more at the end.
+    """
+    lease = await db[LOCKS_COLLECTION].find_one({"_id": BACKFILL_LEASE}, {"last_run": 1})
+    if lease and lease.get("last_run") == BACKFILL_DONE:
+        return
+    if lease is None:
+        if await db[SUMMARY_COLLECTION].estimated_document_count() > 0:
+            return
+        if await db.attendance.estimated_document_count() == 0:
+            return
+    if not await acquire_daily_lease(db, BACKFILL_LEASE, BACKFILL_DONE, lease_seconds):
+        return
+    latest = await db.attendance.find_one({}, {"_id": 0, "check_in_time": 1}, sort=[("check_in_time", -1)])
+    written = await rebuild_attendance_summaries(db)
+    if latest:
+        # The ReplaceOnes above come from one aggregate snapshot and may have
+        # overwritten record_check_in increments made meanwhile
+        recent = await db.attendance.distinct("user_id", {"check_in_time": {"$gte": latest["check_in_time"]}})
+        if recent:
+            await rebuild_attendance_summaries(db, user_ids=recent)
+    await release_daily_lease(db, BACKFILL_LEASE, BACKFILL_DONE, {"members": written})
+    logger.info(f"Backfilled attendance summaries for {written} members")
+
+
+def summary_view(summary: Optional[dict], today: date, window_days: int = 30) -> dict:
+    """Read-side view: streaks that ended before yesterday count as 0."""
+    if not summary:
+        return {"last_check_in": None, "total_visits": 0, "current_streak": 0, "longest_streak": 0, f"visits_last_{window_days}_days": 0}
+    last_day = _to_date(summary.get("last_check_in_date"))
+    streak = summary.get("current_streak", 0) if last_day and (today - last_day).days <= 1 else 0
+    window_start = (today - timedelta(days=window_days - 1)).isoformat()
+    return {
+        "last_check_in": summary.get("last_check_in"),
+        "total_visits": summary.get("total_visits", 0),
+        "current_streak": streak,
+        "longest_streak": summary.get("longest_streak", 0),
+        f"visits_last_{window_days}_days": sum(1 for d in summary.get("recent_dates") or [] if d >= window_start),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import os
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Maintain per-member attendance summaries")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every summary from the attendance collection")
+    parser.add_argument("--user", action="append", help="only rebuild these user ids (repeatable)")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.error("nothing to do; pass --rebuild")
+
+    load_dotenv(Path(__file__).parent / ".env")
+    mongo_client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+
+    async def _main():
+        count = await rebuild_attendance_summaries(mongo_client[os.environ["DB_NAME"]], user_ids=args.user)
+        print(f"Rebuilt attendance summaries for {count} members")
+
+    asyncio.run(_main())
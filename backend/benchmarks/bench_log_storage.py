@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Email log storage: inline ``body_html`` vs ``body_ref`` + compressed bodies.
+
+Builds the log documents a broadcast (personalized branded email) and a
+batch of identical notifications would write, encodes them with BSON and
+compares the bytes stored per message. Every compact log is expanded again
+and checked against the original HTML, so the benchmark doubles as a
+round-trip test of the preview.
+
+    cd backend && python benchmarks/bench_log_storage.py --recipients 2000
+"""
+import argparse
+import asyncio
+import sys
+import uuid
+from pathlib import Path
+
+import bson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from email_shell import email_shell, wrap_email  # noqa: E402
+from log_bodies import BodyStore, preview_text  # noqa: E402
+
+
+class ListWriter:
+    """Stands in for the BufferedWriter: keeps documents in memory."""
+
+    def __init__(self):
+        self.docs = []
+
+    def add(self, doc):
+        self.docs.append(doc)
+        return True
+
+
+class ListCollection:
+    def __init__(self, docs):
+        self.by_id = {doc["_id"]: doc for doc in docs}
+
+    def find(self, query):
+        ids = query["_id"]["$in"]
+        docs = [self.by_id[i] for i in ids if i in self.by_id]
+
+        class _Cursor:
+            async def to_list(self, length):
+                return docs
+        return _Cursor()
+
+
+def legacy_log(to_email, subject, html):
+    return {
+        "id": str(uuid.uuid4()),
+        "to_email": to_email,
+        "subject": subject,
+        "body_preview": (html.replace("\n", " ")[:300] + "...") if len(html) > 300 else html,
+        "body_html": html,
+        "otp_detected": None,
+        "status": "sent",
+        "error": None,
+        "timestamp": "2026-01-01T10:00:00+05:30",
+    }
+
+
+def compact_log(to_email, subject, html, store):
+    return {
+        "id": str(uuid.uuid4()),
+        "to_email": to_email,
+        "subject": subject,
+        "body_preview": preview_text(html),
+        "body_ref": store.email_ref(html),
+        "otp_detected": None,
+        "status": "sent",
+        "error": None,
+        "timestamp": "2026-01-01T10:00:00+05:30",
+    }
+
+
+def scenario(name, emails):
+    writer = ListWriter()
+    store = BodyStore(writer, None)
+    legacy = sum(len(bson.encode(legacy_log(to, subject, html))) for to, subject, html in emails)
+    logs = [compact_log(to, subject, html, store) for to, subject, html in emails]
+    compact = sum(len(bson.encode(log)) for log in logs) + sum(len(bson.encode(doc)) for doc in writer.docs)
+
+    store._collection_getter = lambda: ListCollection(writer.docs)
+    asyncio.run(store.expand(logs))
+    assert all(log["body_html"] == html for log, (_, _, html) in zip(logs, emails)), "preview round-trip mismatch"
+
+    n = len(emails)
+    print(f"{name:<28} {n} msgs: inline {legacy / n:8.0f} B/msg   compact {compact / n:7.0f} B/msg   "
+          f"({legacy / compact:4.1f}x smaller, {len(writer.docs)} body docs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=2000)
+    args = parser.parse_args()
+
+    prefix, suffix = email_shell("Monthly update")
+    broadcast = [
+        (f"member{i}@example.com", "Monthly update", "".join((
+            prefix,
+            f'<h2>Hello, Member {i}!</h2>\n      <div style="white-space: pre-wrap;">',
+            "New batch timings from next week.<br>Evening slots now open till 10 PM.<br>See you at the gym!",
+            "</div>",
+            suffix,
+        )))
+        for i in range(args.recipients)
+    ]
+    notice = wrap_email("<h2>Gym closed on Sunday</h2><p>The gym stays closed for maintenance this Sunday.</p>",
+                        "Holiday notice")
+    identical = [(f"member{i}@example.com", "Holiday notice", notice) for i in range(args.recipients)]
+
+    scenario("personalized broadcast", broadcast)
+    scenario("identical notification", identical)
+
+
+if __name__ == "__main__":
+    main()
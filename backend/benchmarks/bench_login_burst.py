@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""p99 latency of an unrelated endpoint while a burst of logins is running.
+
+Builds a tiny in-process FastAPI app with a bcrypt-backed ``/login`` and a
+trivial ``/ping`` (standing in for the attendance kiosk), then compares
+inline bcrypt against ``PasswordService``:
+
+    cd backend && python benchmarks/bench_login_burst.py --logins 40 --pings 200
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import bcrypt
+import httpx
+from fastapi import FastAPI
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from password_service import PasswordService  # noqa: E402
+
+
+def build_app(mode: str, service: PasswordService, stored_hash: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login():
+        if mode == "inline":
+            ok = bcrypt.checkpw(b"secret123", stored_hash.encode())
+        else:
+            ok = await service.verify("secret123", stored_hash)
+        return {"ok": ok}
+
+    @app.get("/ping")
+    async def ping():
+        return {"status": "ok"}
+
+    return app
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run(mode: str, logins: int, pings: int, workers: int, rounds: int) -> dict:
+    service = PasswordService(max_workers=workers, rounds=rounds)
+    stored_hash = service.hash_sync("secret123")
+    app = build_app(mode, service, stored_hash)
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def login_burst():
+            await asyncio.gather(*(client.post("/login") for _ in range(logins)))
+
+        async def ping_loop():
+            # Fixed-rate schedule: latency is measured from when the ping was due,
+            # so time spent waiting on a blocked loop is counted.
+            interval = 0.005
+            first = time.perf_counter()
+            for i in range(pings):
+                due = first + i * interval
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await client.get("/ping")
+                latencies.append((time.perf_counter() - due) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(login_burst(), ping_loop())
+        elapsed = time.perf_counter() - started
+
+    service.shutdown()
+    return {
+        "mode": mode,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies),
+        "wall_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--pings", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+
+    for mode in ("inline", "executor"):
+        result = asyncio.run(run(mode, args.logins, args.pings, args.workers, args.rounds))
+        print(f"{result['mode']:>9}: ping p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms "
+              f"max={result['max_ms']:.1f}ms wall={result['wall_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
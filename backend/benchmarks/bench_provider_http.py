@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""WhatsApp-provider sends per second: a fresh httpx client per message vs ProviderHTTP.
+
+Starts a local HTTPS stub that answers every request with a Fast2SMS-style
+``{"return": true}`` and counts TCP connections, then pushes the same number
+of messages through both paths with a fixed number of concurrent senders
+(roughly what the outbox workers do during a broadcast):
+
+    cd backend && python benchmarks/bench_provider_http.py --messages 2000 --concurrency 8
+
+``--latency-ms`` adds a per-request delay at the stub to mimic provider
+processing time. The stub only speaks HTTP/1.1, so this measures connection
+reuse (TCP + TLS + SSL context setup), not HTTP/2 multiplexing.
+"""
+import argparse
+import asyncio
+import datetime
+import ssl
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from http_clients import ProviderHTTP  # noqa: E402
+
+RESPONSE_BODY = b'{"return":true,"request_id":"bench"}'
+
+
+def make_certificate(directory: Path):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = directory / "cert.pem", directory / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    return cert_path, key_path
+
+
+class StubProvider:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                self.requests += 1
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(RESPONSE_BODY)).encode() + b"\r\n\r\n" + RESPONSE_BODY
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+
+async def send_fresh(url: str, ca: str, payload: dict):
+    async with httpx.AsyncClient(timeout=30, verify=ca) as client:
+        return await client.post(url, json=payload)
+
+
+async def run(label, send, messages, concurrency, stub):
+    stub.connections = 0
+    queue = asyncio.Queue()
+    for i in range(messages):
+        queue.put_nowait(i)
+
+    async def sender():
+        while not queue.empty():
+            i = queue.get_nowait()
+            response = await send({"numbers": f"9199990{i:05d}", "message": f"Hello member {i}"})
+            assert response.status_code == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:>8}: {messages / elapsed:8.1f} msg/s  ({elapsed:6.2f}s, {stub.connections} TCP+TLS connections)")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path, key_path = make_certificate(Path(tmp))
+        server_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_ctx.load_cert_chain(cert_path, key_path)
+        stub = StubProvider(args.latency_ms / 1000.0)
+        server = await asyncio.start_server(stub.handle, "127.0.0.1", 0, ssl=server_ctx)
+        port = server.sockets[0].getsockname()[1]
+        url = f"https://localhost:{port}/dev/whatsapp"
+
+        await run("fresh", lambda p: send_fresh(url, str(cert_path), p), args.messages, args.concurrency, stub)
+
+        pool = ProviderHTTP(max_connections=args.concurrency, max_keepalive=args.concurrency, verify=str(cert_path))
+        client = pool.get("fast2sms")
+        await run("pooled", lambda p: client.post(url, json=p), args.messages, args.concurrency, stub)
+        await pool.aclose()
+
+        server.close()
+        await server.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Per-recipient rendering cost: chained str.replace vs the single-pass renderer.
+
+Models a broadcast: a several-KB HTML email plus a WhatsApp message rendered
+for every recipient with a ~10 key variable map. Three paths are timed:
+
+* legacy      - one ``str.replace`` over the whole template per variable
+* cached      - ``render_template`` (compile looked up in the LRU cache)
+* precompiled - ``compile_template`` once, ``render_compiled`` per recipient
+
+Outputs are compared first, so the benchmark doubles as an equivalence check.
+
+    cd backend && python benchmarks/bench_replace_template_vars.py --recipients 5000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from notification_templates import (  # noqa: E402
+    DEFAULT_TEMPLATES, compile_template, render_compiled, render_template,
+)
+
+HTML_SHELL = """<!DOCTYPE html><html><head><meta charset="UTF-8"><style>{css}</style></head>
+<body><div class="wrapper"><div class="container"><div class="header">F3 Fitness</div>
+<div class="content"><h2>Hello, {{{{name}}}}!</h2>{body}</div>
+<div class="footer">{footer}</div></div></div></body></html>"""
+
+
+def build_templates():
+    css = ".block { margin:0; padding:12px; color:#374151; font-family: Arial, sans-serif; }\n" * 40
+    footer = "<p>F3 Fitness Health Club, Vidyadhar Nagar, Jaipur. Unknown stays: {{unsubscribe}}</p>" * 4
+    email = HTML_SHELL.format(css=css, body=DEFAULT_TEMPLATES[("renewal_reminder", "email")]["content"], footer=footer)
+    whatsapp = DEFAULT_TEMPLATES[("renewal_reminder", "whatsapp")]["content"] + "\nPlan: {{plan_name}} ({{start_date}} - {{end_date}})"
+    return email, whatsapp
+
+
+def variables_for(i: int) -> dict:
+    return {
+        "name": f"Member {i}", "member_id": f"F3-{i:05d}", "email": f"member{i}@example.com",
+        "plan_name": "Quarterly", "start_date": "01 Jan 2026", "end_date": "31 Mar 2026",
+        "expiry_date": "31 Mar 2026", "days_left": str(i % 30), "days": str(i % 30), "amount": 4500,
+    }
+
+
+def legacy_replace(template: str, variables: dict) -> str:
+    for key, value in variables.items():
+        template = template.replace(f"{{{{{key}}}}}", str(value))
+    return template
+
+
+def run(label, render, templates, recipients):
+    start = time.perf_counter()
+    for i in range(recipients):
+        variables = variables_for(i)
+        for template in templates:
+            render(template, variables)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>12}: {elapsed * 1000:8.1f}ms total, {elapsed / recipients * 1e6:7.1f}us/recipient")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipients", type=int, default=5000)
+    args = parser.parse_args()
+
+    email, whatsapp = build_templates()
+    compiled = {email: compile_template(email), whatsapp: compile_template(whatsapp)}
+    for i in range(50):
+        for template in (email, whatsapp):
+            expected = legacy_replace(template, variables_for(i))
+            assert render_template(template, variables_for(i)) == expected
+            assert render_compiled(compiled[template], variables_for(i)) == expected
+    print(f"email template {len(email)} chars, {len(compiled[email][1])} placeholders; "
+          f"{len(variables_for(0))} variables; outputs identical")
+
+    run("legacy", legacy_replace, (email, whatsapp), args.recipients)
+    run("cached", render_template, (email, whatsapp), args.recipients)
+    run("precompiled", lambda t, v: render_compiled(compiled[t], v), (email, whatsapp), args.recipients)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Broadcast email throughput: aiosmtplib.send per message vs SMTPPool.
+
+Sends the same messages to the local aiosmtpd stand-in (tests/smtp_stub.py)
+with a fixed number of concurrent senders, as the outbox email workers do,
+and reports messages/second plus SMTP sessions and logins the server saw:
+
+    cd backend && python benchmarks/bench_smtp_pool.py --messages 3000 --concurrency 4
+
+The stand-in has no TLS, so real-world savings are larger: every avoided
+session also avoids a STARTTLS/SSL handshake.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from email.mime.text import MIMEText
+from pathlib import Path
+
+import aiosmtplib
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(BACKEND / "tests"))
+from smtp_pool import SMTPPool, connection_options  # noqa: E402
+from smtp_stub import LocalSMTPServer  # noqa: E402
+
+
+def make_message(i):
+    message = MIMEText(f"<p>Hello member {i}, your plan renews soon.</p>" * 20, "html")
+    message["From"] = "F3 FITNESS HEALTH CLUB <stub@f3fitness.local>"
+    message["To"] = f"member{i}@example.com"
+    message["Subject"] = "Renewal reminder"
+    return message
+
+
+async def run(label, send, messages, concurrency, server):
+    server.sessions = server.logins = 0
+    server.messages.clear()
+    queue = asyncio.Queue()
+    for i in range(messages):
+        queue.put_nowait(i)
+
+    async def sender():
+        while not queue.empty():
+            await send(make_message(queue.get_nowait()))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    assert len(server.messages) == messages
+    print(f"{label:>8}: {messages / elapsed:8.1f} msg/s  ({elapsed:6.2f}s, "
+          f"{server.sessions} SMTP sessions, {server.logins} logins)")
+
+
+async def main(args):
+    with LocalSMTPServer(latency=args.latency_ms / 1000.0) as server:
+        settings = server.settings()
+        options = connection_options(settings)
+        await run("per-send", lambda m: aiosmtplib.send(m, **options), args.messages, args.concurrency, server)
+
+        pool = SMTPPool(max_size=args.concurrency)
+        await run("pooled", lambda m: pool.send(settings, m), args.messages, args.concurrency, server)
+        await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Render 10k notifications: per-call get_template vs the compiled registry.
+
+The legacy path is reproduced as it was in server.py: one templates lookup
+per channel, the defaults dict rebuilt on every call, then one str.replace
+per variable. The database is an in-memory fake that only counts queries,
+so the timings are CPU-only; the query counts show the round trips saved.
+
+    cd backend && python benchmarks/bench_template_render.py --notifications 10000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from notification_templates import DEFAULT_TEMPLATES, TemplateRegistry  # noqa: E402
+
+TEMPLATE_TYPES = ["attendance", "payment_received", "renewal_reminder", "birthday", "membership_activated"]
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    async def to_list(self, length=None):
+        return list(self._docs)
+
+
+class FakeTemplates:
+    def __init__(self):
+        self.queries = 0
+
+    async def find_one(self, query, projection=None):
+        self.queries += 1
+        return None
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        return _Cursor([])
+
+
+class FakeDB:
+    def __init__(self):
+        self.templates = FakeTemplates()
+
+
+def legacy_replace(template: str, variables: dict) -> str:
+    for key, value in variables.items():
+        template = template.replace(f"{{{{{key}}}}}", str(value))
+    return template
+
+
+async def legacy_get_template(db, template_type, channel):
+    template = await db.templates.find_one({"template_type": template_type, "channel": channel}, {"_id": 0})
+    if template:
+        return template
+    defaults = {key: dict(value) for key, value in DEFAULT_TEMPLATES.items()}
+    return defaults.get((template_type, channel), {"subject": "", "content": ""})
+
+
+def variables_for(i: int) -> dict:
+    return {
+        "name": f"Member {i}", "member_id": f"F3-{i:05d}", "receipt_no": f"R-{i}", "amount": 1500,
+        "payment_mode": "upi", "payment_date": "01 Jan 2026", "description": "Monthly plan",
+        "expiry_date": "10 Jan 2026", "days_left": 10, "plan_name": "Monthly",
+        "start_date": "01 Jan 2026", "end_date": "31 Jan 2026",
+    }
+
+
+async def run_legacy(n: int):
+    db = FakeDB()
+    start = time.perf_counter()
+    for i in range(n):
+        template_type = TEMPLATE_TYPES[i % len(TEMPLATE_TYPES)]
+        variables = variables_for(i)
+        email = await legacy_get_template(db, template_type, "email")
+        whatsapp = await legacy_get_template(db, template_type, "whatsapp")
+        legacy_replace(email.get("subject", ""), variables)
+        legacy_replace(email.get("content", ""), variables)
+        legacy_replace(whatsapp.get("content", ""), variables)
+    return time.perf_counter() - start, db.templates.queries
+
+
+async def run_registry(n: int):
+    db = FakeDB()
+    registry = TemplateRegistry(ttl=300)
+    start = time.perf_counter()
+    for i in range(n):
+        template_type = TEMPLATE_TYPES[i % len(TEMPLATE_TYPES)]
+        variables = variables_for(i)
+        email = await registry.get(db, template_type, "email")
+        whatsapp = await registry.get(db, template_type, "whatsapp")
+        email.render_subject(variables)
+        email.render_content(variables)
+        whatsapp.render_content(variables)
+    return time.perf_counter() - start, db.templates.queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notifications", type=int, default=10000)
+    args = parser.parse_args()
+
+    for label, runner in (("legacy", run_legacy), ("registry", run_registry)):
+        elapsed, queries = asyncio.run(runner(args.notifications))
+        print(f"{label:>8}: {elapsed * 1000:8.1f}ms total, {elapsed / args.notifications * 1e6:6.1f}us/notification, "
+              f"{queries} template queries")
+
+
+if __name__ == "__main__":
+    main()
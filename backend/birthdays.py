@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Indexed birthday lookups.
+
+``date_of_birth`` is a free-form "YYYY-MM-DD" string, so finding today's or
+this week's birthdays used to mean a regex or a Python scan over every
+member. Users now also carry two derived, indexed keys:
+
+* ``dob_md``  - "MM-DD"
+* ``dob_doy`` - day of year in a leap reference year (Jan 1 = 1, Feb 29 = 60,
+  Dec 31 = 366), so the value never shifts between leap and common years
+
+``dob_keys`` computes them for create/update paths; existing users are
+backfilled with:
+
+    python birthdays.py --backfill
+"""
+import calendar
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+REFERENCE_LEAP_YEAR = 2000
+DAYS_IN_REFERENCE_YEAR = 366
+
+
+def _parse_dob(value) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _reference_doy(month: int, day: int) -> int:
+    return date(REFERENCE_LEAP_YEAR, month, day).timetuple().tm_yday
+
+
+def dob_keys(date_of_birth) -> dict:
+    """Derived fields to store alongside ``date_of_birth`` (None when unparseable)."""
+    dob = _parse_dob(date_of_birth)
+    if not dob:
+        return {"dob_md": None, "dob_doy": None}
+    return {"dob_md": dob.strftime("%m-%d"), "dob_doy": _reference_doy(dob.month, dob.day)}
+
+
+def doy_ranges(start: date, days: int) -> List[Tuple[int, int]]:
+    """Inclusive reference day-of-year ranges covering ``start`` .. ``start + days``.
+
+    Splits in two when the window wraps past Dec 31, and adds Feb 29 (60)
+    when the window reaches Mar 1 of a common year, where those birthdays
+    are celebrated.
+    """
+    days = max(0, min(int(days), DAYS_IN_REFERENCE_YEAR - 1))
+    first = _reference_doy(start.month, start.day)
+    end = start + timedelta(days=days)
+    last = _reference_doy(end.month, end.day)
+    if end.year == start.year:
+        ranges = [(first, last)]
+    else:
+        ranges = [(first, DAYS_IN_REFERENCE_YEAR), (1, last)]
+    leap_day = _reference_doy(2, 29)
+    if not any(lo <= leap_day <= hi for lo, hi in ranges) and any(
+        not calendar.isleap(year) and start <= date(year, 3, 1) <= end for year in range(start.year, end.year + 1)
+    ):
+        ranges.append((leap_day, leap_day))
+    return ranges
+
+
+def _offsets(start: date, days: int) -> Dict[str, int]:
+    """"MM-DD" -> days from ``start`` for each calendar day in the window."""
+    offsets = {}
+    for offset in range(days + 1):
+        current = start + timedelta(days=offset)
+        offsets.setdefault(current.strftime("%m-%d"), offset)
+        # Feb 29 birthdays are celebrated on Mar 1 in common years
+        if current.month == 3 and current.day == 1 and "02-29" not in offsets:
+            offsets["02-29"] = offset
+    return offsets
+
+
+async def find_birthdays(db, start: date, days: int = 0, projection: Optional[dict] = None,
+                         extra_filter: Optional[dict] = None, limit: int = 10000) -> List[dict]:
+    """Users whose birthday falls within ``days`` days from ``start`` (inclusive).
+
+    An indexed range read on ``dob_doy``; each row gets ``days_until`` and the
+    result is ordered by it.
+    """
+    ranges = doy_ranges(start, days)
+    doy_filter = {"$or": [{"dob_doy": {"$gte": lo, "$lte": hi}} for lo, hi in ranges]} if len(ranges) > 1 \
+        else {"dob_doy": {"$gte": ranges[0][0], "$lte": ranges[0][1]}}
+    query = {**(extra_filter or {}), **doy_filter}
+    fields = {"_id": 0, **projection, "dob_md": 1} if projection else {"_id": 0}
+    users = await db.users.find(query, fields).to_list(limit)
+
+    offsets = _offsets(start, days)
+    result = []
+    for user in users:
+        offset = offsets.get(user.get("dob_md"))
+        if offset is None:
+            continue  # Feb 29 at the edge of the window in a leap year, etc.
+        user["days_until"] = offset
+        result.append(user)
+    result.sort(key=lambda u: (u["days_until"], u.get("name") or ""))
+    return result
+
+
+async def backfill_dob_keys(db, batch_size: int = 500) -> int:
+    """Compute dob_md/dob_doy for users that have a date_of_birth but no keys yet."""
+    cursor = db.users.find(
+        {"date_of_birth": {"$nin": [None, ""]}, "dob_md": {"$exists": False}},
+        {"_id": 0, "id": 1, "date_of_birth": 1}
+    )
+    ops = []
+    updated = 0
+    async for user in cursor:
+        ops.append(UpdateOne({"id": user["id"]}, {"$set": dob_keys(user.get("date_of_birth"))}))
+        if len(ops) >= batch_size:
+            await db.users.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await db.users.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import os
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Maintain derived birthday keys on users")
+    parser.add_argument("--backfill", action="store_true", help="compute dob_md/dob_doy for users missing them")
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.error("nothing to do; pass --backfill")
+
+    load_dotenv(Path(__file__).parent / ".env")
+    mongo_client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+
+    async def _main():
+        count = await backfill_dob_keys(mongo_client[os.environ["DB_NAME"]])
+        print(f"Backfilled birthday keys for {count} users")
+
+    asyncio.run(_main())
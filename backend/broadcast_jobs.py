@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Persisted, rate-limited broadcast jobs.
+
+A broadcast used to send every message inside the admin's request. Now the
+request expands the audience into per-recipient outbox jobs (see outbox.py)
+that share a ``batch_id`` and ``PRIORITY_BULK``, stores one ``broadcast_jobs``
+document, and returns its id straight away::
+
+    {id, channel, provider, subject, message, target_audience, total, skipped,
+     status, created_by, created_at, started_at, resumed_at, paused_at,
+     completed_at, active_seconds, final_counts}
+
+Pacing comes from the outbox's per-provider token buckets and concurrency
+limits. Progress is read from the outbox on demand (sent / failed /
+remaining / cancelled per batch), so there is no counter to keep in sync;
+``completed`` is recorded the first time a read finds nothing remaining.
+Once a completed or cancelled broadcast has nothing left in flight its
+counts are frozen into ``final_counts``, since retention deletes finished
+outbox jobs.
+
+``status`` is queuing, running, paused, cancelled or completed. The document
+is stored as ``queuing`` and only becomes ``running`` once every job is in
+the outbox, so a progress read in between cannot see an empty batch and
+mark it completed. Pausing holds the batch's unsent jobs, resuming releases
+them, cancelling drops them; a send already in flight still finishes.
+"""
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from outbox import Outbox, PRIORITY_BULK
+
+BROADCAST_COLLECTION = "broadcast_jobs"
+BROADCAST_STATUSES = ("queuing", "running", "paused", "cancelled", "completed")
+
+
+def _elapsed(doc: dict, now: datetime) -> float:
+    """Seconds the broadcast has spent running (paused time excluded)."""
+    elapsed = float(doc.get("active_seconds") or 0)
+    if doc.get("status") == "running" and doc.get("resumed_at"):
+        elapsed += max(0.0, (now - datetime.fromisoformat(doc["resumed_at"])).total_seconds())
+    return elapsed
+
+
+class BroadcastJobs:
+    def __init__(self, collection_getter: Callable[[], Any], outbox: Outbox, now: Callable[[], datetime]):
+        self._collection_getter = collection_getter
+        self.outbox = outbox
+        self.now = now
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    async def create(self, channel: str, provider: str, jobs: List[dict], created_by: str, message: str,
+                     target_audience: str, skipped: int = 0, subject: Optional[str] = None) -> dict:
+        """Store the broadcast and enqueue its per-recipient ``jobs`` as one batch."""
+        job_id = str(uuid.uuid4())
+        now = self.now().isoformat()
+        doc = {
+            "id": job_id,
+            "channel": channel,
+            "provider": provider,
+            "subject": subject,
+            "message": message,
+            "target_audience": target_audience,
+            "total": len(jobs),
+            "skipped": skipped,
+            "status": "queuing" if jobs else "completed",
+            "created_by": created_by,
+            "created_at": now,
+            "started_at": now,
+            "resumed_at": now,
+            "active_seconds": 0.0,
+            "paused_at": None,
+            "completed_at": None if jobs else now,
+        }
+        await self.collection.insert_one(doc)
+        doc.pop("_id", None)
+        if not jobs:
+            return doc
+        for job in jobs:
+            job["batch_id"] = job_id
+            job["priority"] = PRIORITY_BULK
+        try:
+            await self.outbox.enqueue_many(jobs)
+        except Exception:
+            # Whatever made it into the outbox must not go out under a broadcast nobody can see running
+            await self.outbox.cancel_batch(job_id)
+            await self.collection.update_one({"id": job_id}, {"$set": {
+                "status": "cancelled", "completed_at": self.now().isoformat(),
+            }})
+            raise
+        fields = {"status": "running", "resumed_at": self.now().isoformat()}
+        await self.collection.update_one({"id": job_id, "status": "queuing"}, {"$set": fields})
+        doc.update(fields)
+        return doc
+
+    def _rate(self, provider: str) -> Optional[float]:
+        rate = self.outbox.provider_rates.get(provider)
+        return rate[0] if rate else None
+
+    async def _with_progress(self, docs: List[dict]) -> List[dict]:
+        live = [doc["id"] for doc in docs if doc.get("final_counts") is None]
+        counts = await self.outbox.batch_counts(live) if live else {}
+        now = self.now()
+        for doc in docs:
+            by_status = doc.get("final_counts") or counts.get(doc["id"], {})
+            sent = by_status.get("sent", 0)
+            failed = by_status.get("dead", 0)
+            remaining = sum(by_status.get(s, 0) for s in ("pending", "processing", "held"))
+            elapsed = _elapsed(doc, now)
+            done = sent + failed
+            # Observed throughput once a few sends are in, else the configured bucket rate
+            rate = done / elapsed if done >= 5 and elapsed > 0 else self._rate(doc.get("provider"))
+            if doc["status"] == "running" and remaining == 0:
+                await self._finish(doc, now, by_status)
+            elif doc["status"] == "cancelled" and remaining == 0 and doc.get("final_counts") is None:
+                await self._freeze_counts(doc, by_status)
+            doc["progress"] = {
+                "sent": sent,
+                "failed": failed,
+                "remaining": remaining,
+                "cancelled": by_status.get("cancelled", 0),
+                "percent": round(100 * done / doc["total"], 1) if doc.get("total") else 100.0,
+                "rate_per_second": round(rate, 3) if rate else None,
+                "eta_seconds": round(remaining / rate) if rate and remaining and doc["status"] == "running" else None,
+            }
+        return docs
+
+    async def _finish(self, doc: dict, now: datetime, by_status: Dict[str, int]) -> None:
+        fields = {
+            "status": "completed",
+            "completed_at": now.isoformat(),
+            "active_seconds": _elapsed(doc, now),
+            "final_counts": dict(by_status),
+        }
+        await self.collection.update_one({"id": doc["id"], "status": "running"}, {"$set": fields})
+        doc.update(fields)
+
+    async def _freeze_counts(self, doc: dict, by_status: Dict[str, int]) -> None:
+        await self.collection.update_one(
+            {"id": doc["id"], "status": doc["status"]}, {"$set": {"final_counts": dict(by_status)}}
+        )
+        doc["final_counts"] = dict(by_status)
+
+    async def get(self, job_id: str) -> dict:
+        doc = await self.collection.find_one({"id": job_id}, {"_id": 0})
+        if not doc:
+            raise HTTPException(status_code=404, detail="Broadcast job not found")
+        return (await self._with_progress([doc]))[0]
+
+    async def recent(self, limit: int = 20, status: Optional[str] = None) -> List[dict]:
+        query = {"status": status} if status else {}
+        docs = await self.collection.find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
+        return await self._with_progress(docs)
+
+    async def _transition(self, job_id: str, from_status: str, fields: Dict[str, Any]) -> dict:
+        result = await self.collection.update_one({"id": job_id, "status": from_status}, {"$set": fields})
+        if not result.matched_count:
+            current = await self.collection.find_one({"id": job_id}, {"_id": 0, "status": 1})
+            if not current:
+                raise HTTPException(status_code=404, detail="Broadcast job not found")
+            raise HTTPException(status_code=400, detail=f"Broadcast job is {current['status']}")
+        return fields
+
+    async def pause(self, job_id: str) -> dict:
+        doc = await self.collection.find_one({"id": job_id}, {"_id": 0})
+        now = self.now()
+        await self._transition(job_id, "running", {
+            "status": "paused",
+            "paused_at": now.isoformat(),
+            "active_seconds": _elapsed(doc, now) if doc else 0.0,
+        })
+        await self.outbox.hold_batch(job_id)
+        return await self.get(job_id)
+
+    async def resume(self, job_id: str) -> dict:
+        await self._transition(job_id, "paused", {"status": "running", "resumed_at": self.now().isoformat()})
+        await self.outbox.release_batch(job_id)
+        return await self.get(job_id)
+
+    async def cancel(self, job_id: str) -> dict:
+        doc = await self.collection.find_one({"id": job_id}, {"_id": 0})
+        if not doc:
+            raise HTTPException(status_code=404, detail="Broadcast job not found")
+        if doc["status"] not in ("running", "paused"):
+            raise HTTPException(status_code=400, detail=f"Broadcast job is {doc['status']}")
+        now = self.now()
+        await self._transition(job_id, doc["status"], {
+            "status": "cancelled",
+            "completed_at": now.isoformat(),
+            "active_seconds": _elapsed(doc, now),
+        })
+        await self.outbox.cancel_batch(job_id)
+        return await self.get(job_id)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Write-behind batching for append-only collections (audit/activity logs).
+
+Callers ``add()`` documents without awaiting the database; a background task
+flushes them with ``insert_many`` when ``max_batch`` documents are waiting or
+every ``flush_interval`` seconds, whichever comes first. ``stop()`` drains
+whatever is left, so wire ``start``/``stop`` into the app lifespan.
+
+Memory is bounded by ``max_queue``. When the buffer is full the overflow
+policy decides what is lost: ``drop_oldest`` (default) keeps the most recent
+entries, ``drop_newest`` rejects the incoming one. Every loss is counted.
+
+A failed flush is retried, but only for what was not written. pymongo sets
+``_id`` on every document before sending, so anything a failed
+``insert_many`` did store comes back as a duplicate key on the retry, which
+is counted as ``duplicates`` rather than a failure (documents that carry
+their own ``_id``, e.g. content-addressed bodies, hit the same path). Other
+per-document write errors (validation, size) would fail identically every
+time; those documents are counted as ``rejected`` and dropped, so one bad
+entry cannot stall the buffer.
+
+``on_flush`` (optional) is awaited with each batch once it is stored, so read
+models such as log_stats.py can be kept current at write time.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+
+class BufferedWriter:
+    def __init__(self, collection_getter: Callable[[], Any], name: str = "buffered_writer",
+                 max_batch: int = 200, flush_interval: float = 1.0, max_queue: int = 10000,
+                 overflow: str = "drop_oldest", on_flush: Optional[Callable[[List[dict]], Awaitable[Any]]] = None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        # Resolved lazily so tests/scripts can swap the database after import
+        self._collection_getter = collection_getter
+        self.name = name
+        self.max_batch = max(1, int(max_batch))
+        self.flush_interval = float(flush_interval)
+        self.max_queue = max(self.max_batch, int(max_queue))
+        self.overflow = overflow
+        self.on_flush = on_flush
+        self._buffer: deque = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+        self.counters: Dict[str, int] = {
+            "enqueued": 0, "flushed": 0, "dropped": 0, "failed_batches": 0, "flushes": 0, "duplicates": 0,
+            "rejected": 0,
+        }
+
+    # ---- producer side ----
+
+    def add(self, document: dict) -> bool:
+        """Queue a document; returns False if it was rejected by the overflow policy."""
+        if len(self._buffer) >= self.max_queue:
+            if self.overflow == "drop_newest":
+                self.counters["dropped"] += 1
+                return False
+            self._buffer.popleft()
+            self.counters["dropped"] += 1
+        self._buffer.append(document)
+        self.counters["enqueued"] += 1
+        self._ensure_running()
+        if len(self._buffer) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    # ---- lifecycle ----
+
+    def start(self) -> None:
+        self._stopping = False
+        self._ensure_running()
+
+    async def stop(self) -> None:
+        """Stop the flusher and write out everything still buffered."""
+        self._stopping = True
+        if self._task is not None:
+            if self._wakeup is not None:
+                self._wakeup.set()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def _ensure_running(self) -> None:
+        if self._stopping or (self._task is not None and not self._task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (import time / sync script); flushed on next start or stop
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:  # never let the flusher die
+                logger.error(f"{self.name}: flush loop error: {e}")
+
+    # ---- flushing ----
+
+    async def flush(self) -> int:
+        """Write all buffered documents in ``max_batch`` chunks; returns docs written."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        written = 0
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.max_batch, len(self._buffer)))]
+                try:
+                    await self._collection_getter().insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    errors = e.details.get("writeErrors", [])
+                    if not errors:
+                        # e.g. a write concern error: retry all, stored ones come back as duplicates
+                        self._requeue(batch, e)
+                        break
+                    # Unordered insert: everything without a write error was stored
+                    failed = {err.get("index") for err in errors}
+                    duplicates = sum(1 for err in errors if err.get("code") == 11000)
+                    rejected = len(errors) - duplicates
+                    if rejected:
+                        logger.error(f"{self.name}: dropped {rejected} documents rejected by insert_many: "
+                                     f"{next(err.get('errmsg') for err in errors if err.get('code') != 11000)}")
+                    stored = [doc for i, doc in enumerate(batch) if i not in failed]
+                    self.counters["duplicates"] += duplicates
+                    self.counters["rejected"] += rejected
+                    self.counters["flushed"] += len(stored)
+                    self.counters["flushes"] += 1
+                    written += len(stored)
+                    await self._notify(stored)
+                    continue
+                except Exception as e:
+                    self._requeue(batch, e)
+                    break
+                self.counters["flushed"] += len(batch)
+                self.counters["flushes"] += 1
+                written += len(batch)
+                await self._notify(batch)
+        return written
+
+    async def _notify(self, batch: list) -> None:
+        if self.on_flush is None or not batch:
+            return
+        try:
+            await self.on_flush(batch)
+        except Exception as e:  # the documents are stored; a listener must not requeue them
+            logger.error(f"{self.name}: on_flush failed: {e}")
+
+    def _requeue(self, batch: list, error: Exception) -> None:
+        self.counters["failed_batches"] += 1
+        logger.error(f"{self.name}: insert_many of {len(batch)} documents failed: {error}")
+        # Put the batch back (bounded by max_queue) and retry next tick
+        room = self.max_queue - len(self._buffer)
+        keep = batch[:max(0, room)]
+        self.counters["dropped"] += len(batch) - len(keep)
+        self._buffer.extendleft(reversed(keep))
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "buffered": len(self._buffer),
+            "max_queue": self.max_queue,
+            "overflow": self.overflow,
+            "running": self._task is not None and not self._task.done(),
+            **self.counters,
+        }
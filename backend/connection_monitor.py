@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Background connection-state monitor for a provider session.
+
+The Evolution WhatsApp instance can drop out of the ``open`` state (phone
+offline, session logged out). Until now that was only noticed when a send
+timed out, and the settings page asked the Evolution API on every poll.
+
+``ConnectionMonitor`` runs ``probe`` from the app lifespan every
+``interval`` seconds and keeps the latest result in memory:
+
+* ``probe`` returns a state dict with at least ``connected`` (and
+  ``state`` / ``instance_name``), or None when the provider is not in use;
+  the monitor is then inactive and never blocks anything
+* a probe that raises backs off exponentially up to ``max_interval``
+* ``known_disconnected()`` is true only while the last successful probe said
+  "not connected" and is younger than ``stale_after``; unknown means "try"
+* ``on_change(blocked)`` fires when that answer flips, so callers can pause
+  and resume queued work
+* ``wake()`` re-probes now (after a connect/restart, or a send that saw the
+  connection close)
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionMonitor:
+    def __init__(self, probe: Callable[[], Awaitable[Optional[dict]]], name: str = "connection",
+                 interval: float = 30.0, max_interval: float = 300.0, timeout: float = 20.0,
+                 stale_after: Optional[float] = None, on_change: Optional[Callable[[bool], None]] = None):
+        self._probe = probe
+        self.name = name
+        self.interval = max(1.0, float(interval))
+        self.max_interval = max(self.interval, float(max_interval))
+        self.timeout = float(timeout)
+        self.stale_after = float(stale_after) if stale_after else 2 * self.max_interval
+        self._on_change = on_change
+        self.active = False
+        self.state: Optional[dict] = None
+        self.checked_at: Optional[str] = None
+        self._checked_monotonic: Optional[float] = None
+        self.error: Optional[str] = None
+        self.failures = 0
+        self.checks = 0
+        self._blocked = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    # ---- state ----
+
+    def record(self, state: Optional[dict]) -> None:
+        """Store a probe result (also used when a caller probed on its own)."""
+        previous = self.state.get("connected") if self.state else None
+        self.active = state is not None
+        self.state = state
+        self.checked_at = datetime.now(timezone.utc).isoformat()
+        self._checked_monotonic = time.monotonic()
+        if state is not None and previous is not None and state.get("connected") != previous:
+            logger.warning(f"{self.name}: state changed to {state.get('state')}")
+        self._publish()
+
+    def latest(self, instance_name: Optional[str] = None) -> Optional[dict]:
+        """The last probed state, unless inactive, stale or for another instance."""
+        if not self.active or not self.state or self._checked_monotonic is None:
+            return None
+        if time.monotonic() - self._checked_monotonic > self.stale_after:
+            return None
+        if instance_name is not None and self.state.get("instance_name") != instance_name:
+            return None
+        return self.state
+
+    def known_disconnected(self, instance_name: Optional[str] = None) -> bool:
+        state = self.latest(instance_name)
+        return state is not None and not state.get("connected")
+
+    def _publish(self) -> None:
+        blocked = self.known_disconnected()
+        if blocked != self._blocked:
+            self._blocked = blocked
+            if self._on_change is not None:
+                try:
+                    self._on_change(blocked)
+                except Exception as e:
+                    logger.error(f"{self.name}: on_change failed: {e}")
+
+    async def check(self) -> float:
+        """Probe once; returns the delay before the next probe."""
+        self.checks += 1
+        try:
+            state = await asyncio.wait_for(self._probe(), timeout=self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            self.error = getattr(e, "detail", None) or str(e) or e.__class__.__name__
+            self._publish()  # an old "disconnected" may have gone stale
+            return min(self.max_interval, self.interval * (2 ** self.failures))
+        self.failures = 0
+        self.error = None
+        self.record(state)
+        return self.interval
+
+    # ---- lifecycle ----
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def _loop(self) -> None:
+        while not self._stopping:
+            delay = await self.check()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        age = time.monotonic() - self._checked_monotonic if self._checked_monotonic is not None else None
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "active": self.active,
+            "checked_at": self.checked_at,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "known_disconnected": self.known_disconnected(),
+            "error": self.error,
+            "failures": self.failures,
+            "checks": self.checks,
+        }
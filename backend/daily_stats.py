@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""``daily_stats`` read model behind the admin dashboard.
+
+One document per IST calendar day holds everything /dashboard/stats returns.
+The first dashboard request of the day builds it from scratch (the snapshot
+function lives next to the route in server.py); after that the write paths
+keep it current with small atomic updates:
+
+* counters (collection, present, active memberships, ...) via ``$inc``
+* list sections that cannot be patched cheaply (upcoming renewals) are
+  flagged stale and recomputed on the next read
+* a member checking in is ``$pull``-ed from the stored absentee list
+
+Increments never create the document, so a day that has not been viewed yet
+costs nothing. Anything that slips between a snapshot read and its write is
+bounded by DAILY_STATS_RECONCILE_SECONDS, after which the snapshot is
+rebuilt.
+"""
+import logging
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DAILY_STATS_COLLECTION = "daily_stats"
+
+
+async def load_daily_stats(db, day: str) -> Optional[dict]:
+    return await db[DAILY_STATS_COLLECTION].find_one({"date": day}, {"_id": 0})
+
+
+async def store_daily_stats(db, day: str, snapshot: dict, built_at: datetime) -> dict:
+    doc = {**snapshot, "date": day, "built_at": built_at.isoformat(), "stale_sections": []}
+    await db[DAILY_STATS_COLLECTION].replace_one({"date": day}, doc, upsert=True)
+    return doc
+
+
+async def bump_daily_stats(db, day: str, inc: Optional[dict] = None, pull: Optional[dict] = None,
+                           stale: Optional[str] = None) -> None:
+    """Apply an incremental change to an already-built day; no-op otherwise.
+
+    Failures are logged rather than raised: the dashboard is a read model and
+    must never fail the write that fed it.
+    """
+    update = {}
+    if inc:
+        update["$inc"] = inc
+    if pull:
+        update["$pull"] = pull
+    if stale:
+        update["$addToSet"] = {"stale_sections": stale}
+    if not update:
+        return
+    try:
+        await db[DAILY_STATS_COLLECTION].update_one({"date": day}, update)
+    except Exception as e:
+        logger.error(f"daily_stats update for {day} failed: {e}")
+
+
+async def replace_section(db, day: str, fields: dict, section: str) -> None:
+    await db[DAILY_STATS_COLLECTION].update_one(
+        {"date": day},
+        {"$set": fields, "$pull": {"stale_sections": section}}
+    )
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""MongoDB index declarations for the F3 Fitness backend.
+
+Indexes are declared once here and reconciled against the live database on
+startup (see ``lifespan`` in server.py). TTL indexes come from the retention
+policies (retention.py); a changed retention period is applied in place with
+``collMod``. Run this module directly for a report of missing / unused
+indexes without touching the database:
+
+    python db_indexes.py --dry-run
+"""
+import logging
+import os
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from retention import ttl_index_models
+
+logger = logging.getLogger(__name__)
+
+# Collection name -> declared indexes. Names are explicit so the report and
+# reconciliation are stable across deployments.
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="users_id", unique=True),
+        IndexModel([("email", ASCENDING)], name="users_email"),
+        IndexModel([("phone_number", ASCENDING)], name="users_phone_number"),
+        IndexModel([("member_id", ASCENDING)], name="users_member_id"),
+        IndexModel([("role", ASCENDING)], name="users_role"),
+        # Birthday range reads (see birthdays.py)
+        IndexModel([("role", ASCENDING), ("dob_doy", ASCENDING)], name="users_role_dob_doy"),
+        IndexModel([("dob_md", ASCENDING)], name="users_dob_md"),
+    ],
+    "memberships": [
+        IndexModel([("id", ASCENDING)], name="memberships_id", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("end_date", DESCENDING)],
+            name="memberships_user_status_end",
+        ),
+        IndexModel([("status", ASCENDING), ("end_date", ASCENDING)], name="memberships_status_end"),
+    ],
+    "attendance": [
+        IndexModel([("id", ASCENDING)], name="attendance_id"),
+        IndexModel(
+            [("user_id", ASCENDING), ("check_in_time", DESCENDING)],
+            name="attendance_user_check_in",
+        ),
+        IndexModel([("check_in_time", DESCENDING), ("id", DESCENDING)], name="attendance_check_in_id"),
+    ],
+    "attendance_summaries": [
+        IndexModel([("user_id", ASCENDING)], name="attendance_summaries_user", unique=True),
+        IndexModel([("last_check_in_date", ASCENDING)], name="attendance_summaries_last_date"),
+    ],
+    "daily_stats": [
+        IndexModel([("date", ASCENDING)], name="daily_stats_date", unique=True),
+    ],
+    "payments": [
+        IndexModel([("id", ASCENDING)], name="payments_id"),
+        # id is the keyset tie-breaker for GET /payments pagination
+        IndexModel([("payment_date", DESCENDING), ("id", DESCENDING)], name="payments_date_id"),
+        IndexModel(
+            [("user_id", ASCENDING), ("payment_date", DESCENDING), ("id", DESCENDING)],
+            name="payments_user_date_id",
+        ),
+        IndexModel([("membership_id", ASCENDING)], name="payments_membership_id"),
+    ],
+    # Notification outbox (see outbox.py): claim scans and idempotency
+    "notification_outbox": [
+        IndexModel([("id", ASCENDING)], name="outbox_id", unique=True),
+        IndexModel(
+            [("status", ASCENDING), ("priority", ASCENDING), ("next_attempt_at", ASCENDING)],
+            name="outbox_status_priority_next_attempt",
+        ),
+        IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)], name="outbox_status_lease"),
+        IndexModel([("status", ASCENDING), ("updated_at", DESCENDING)], name="outbox_status_updated"),
+        IndexModel(
+            [("idempotency_key", ASCENDING)],
+            name="outbox_idempotency_key",
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$type": "string"}},
+        ),
+        # Per-broadcast progress counts and hold/release/cancel
+        IndexModel([("batch_id", ASCENDING), ("status", ASCENDING)], name="outbox_batch_status", sparse=True),
+    ],
+    "broadcast_jobs": [
+        IndexModel([("id", ASCENDING)], name="broadcast_jobs_id", unique=True),
+        IndexModel([("created_at", DESCENDING)], name="broadcast_jobs_created_at"),
+    ],
+    "activity_logs": [
+        IndexModel([("timestamp", DESCENDING)], name="activity_logs_timestamp"),
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="activity_logs_user_timestamp"),
+    ],
+    # Log browsing: keyset on (timestamp, id), optionally narrowed by one filter field
+    "email_logs": [
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="email_logs_timestamp_id"),
+        IndexModel(
+            [("status", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+            name="email_logs_status_timestamp_id",
+        ),
+        IndexModel(
+            [("to_email", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+            name="email_logs_recipient_timestamp_id",
+        ),
+        # Orphaned message_bodies sweep (retention.py)
+        IndexModel([("body_ref.hash", ASCENDING)], name="email_logs_body_hash", sparse=True),
+    ],
+    "whatsapp_logs": [
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="whatsapp_logs_timestamp_id"),
+        IndexModel(
+            [("status", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+            name="whatsapp_logs_status_timestamp_id",
+        ),
+        IndexModel(
+            [("provider", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+            name="whatsapp_logs_provider_timestamp_id",
+        ),
+        IndexModel(
+            [("to_number", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+            name="whatsapp_logs_recipient_timestamp_id",
+        ),
+    ],
+    # Cached invoice PDFs (invoice_cache.py); share links expire after 30 days,
+    # so older artifacts are rarely asked for and are simply re-rendered
+    "invoice_pdfs": [
+        IndexModel([("user_id", ASCENDING)], name="invoice_pdfs_user"),
+        IndexModel(
+            [("created_at", ASCENDING)],
+            name="invoice_pdfs_created_at_ttl",
+            expireAfterSeconds=int(os.environ.get("INVOICE_PDF_CACHE_DAYS", "30")) * 86400,
+        ),
+    ],
+    "lead_tasks": [
+        IndexModel([("lead_type", ASCENDING), ("user_id", ASCENDING)], name="lead_tasks_type_user", unique=True),
+    ],
+}
+
+for _collection_name, _models in ttl_index_models().items():
+    INDEX_SPECS.setdefault(_collection_name, []).extend(_models)
+
+
+def _key_of(spec: dict) -> tuple:
+    """Normalise an index key (IndexModel document or index_information entry)."""
+    key = spec.get("key")
+    items = key.items() if hasattr(key, "items") else key
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction) for field, direction in items)
+
+
+async def _index_usage(collection) -> Optional[Dict[str, int]]:
+    """Return {index_name: ops} from $indexStats, or None if unsupported/forbidden."""
+    try:
+        stats = await collection.aggregate([{"$indexStats": {}}]).to_list(None)
+    except Exception as e:
+        logger.debug(f"$indexStats unavailable for {collection.name}: {e}")
+        return None
+    return {s.get("name"): int((s.get("accesses") or {}).get("ops") or 0) for s in stats}
+
+
+async def reconcile_indexes(db, dry_run: bool = False, drop_undeclared: bool = False) -> dict:
+    """Create declared indexes that are missing and report unused/undeclared ones.
+
+    With ``dry_run`` nothing is created or dropped; the report lists what would
+    change. Undeclared indexes are only dropped when ``drop_undeclared`` is set.
+    """
+    report = {"dry_run": dry_run, "collections": {}}
+    for collection_name, models in INDEX_SPECS.items():
+        collection = db[collection_name]
+        entry = {"missing": [], "created": [], "ttl_updated": [], "conflicts": [], "undeclared": [], "dropped": [],
+                 "unused": [], "errors": []}
+        try:
+            existing = await collection.index_information()
+        except Exception as e:
+            entry["errors"].append(str(e))
+            report["collections"][collection_name] = entry
+            continue
+
+        existing_by_key = {_key_of(info): name for name, info in existing.items()}
+        declared_keys = set()
+        to_create = []
+        ttl_changes = []
+        for model in models:
+            doc = model.document
+            key = _key_of(doc)
+            declared_keys.add(key)
+            if key in existing_by_key:
+                existing_info = existing[existing_by_key[key]]
+                if bool(existing_info.get("unique")) != bool(doc.get("unique")):
+                    entry["conflicts"].append({
+                        "name": existing_by_key[key],
+                        "declared_unique": bool(doc.get("unique")),
+                        "existing_unique": bool(existing_info.get("unique")),
+                    })
+                elif "expireAfterSeconds" in doc and existing_info.get("expireAfterSeconds") != doc["expireAfterSeconds"]:
+                    ttl_changes.append((existing_by_key[key], doc["expireAfterSeconds"]))
+                continue
+            if doc["name"] in existing:
+                # Same name, different key: leave it for an operator to resolve.
+                entry["conflicts"].append({"name": doc["name"], "declared_key": list(key), "existing_key": list(_key_of(existing[doc["name"]]))})
+                continue
+            entry["missing"].append(doc["name"])
+            to_create.append(model)
+
+        for name, info in existing.items():
+            if name == "_id_" or _key_of(info) in declared_keys:
+                continue
+            entry["undeclared"].append(name)
+
+        usage = await _index_usage(collection)
+        if usage is not None:
+            entry["unused"] = sorted(name for name, ops in usage.items() if name != "_id_" and ops == 0)
+
+        if not dry_run:
+            for model in to_create:
+                try:
+                    await collection.create_indexes([model])
+                    entry["created"].append(model.document["name"])
+                except Exception as e:
+                    logger.error(f"Failed to create index {model.document['name']} on {collection_name}: {e}")
+                    entry["errors"].append(f"{model.document['name']}: {e}")
+            for name, seconds in ttl_changes:
+                try:
+                    await db.command("collMod", collection_name, index={"name": name, "expireAfterSeconds": seconds})
+                    entry["ttl_updated"].append(name)
+                except Exception as e:
+                    logger.error(f"Failed to update TTL of {name} on {collection_name}: {e}")
+                    entry["errors"].append(f"collMod {name}: {e}")
+            if drop_undeclared:
+                for name in entry["undeclared"]:
+                    try:
+                        await collection.drop_index(name)
+                        entry["dropped"].append(name)
+                    except Exception as e:
+                        entry["errors"].append(f"drop {name}: {e}")
+        else:
+            entry["ttl_updated"] = [name for name, _ in ttl_changes]
+
+        report["collections"][collection_name] = entry
+    return report
+
+
+def summarize_report(report: dict) -> str:
+    lines = []
+    for name, entry in report.get("collections", {}).items():
+        parts = []
+        for field in ("missing", "created", "ttl_updated", "conflicts", "undeclared", "dropped", "unused", "errors"):
+            if entry.get(field):
+                parts.append(f"{field}={entry[field]}")
+        lines.append(f"{name}: {', '.join(parts) if parts else 'ok'}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import json
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Reconcile MongoDB indexes for F3 Fitness")
+    parser.add_argument("--dry-run", action="store_true", help="report missing/unused indexes without changing anything")
+    parser.add_argument("--drop-undeclared", action="store_true", help="drop indexes that are not declared in INDEX_SPECS")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / ".env")
+    mongo_client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+
+    async def _main():
+        result = await reconcile_indexes(
+            mongo_client[os.environ["DB_NAME"]],
+            dry_run=args.dry_run,
+            drop_undeclared=args.drop_undeclared,
+        )
+        print(json.dumps(result, indent=2, default=str) if args.json else summarize_report(result))
+
+    asyncio.run(_main())
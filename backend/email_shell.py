@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Branded HTML shell for outgoing email.
+
+The shell is a few KB of static HTML/CSS around two holes: the ``<title>``
+and the body content. It is split into literal pieces once at import time,
+and the ``(prefix, suffix)`` pair for a given title is memoized, so wrapping
+an email is two string concatenations. Bulk senders fetch the pair once per
+send with ``email_shell`` and only concatenate per-recipient content.
+
+Content that already looks like a complete, self-styled email (an admin
+pasted a full HTML template) gets the minimal shell instead of the branded
+one, matching what ``wrap_email_in_template`` has always done.
+"""
+from functools import lru_cache
+from typing import Optional, Tuple
+
+DEFAULT_TITLE = "F3 Fitness Notification"
+SHELL_CACHE_SIZE = 256
+
+_TITLE = "{title}"
+_CONTENT = "{content}"
+
+# Light/white theme with detailed footer
+BRANDED_SHELL = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{title}</title>
+<link href="https://fonts.googleapis.com/css2?family=Poppins:wght@400;500;600;700&display=swap" rel="stylesheet">
+<style>
+body { margin:0; padding:0; font-family: 'Poppins', Arial, sans-serif; background: linear-gradient(135deg,#f4f6f8,#eef1f5); }
+.wrapper { padding:40px 15px; }
+.container { max-width:620px; margin:0 auto; background:#ffffff; border-radius:16px; overflow:hidden; box-shadow:0 15px 40px rgba(0,0,0,0.08); border:1px solid #eaeaea; }
+.top-accent { height:6px; background: linear-gradient(135deg,#0ea5b7,#0b7285); }
+.header { padding:35px 30px 25px 30px; text-align:center; background:linear-gradient(135deg,#0ea5b7,#0b7285); }
+.logo { max-width:160px; margin-bottom:10px; }
+.tagline { font-size:13px; letter-spacing:2px; text-transform:uppercase; color:#e0f2fe; margin-top:5px; font-weight:600; }
+.content { padding:40px 35px 35px 35px; color:#374151; font-size:16px; line-height:1.7; }
+.content h2 { margin-top:0; font-size:24px; color:#111827; }
+.highlight-box { background:#f0f9ff; border-left:4px solid #0ea5b7; padding:18px; border-radius:6px; margin:25px 0; font-size:14px; color:#0f766e; }
+.button { display:inline-block; margin-top:25px; background: linear-gradient(135deg,#0ea5b7,#0b7285); color:#ffffff; padding:14px 32px; text-decoration:none; border-radius:50px; font-weight:600; font-size:14px; letter-spacing:0.5px; box-shadow:0 8px 20px rgba(14,165,183,0.25); }
+.footer { background:#f3f4f6; padding:25px 25px; font-size:14px; color:#6b7280; border-top:1px solid #e5e7eb; text-align:center; line-height:1.7; }
+.footer-title { font-size:18px; font-weight:700; color:#111827; margin-bottom:10px; }
+.footer-address { max-width:480px; margin:0 auto 15px auto; }
+.footer-contact { margin-bottom:10px; }
+.footer-hours { margin-bottom:20px; }
+.footer-social { color:#0ea5b7; font-weight:700; }
+.footer a { color:#0ea5b7; text-decoration:none; font-weight:500; }
+.small { margin-top:20px; padding-top:15px; border-top:1px solid #e5e7eb; font-size:11px; color:#9ca3af; }
+.divider { height:1px; background:#e5e5e5; margin:25px 0; }
+.otp-code { background:#f0f9ff; border:2px solid #0ea5b7; padding:20px; border-radius:10px; text-align:center; font-size:32px; font-weight:700; color:#0b7285; letter-spacing:8px; }
+</style>
+</head>
+<body>
+<div class="wrapper">
+  <div class="container">
+    <div class="top-accent"></div>
+    <div class="header">
+      <img src="https://customer-assets.emergentagent.com/job_f3-fitness-gym/artifacts/0x0pk4uv_Untitled%20%28500%20x%20300%20px%29%20%282%29.png" alt="F3 Fitness Logo" class="logo">
+      <div class="tagline">TRAIN • TRANSFORM • TRIUMPH</div>
+    </div>
+    <div class="content">
+      {content}
+    </div>
+    <div class="footer">
+      <div class="footer-title">F3 Fitness Health Club</div>
+      <div class="footer-address">
+        4th Avenue Plot No 4R-B, Mode, near Mandir Marg,<br>
+        Sector 4, Vidyadhar Nagar, Jaipur, Rajasthan 302039
+      </div>
+      <div class="footer-contact">
+        📞 072300 52193 &nbsp;|&nbsp; 📧 info@f3fitness.in
+      </div>
+      <div class="footer-hours">
+        🕒 Mon–Sat: 5:00 AM – 10:00 PM &nbsp;|&nbsp; Sun: 6:00 AM – 12:00 PM
+      </div>
+      <div>
+        Follow us on Instagram: <a href="https://instagram.com/f3fitnessclub" class="footer-social">@f3fitnessclub</a>
+      </div>
+      <div class="small">
+        © 2026 F3 Fitness Health Club. All rights reserved.
+      </div>
+    </div>
+  </div>
+</div>
+</body>
+</html>"""
+
+# Wrapper for content that brings its own styling
+MINIMAL_SHELL = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{title}</title>
+</head>
+<body style="margin:0; padding:0; font-family: Arial, sans-serif; background: #f4f6f8;">
+{content}
+</body>
+</html>"""
+
+
+def _split(shell: str) -> Tuple[str, str, str]:
+    """(before title, between title and content, after content)."""
+    head, rest = shell.split(_TITLE, 1)
+    middle, tail = rest.split(_CONTENT, 1)
+    return head, middle, tail
+
+
+_BRANDED_PIECES = _split(BRANDED_SHELL)
+_MINIMAL_PIECES = _split(MINIMAL_SHELL)
+
+
+def is_complete_email(content: str) -> bool:
+    """True when ``content`` already is a styled email rather than a body fragment."""
+    content_stripped = (content or "").strip()
+    return (
+        content_stripped.startswith('<!DOCTYPE') or
+        content_stripped.startswith('<html') or
+        (content_stripped.startswith('<div') and 'style=' in content_stripped[:200] and ('max-width' in content_stripped[:300] or 'background' in content_stripped[:300]))
+    )
+
+
+@lru_cache(maxsize=SHELL_CACHE_SIZE)
+def email_shell(title: str = DEFAULT_TITLE, complete: bool = False) -> Tuple[str, str]:
+    """``(prefix, suffix)`` to put around body content for ``title``."""
+    head, middle, tail = _MINIMAL_PIECES if complete else _BRANDED_PIECES
+    return head + str(title) + middle, tail
+
+
+def wrap_email(content: str, title: str = DEFAULT_TITLE) -> str:
+    prefix, suffix = email_shell(title, is_complete_email(content))
+    return prefix + content + suffix
+
+
+def split_email(html: str) -> Optional[Tuple[str, bool, str]]:
+    """Inverse of ``wrap_email``: ``(title, complete, content)``.
+
+    None unless ``email_shell(title, complete)`` around ``content`` gives
+    back exactly ``html``.
+    """
+    for complete, (head, middle, tail) in ((False, _BRANDED_PIECES), (True, _MINIMAL_PIECES)):
+        if len(html) < len(head) + len(middle) + len(tail) or not html.startswith(head) or not html.endswith(tail):
+            continue
+        title_end = html.find(middle, len(head))
+        if title_end < 0:
+            continue
+        title = html[len(head):title_end]
+        content = html[title_end + len(middle):len(html) - len(tail)]
+        prefix, suffix = email_shell(title, complete)
+        if prefix + content + suffix == html:
+            return title, complete, content
+    return None
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Cached Fast2SMS account metadata.
+
+``/dev/dlt_manager/whatsapp`` lists the account's WhatsApp business numbers
+(number, phone_number_id, connection_status) and their templates. Sends need
+it to resolve the sender when ``fast2sms_phone_number_id`` or
+``fast2sms_waba_number`` is not configured, and the settings page shows the
+template list. Both used to call the provider every time.
+
+``Fast2SMSMetadata`` keeps the response for ``ttl`` seconds, in process and
+in the settings document (``fast2sms_metadata``) so other workers and
+restarts reuse it::
+
+    {key, fetched_at, payload, sender: {display_number, phone_number_id, connection_status}}
+
+``key`` fingerprints the base URL and API key; changing either makes the
+stored copy stale. Concurrent lookups share one request, and a failed
+lookup is remembered for ``failure_ttl`` seconds so a broadcast does not
+retry it per message. ``get(..., refresh=True)`` always asks the provider.
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+METADATA_FIELD = "fast2sms_metadata"
+DEFAULT_BASE_URL = "https://www.fast2sms.com"
+
+
+class Fast2SMSMetadataError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _digits(value) -> str:
+    return "".join(ch for ch in str(value or "") if ch.isdigit())
+
+
+def base_url_of(settings: dict) -> str:
+    return (settings.get("fast2sms_base_url") or DEFAULT_BASE_URL).rstrip("/")
+
+
+def metadata_key(settings: dict) -> str:
+    raw = f"{base_url_of(settings)}|{settings.get('fast2sms_api_key') or ''}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def pick_sender(rows: Any, display_number: str = "") -> Optional[dict]:
+    """Row for the configured number, else the first CONNECTED one, else the first."""
+    if not isinstance(rows, list) or not rows:
+        return None
+    rows = [row for row in rows if isinstance(row, dict)]
+    if display_number:
+        want = _digits(display_number)
+        for row in rows:
+            if _digits(row.get("number")) == want:
+                return row
+    for row in rows:
+        if str(row.get("connection_status", "")).upper() == "CONNECTED":
+            return row
+    return rows[0] if rows else None
+
+
+def _sender_summary(row: Optional[dict]) -> Optional[dict]:
+    if not row:
+        return None
+    return {
+        "display_number": str(row.get("number") or ""),
+        "phone_number_id": str(row.get("phone_number_id") or ""),
+        "connection_status": row.get("connection_status"),
+    }
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Fast2SMSMetadata:
+    def __init__(self, client_getter: Callable[[], Any], persist: Callable[[dict], Awaitable[None]],
+                 ttl: float = 3600.0, failure_ttl: float = 60.0, timeout: float = 20.0):
+        self._client_getter = client_getter
+        self._persist = persist
+        self.ttl = float(ttl)
+        self.failure_ttl = float(failure_ttl)
+        self.timeout = float(timeout)
+        self._cache = TTLCache(maxsize=8, ttl=self.ttl)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.counters: Dict[str, int] = {"fetches": 0, "fetch_failures": 0, "persisted_hits": 0}
+
+    def _stored(self, settings: dict, key: str) -> Optional[dict]:
+        """The copy persisted in settings, if it belongs to this account and is fresh."""
+        stored = settings.get(METADATA_FIELD)
+        if not isinstance(stored, dict) or stored.get("key") != key:
+            return None
+        try:
+            fetched_at = datetime.fromisoformat(stored["fetched_at"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        remaining = timedelta(seconds=self.ttl) - (_utcnow() - fetched_at)
+        if remaining.total_seconds() <= 0:
+            return None
+        return {**stored, "expires_in": remaining.total_seconds()}
+
+    async def _fetch(self, settings: dict, key: str) -> dict:
+        api_key = settings.get("fast2sms_api_key")
+        if not api_key:
+            raise Fast2SMSMetadataError(400, "Fast2SMS API key is missing.")
+        self.counters["fetches"] += 1
+        try:
+            response = await self._client_getter().get(
+                f"{base_url_of(settings)}/dev/dlt_manager/whatsapp",
+                headers={"authorization": api_key},
+                params={"authorization": api_key},
+                timeout=self.timeout
+            )
+        except Exception as e:
+            raise Fast2SMSMetadataError(500, f"Failed to fetch Fast2SMS WABA templates: {e}")
+        try:
+            payload = response.json()
+        except Exception:
+            payload = {"raw": response.text}
+        if response.status_code >= 400:
+            raise Fast2SMSMetadataError(response.status_code, str(payload))
+        entry = {
+            "key": key,
+            "fetched_at": _utcnow().isoformat(),
+            "payload": payload,
+            "sender": _sender_summary(pick_sender(payload, str(settings.get("fast2sms_waba_number") or "").strip())),
+        }
+        try:
+            await self._persist(entry)
+        except Exception as e:
+            logger.warning(f"Persisting Fast2SMS metadata failed: {e}")
+        return entry
+
+    async def get(self, settings: dict, refresh: bool = False) -> Tuple[dict, bool]:
+        """(entry, cached); raises ``Fast2SMSMetadataError`` when the lookup fails."""
+        key = metadata_key(settings)
+        if not refresh:
+            cached = self._cache.get(key)
+            if isinstance(cached, Fast2SMSMetadataError):
+                raise cached
+            if cached is not None:
+                return cached, True
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if not refresh:
+                # Another caller may have fetched while we waited
+                cached = self._cache.get(key)
+                if isinstance(cached, Fast2SMSMetadataError):
+                    raise cached
+                if cached is not None:
+                    return cached, True
+                stored = self._stored(settings, key)
+                if stored is not None:
+                    self.counters["persisted_hits"] += 1
+                    self._cache.set(key, stored, ttl=stored.pop("expires_in"))
+                    return stored, True
+            try:
+                entry = await self._fetch(settings, key)
+            except Fast2SMSMetadataError as e:
+                self.counters["fetch_failures"] += 1
+                self._cache.set(key, e, ttl=self.failure_ttl)
+                raise
+            self._cache.set(key, entry)
+            return entry, False
+
+    async def resolve_sender(self, settings: dict, display_number: str, phone_number_id: str) -> Tuple[str, str, bool]:
+        """Fill in whichever of (display_number, phone_number_id) is missing.
+
+        Returns ``(display_number, phone_number_id, resolved)``; lookup
+        failures leave the values as they were.
+        """
+        if display_number and phone_number_id:
+            return display_number, phone_number_id, False
+        try:
+            entry, _ = await self.get(settings)
+        except Fast2SMSMetadataError:
+            return display_number, phone_number_id, False
+        row = _sender_summary(pick_sender(entry.get("payload"), display_number))
+        if not row:
+            return display_number, phone_number_id, False
+        return display_number or row["display_number"], phone_number_id or row["phone_number_id"], True
+
+    def invalidate(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {"ttl": self.ttl, "cache_hits": self._cache.hits, "cache_misses": self._cache.misses, **self.counters}
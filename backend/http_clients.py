@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Long-lived HTTP clients for the WhatsApp providers.
+
+Opening an ``httpx.AsyncClient`` per message means a fresh TCP (and TLS)
+handshake, and a fresh SSL context, for every send. ``ProviderHTTP`` keeps
+one pooled client per provider (``evolution``, ``fast2sms``, ``twilio``)
+with keep-alive and, when the ``h2`` package is installed, HTTP/2. Clients
+are created in the app lifespan (``open``) and closed on shutdown
+(``aclose``); ``get`` also creates one lazily so scripts work without a
+lifespan.
+
+Per-call timeouts still apply: pass ``timeout=`` on the request as before.
+The Twilio SDK needs its own aiohttp-based client, managed the same way via
+``twilio_http_client()``.
+"""
+import logging
+import os
+from typing import Dict, Iterable
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # optional: plain HTTP/1.1 keep-alive without it
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = ("evolution", "fast2sms", "twilio")
+
+
+class ProviderHTTP:
+    def __init__(self, max_connections: int = 20, max_keepalive: int = 10, keepalive_expiry: float = 30.0,
+                 connect_timeout: float = 10.0, timeout: float = 30.0, http2: bool = True,
+                 verify=True):
+        self.limits = httpx.Limits(
+            max_connections=int(max_connections),
+            max_keepalive_connections=int(max_keepalive),
+            keepalive_expiry=float(keepalive_expiry),
+        )
+        self.timeout = httpx.Timeout(float(timeout), connect=float(connect_timeout))
+        self.http2 = bool(http2) and HTTP2_AVAILABLE
+        # True, or a CA bundle path for self-hosted providers (e.g. Evolution) behind a private CA
+        self.verify = verify
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._requests: Dict[str, int] = {}
+        self._twilio = None
+
+    def _create(self, provider: str) -> httpx.AsyncClient:
+        self._requests.setdefault(provider, 0)
+
+        async def _count(request: httpx.Request) -> None:
+            self._requests[provider] += 1
+
+        return httpx.AsyncClient(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+            verify=self.verify,
+            event_hooks={"request": [_count]},
+        )
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._create(provider)
+            self._clients[provider] = client
+        return client
+
+    def open(self, providers: Iterable[str] = PROVIDERS) -> None:
+        for provider in providers:
+            self.get(provider)
+
+    def twilio_http_client(self):
+        """Shared ``AsyncTwilioHttpClient`` for ``Client(..., http_client=...)``."""
+        if self._twilio is None:
+            from twilio.http.async_http_client import AsyncTwilioHttpClient
+            self._twilio = AsyncTwilioHttpClient(timeout=self.timeout.read)
+        return self._twilio
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for provider, client in clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Closing {provider} HTTP client failed: {e}")
+        if self._twilio is not None:
+            twilio, self._twilio = self._twilio, None
+            try:
+                await twilio.close()
+            except Exception as e:
+                logger.warning(f"Closing Twilio HTTP client failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "requests": dict(self._requests),
+            "open": sorted(p for p, c in self._clients.items() if not c.is_closed),
+        }
+
+
+def provider_http_from_env() -> ProviderHTTP:
+    return ProviderHTTP(
+        max_connections=int(os.environ.get("PROVIDER_HTTP_MAX_CONNECTIONS", "20")),
+        max_keepalive=int(os.environ.get("PROVIDER_HTTP_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.environ.get("PROVIDER_HTTP_KEEPALIVE_SECONDS", "30")),
+        connect_timeout=float(os.environ.get("PROVIDER_HTTP_CONNECT_TIMEOUT", "10")),
+        timeout=float(os.environ.get("PROVIDER_HTTP_TIMEOUT", "30")),
+        http2=os.environ.get("PROVIDER_HTTP2", "true").lower() not in ("0", "false", "no"),
+        verify=os.environ.get("PROVIDER_HTTP_CA_BUNDLE") or True,
+    )
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Rendered invoice PDFs, cached per payment and content version.
+
+Building an invoice with ReportLab takes far longer than the lookups that
+feed it, and the same invoice is fetched repeatedly: the admin download,
+every open of the WhatsApp share link and the email/WhatsApp send itself.
+
+An artifact is keyed by payment id and a *content version*: a hash of
+everything printed on the invoice (payment, member, membership, plan, gym
+settings) plus ``RENDERER_VERSION``. A change to any input yields a new
+version, so nothing has to be invalidated by hand when a membership or the
+settings are edited; the stale artifact is simply replaced on the next
+request. Artifacts live in ``invoice_pdfs`` (a PDF is tens of KB, well
+within a document, so GridFS would only add round trips)::
+
+    {_id: payment_id, version, user_id, filename, pdf: <bytes>, size, created_at}
+
+with a small in-process LRU in front. The version doubles as a weak ETag,
+so a client re-opening an unchanged invoice gets a 304 without the PDF
+being read or rendered. Concurrent requests for the same version share one
+render.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from bson import Binary
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+INVOICE_CACHE_COLLECTION = "invoice_pdfs"
+# Bump when the invoice layout changes so every cached artifact is re-rendered
+RENDERER_VERSION = "1"
+
+
+def content_version(*inputs: Any) -> str:
+    raw = json.dumps([RENDERER_VERSION, *inputs], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def etag_for(version: str) -> str:
+    # Weak: a re-render of the same version is equivalent, not byte-identical
+    return f'W/"{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses weak comparison: W/"x" and "x" are the same tag
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+class InvoiceCache:
+    def __init__(self, collection_getter: Callable[[], Any], memory_size: int = 32, memory_ttl: float = 600):
+        self._collection_getter = collection_getter
+        self._memory = TTLCache(maxsize=memory_size, ttl=memory_ttl)
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.counters = {"memory_hits": 0, "stored_hits": 0, "renders": 0, "store_errors": 0}
+
+    async def _load(self, payment_id: str, version: str) -> Optional[Tuple[bytes, str]]:
+        cached = self._memory.get(payment_id)
+        if cached is not None and cached[0] == version:
+            self.counters["memory_hits"] += 1
+            return cached[1], cached[2]
+        try:
+            doc = await self._collection_getter().find_one({"_id": payment_id, "version": version})
+        except Exception as e:
+            logger.error(f"Invoice cache read for {payment_id} failed: {e}")
+            return None
+        if doc is None:
+            return None
+        self.counters["stored_hits"] += 1
+        pdf_bytes = bytes(doc["pdf"])
+        self._memory.set(payment_id, (version, pdf_bytes, doc["filename"]))
+        return pdf_bytes, doc["filename"]
+
+    async def _store(self, payment_id: str, version: str, user_id: Optional[str], pdf_bytes: bytes, filename: str):
+        self._memory.set(payment_id, (version, pdf_bytes, filename))
+        try:
+            await self._collection_getter().replace_one({"_id": payment_id}, {
+                "_id": payment_id,
+                "version": version,
+                "user_id": user_id,
+                "filename": filename,
+                "pdf": Binary(pdf_bytes),
+                "size": len(pdf_bytes),
+                "created_at": datetime.now(timezone.utc),
+            }, upsert=True)
+        except Exception as e:
+            # Serving the freshly rendered PDF matters more than caching it
+            self.counters["store_errors"] += 1
+            logger.error(f"Invoice cache write for {payment_id} failed: {e}")
+
+    async def get_or_render(self, payment_id: str, version: str, user_id: Optional[str],
+                            render: Callable[[], Awaitable[Tuple[bytes, str]]]) -> Tuple[bytes, str]:
+        """(pdf_bytes, filename) for ``version``, rendering and storing it on a miss."""
+        cached = await self._load(payment_id, version)
+        if cached is not None:
+            return cached
+        key = (payment_id, version)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            self.counters["renders"] += 1
+            pdf_bytes, filename = await render()
+            await self._store(payment_id, version, user_id, pdf_bytes, filename)
+            future.set_result((pdf_bytes, filename))
+            return pdf_bytes, filename
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here so waiter-less failures are not logged as unhandled
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def forget_user(self, user_id: str) -> None:
+        """Drop every cached invoice of a member (their details are printed on it)."""
+        self._memory.clear()
+        await self._collection_getter().delete_many({"user_id": user_id})
+
+    def stats(self) -> dict:
+        return {**self.counters, "memory": self._memory.stats()}
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Compact storage for email bodies referenced from ``email_logs``.
+
+Each email log used to carry up to 50KB of ``body_html``, most of it the
+same branded shell (see email_shell.py) around a few hundred bytes of
+content. A log now stores a reference instead::
+
+    body_ref: {shell: "branded" | "minimal" | None, title, hash, size}
+
+``shell``/``title`` rebuild the wrapper; ``hash`` is a sha256 prefix of the
+content (the whole HTML when it is not wrapped in a known shell), which is
+stored once, zlib-compressed, in ``message_bodies``::
+
+    {_id: hash, z: <compressed bytes>, size, created_at}
+
+Identical bodies (the same notification to many members, repeated test
+sends) share one document. Bodies go through a ``BufferedWriter`` like the
+logs themselves; a duplicate ``_id`` on insert simply means "already
+stored". ``expand`` puts ``body_html`` back on logs for the preview.
+"""
+import hashlib
+import html as html_lib
+import re
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List
+
+from cache import TTLCache
+from email_shell import email_shell, split_email
+
+BODY_COLLECTION = "message_bodies"
+MAX_BODY_CHARS = 50000
+COMPRESSION_LEVEL = 6
+
+_NON_TEXT = re.compile(r"<(style|script|head)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r"<[^>]+>")
+_SPACE = re.compile(r"\s+")
+
+
+def body_hash(text: str) -> str:
+    # 128 bits of sha256 is plenty to tell bodies apart and halves the key size
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def compress(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decompress(data: bytes) -> str:
+    return zlib.decompress(bytes(data)).decode("utf-8")
+
+
+def preview_text(html: str, limit: int = 300) -> str:
+    """Readable text of an email body for the log list (shell and markup removed)."""
+    split = split_email(html)
+    text = split[2] if split else html
+    text = _SPACE.sub(" ", html_lib.unescape(_TAG.sub(" ", _NON_TEXT.sub(" ", text)))).strip()
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+class BodyStore:
+    def __init__(self, writer, collection_getter: Callable[[], Any], remember: int = 4096):
+        """``writer`` is a BufferedWriter on ``collection_getter()``."""
+        self.writer = writer
+        self._collection_getter = collection_getter
+        # Hashes written recently by this process; skips re-queueing popular bodies
+        self._recent = TTLCache(maxsize=remember, ttl=3600)
+
+    def _store(self, text: str) -> str:
+        digest = body_hash(text)
+        if digest not in self._recent:
+            self._recent.set(digest, True)
+            self.writer.add({
+                "_id": digest,
+                "z": compress(text),
+                "size": len(text),
+                "created_at": datetime.now(timezone.utc),
+            })
+        return digest
+
+    def email_ref(self, html: str) -> dict:
+        """Store ``html`` compactly; returns the ``body_ref`` for the log."""
+        if len(html) > MAX_BODY_CHARS:
+            html = html[:MAX_BODY_CHARS] + "\n<!-- truncated -->"
+        split = split_email(html)
+        if split is None:
+            return {"shell": None, "title": None, "hash": self._store(html), "size": len(html)}
+        title, complete, content = split
+        return {
+            "shell": "minimal" if complete else "branded",
+            "title": title,
+            "hash": self._store(content),
+            "size": len(html),
+        }
+
+    async def load(self, hashes: Iterable[str]) -> Dict[str, str]:
+        wanted = list({h for h in hashes if h})
+        if not wanted:
+            return {}
+        docs = await self._collection_getter().find({"_id": {"$in": wanted}}).to_list(len(wanted))
+        return {doc["_id"]: decompress(doc["z"]) for doc in docs}
+
+    async def expand(self, logs: List[dict]) -> List[dict]:
+        """Fill ``body_html`` on logs that only carry a ``body_ref`` (one query)."""
+        refs = [log["body_ref"] for log in logs if log.get("body_ref") and not log.get("body_html")]
+        bodies = await self.load(ref.get("hash") for ref in refs)
+        for log in logs:
+            ref = log.get("body_ref")
+            if not ref or log.get("body_html") or ref.get("hash") not in bodies:
+                continue
+            content = bodies[ref["hash"]]
+            if ref.get("shell"):
+                prefix, suffix = email_shell(ref.get("title") or "", ref["shell"] == "minimal")
+                content = prefix + content + suffix
+            log["body_html"] = content
+        return logs
+
+    def forget(self) -> None:
+        """Drop the recently-stored memo (after the bodies collection was emptied)."""
+        self._recent.clear()
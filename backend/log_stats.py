@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Rolling delivery counters behind the email/WhatsApp log dashboards.
+
+The dashboards used to run four to six ``count_documents`` over the whole
+log collection per refresh. Each log collection now has one counters
+document in ``log_stats``::
+
+    {_id: "email_logs", by_status: {sent, failed, pending, ...},
+     days: {"2026-10-17": {sent, failed, ...}}, recent_failures: [...], built_at}
+
+It is built by a single ``$facet`` aggregation (per-status totals, today's
+counts and the latest failures in one pass) and kept current by ``record``,
+which the log's BufferedWriter calls after every flush: one ``$inc``/``$push``
+per batch. Like daily_stats.py, increments never create the document, and
+anything the counters miss (TTL expiry, a write racing a rebuild) is
+bounded by LOG_STATS_RECONCILE_SECONDS, after which the document is rebuilt.
+Reads go through a short in-process cache that a local flush invalidates.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+LOG_STATS_COLLECTION = "log_stats"
+RECENT_FAILURES = 10
+
+
+def _status(doc: dict) -> str:
+    return str(doc.get("status") or "unknown")
+
+
+def facet_pipeline(today_start: str, recent: int = RECENT_FAILURES) -> list:
+    """Totals per status, today's counts per status and the latest failures, in one pass."""
+    by_status = [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+    return [{"$facet": {
+        "by_status": by_status,
+        "today": [{"$match": {"timestamp": {"$gte": today_start}}}, *by_status],
+        "recent_failures": [
+            {"$match": {"status": "failed"}},
+            {"$sort": {"timestamp": -1}},
+            {"$limit": recent},
+            {"$project": {"_id": 0}},
+        ],
+    }}]
+
+
+def _counts(groups: List[dict]) -> Dict[str, int]:
+    return {str(group["_id"] or "unknown"): int(group["count"]) for group in groups}
+
+
+class LogStats:
+    def __init__(self, collection_getter: Callable[[], Any], counters_getter: Callable[[], Any], name: str,
+                 today_start: Callable[[], datetime], reconcile_seconds: float = 3600, cache_ttl: float = 5):
+        """``today_start`` returns the start of the current day in the logs' timezone."""
+        self._collection_getter = collection_getter
+        self._counters_getter = counters_getter
+        self.name = name
+        self._today_start = today_start
+        self.reconcile_seconds = float(reconcile_seconds)
+        self._cache = TTLCache(maxsize=1, ttl=cache_ttl)
+        self._lock: Optional[asyncio.Lock] = None
+        self.rebuilds = 0
+
+    # ---- write side ----
+
+    async def record(self, docs: List[dict]) -> None:
+        """Fold a flushed batch of logs into the counters (BufferedWriter ``on_flush``)."""
+        inc: Dict[str, int] = defaultdict(int)
+        failures = []
+        for doc in docs:
+            status = _status(doc)
+            inc[f"by_status.{status}"] += 1
+            day = str(doc.get("timestamp") or "")[:10]
+            if day:
+                inc[f"days.{day}.{status}"] += 1
+            if status == "failed":
+                failures.append({k: v for k, v in doc.items() if k != "_id"})
+        update: Dict[str, Any] = {"$inc": dict(inc)}
+        if failures:
+            update["$push"] = {"recent_failures": {
+                "$each": failures, "$sort": {"timestamp": -1}, "$slice": RECENT_FAILURES,
+            }}
+        self._cache.clear()
+        await self._counters_getter().update_one({"_id": self.name}, update)
+
+    async def reset(self) -> None:
+        """Drop the counters (after the logs were cleared or archived); rebuilt on next read."""
+        self._cache.clear()
+        await self._counters_getter().delete_one({"_id": self.name})
+
+    # ---- read side ----
+
+    async def snapshot(self) -> dict:
+        """Build the counters document from the collection with one ``$facet``."""
+        today_start = self._today_start()
+        result = await self._collection_getter().aggregate(facet_pipeline(today_start.isoformat())).to_list(1)
+        facets = result[0] if result else {}
+        return {
+            "_id": self.name,
+            "by_status": _counts(facets.get("by_status", [])),
+            "days": {today_start.date().isoformat(): _counts(facets.get("today", []))},
+            "recent_failures": facets.get("recent_failures", []),
+            "built_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def _expired(self, doc: dict) -> bool:
+        try:
+            built_at = datetime.fromisoformat(doc["built_at"])
+        except (KeyError, TypeError, ValueError):
+            return True
+        age = (datetime.now(timezone.utc) - built_at).total_seconds()
+        # A new day also starts from a fresh snapshot (prunes the older day buckets)
+        return age > self.reconcile_seconds or self._today_start().date().isoformat() not in doc.get("days", {})
+
+    async def get(self) -> dict:
+        """{total, by_status, today, recent_failures} from the counters (cached briefly)."""
+        cached = self._cache.get(self.name)
+        if cached is not None:
+            return cached
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            cached = self._cache.get(self.name)
+            if cached is not None:
+                return cached
+            doc = await self._counters_getter().find_one({"_id": self.name})
+            if doc is None or self._expired(doc):
+                doc = await self.snapshot()
+                await self._counters_getter().replace_one({"_id": self.name}, doc, upsert=True)
+                self.rebuilds += 1
+            by_status = {status: count for status, count in (doc.get("by_status") or {}).items() if count}
+            stats = {
+                "total": sum(by_status.values()),
+                "by_status": by_status,
+                "today": (doc.get("days") or {}).get(self._today_start().date().isoformat(), {}),
+                "recent_failures": doc.get("recent_failures") or [],
+            }
+            self._cache.set(self.name, stats)
+            return stats
+
+    def stats(self) -> dict:
+        return {"name": self.name, "rebuilds": self.rebuilds, "cache": self._cache.stats()}
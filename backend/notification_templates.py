@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""Notification templates: built-in defaults plus a compiled registry.
+
+``DEFAULT_TEMPLATES`` holds the shipped email/WhatsApp templates keyed by
+``(template_type, channel)``. Admins can override any of them (``templates``
+collection); ``TemplateRegistry`` loads all overrides in one query, merges
+them over the defaults and compiles every template once, so a notification
+send is a dict lookup plus a render instead of a database round trip.
+
+The registry is per-process: ``update_template``/``reset_template`` call
+``invalidate()``, and TEMPLATE_CACHE_TTL_SECONDS bounds staleness when
+another worker made the change.
+
+Rendering is a single pass: a template is split once into literal chunks and
+placeholder names, and each render joins the chunks with the values.
+``render_template`` does the same for ad-hoc strings (broadcast messages,
+inline fallbacks) through an LRU cache of compiled texts.
+"""
+import asyncio
+import re
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+TEMPLATE_TYPES = [
+    "welcome", "otp", "password_reset", "attendance", "absent_warning",
+    "birthday", "holiday", "plan_shared", "renewal_reminder",
+    "membership_activated", "payment_received", "invoice_sent", "announcement",
+    "freeze_started", "freeze_ended", "freeze_ending_tomorrow",
+    "new_user_credentials", "test_email"
+]
+CHANNELS = ["email", "whatsapp"]
+
+# Email content is wrapped by wrap_email_in_template() at send time.
+DEFAULT_TEMPLATES: Dict[Tuple[str, str], dict] = {
+    ("welcome", "email"): {
+        "subject": "Welcome to F3 Fitness Gym! 💪",
+        "content": """<h2>Welcome to F3 Fitness 💪</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Thank you for joining F3 Fitness Gym - Jaipur's premier fitness destination.</p>
+<div class="highlight-box">
+  <strong>Your Member ID:</strong> {{member_id}}<br>
+  We're excited to be part of your fitness journey!
+</div>
+<p>Stay consistent. Stay disciplined. Your transformation starts now.</p>
+<center><a href="https://f3fitness.in" class="button">Visit Our Website</a></center>
+<div class="divider"></div>
+<p style="font-size:13px; color:#777777;">If you have any questions, feel free to reach out to us anytime.</p>"""
+    },
+    ("otp", "email"): {
+        "subject": "Your F3 Fitness OTP Code 🔐",
+        "content": """<h2>Verify Your Account 🔐</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Please use the following OTP to verify your account:</p>
+<div class="otp-code">{{otp}}</div>
+<div class="highlight-box">
+  This code will expire in 10 minutes. Do not share this code with anyone.
+</div>
+<p style="font-size:13px; color:#777777;">If you didn't request this code, please ignore this email.</p>"""
+    },
+    ("otp", "whatsapp"): {
+        "content": "🔐 Your F3 Fitness OTP is: *{{otp}}*\n\nThis code expires in 10 minutes. Do not share with anyone."
+    },
+    ("password_reset", "email"): {
+        "subject": "Reset Your F3 Fitness Password 🔑",
+        "content": """<h2>Password Reset Request 🔑</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>We received a request to reset your password. Your new temporary password is:</p>
+<div class="otp-code">{{otp}}</div>
+<div class="highlight-box">
+  Please log in with this password and change it immediately from your profile settings.
+</div>
+<p style="font-size:13px; color:#777777;">If you didn't request this, please contact us immediately.</p>"""
+    },
+    ("password_reset", "whatsapp"): {
+        "content": "🔑 Hi {{name}}, your F3 Fitness password has been reset.\n\nYour new temporary password: *{{otp}}*\n\nPlease login and change it immediately from your profile."
+    },
+    ("welcome", "whatsapp"): {
+        "content": "🏋️ Welcome to F3 Fitness Gym, {{name}}!\n\nYour Member ID: *{{member_id}}*\n\nLet's crush your fitness goals together! 💪\n\n- F3 Fitness Team"
+    },
+    ("attendance", "email"): {
+        "subject": "Attendance Marked - F3 Fitness Gym ✅",
+        "content": """<h2>Great Job, {{name}}! ✅</h2>
+<p>Your attendance has been marked for today.</p>
+<div class="highlight-box">
+  Keep showing up consistently - that's the key to achieving your fitness goals! 💪
+</div>
+<p>See you at the gym!</p>
+<p><strong>Your F3 Fitness Team</strong></p>"""
+    },
+    ("attendance", "whatsapp"): {
+        "content": "✅ Attendance marked!\n\nGreat job showing up today, {{name}}. Keep the momentum going! 🔥\n\n- F3 Fitness"
+    },
+    ("absent_warning", "email"): {
+        "subject": "We Miss You at F3 Fitness! 😢",
+        "content": """<h2>We Miss You, {{name}}! 😢</h2>
+<p>It's been <strong>{{days}} days</strong> since your last visit.</p>
+<div class="highlight-box">
+  Your fitness goals are waiting! Remember: Consistency is key to achieving your dream physique. 💪
+</div>
+<p>See you soon at the gym!</p>
+<center><a href="https://f3fitness.in" class="button">Plan Your Visit</a></center>"""
+    },
+    ("absent_warning", "whatsapp"): {
+        "content": "😢 Hey {{name}},\n\nIt's been {{days}} days since your last gym visit. Your fitness goals miss you!\n\nCome back stronger 💪\n\n- F3 Fitness Team"
+    },
+    ("birthday", "email"): {
+        "subject": "Happy Birthday from F3 Fitness! 🎂",
+        "content": """<h2>🎉 Happy Birthday, {{name}}! 🎂</h2>
+<p>Wishing you a fantastic birthday filled with health, happiness, and gains!</p>
+<div class="highlight-box">
+  Here's to another year of crushing your fitness goals! May this year bring you closer to your dream physique.
+</div>
+<p>Celebrate well and see you at the gym!</p>
+<p><strong>Your F3 Fitness Family</strong></p>"""
+    },
+    ("birthday", "whatsapp"): {
+        "content": "🎂 Happy Birthday, {{name}}! 🎉\n\nWishing you a year full of health, happiness and fitness gains!\n\nEnjoy your special day!\n\n- F3 Fitness Gym 💪"
+    },
+    ("plan_shared", "email"): {
+        "subject": "Your New {{plan_type}} Plan is Ready! 📋",
+        "content": """<h2>New {{plan_type}} Plan Ready! 📋</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Your trainer has created a new plan for you:</p>
+<div class="highlight-box">
+  <strong>Plan Type:</strong> {{plan_type}}<br>
+  <strong>Title:</strong> {{plan_title}}
+</div>
+<p>Log in to your dashboard to view the full details.</p>
+<center><a href="https://f3fitness.in/login" class="button">View Your Plan</a></center>
+<p>Let's achieve your goals together!</p>"""
+    },
+    ("plan_shared", "whatsapp"): {
+        "content": "📋 Hi {{name}}!\n\nYour trainer has created a new {{plan_type}} plan: *{{plan_title}}*\n\nCheck your F3 Fitness dashboard to view it! 💪"
+    },
+    ("renewal_reminder", "email"): {
+        "subject": "Your Membership Expires Soon! ⏰",
+        "content": """<h2>Renewal Reminder ⏰</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<div class="highlight-box">
+  Your membership expires on <strong>{{expiry_date}}</strong><br>
+  <strong>Days Remaining:</strong> {{days_left}} days
+</div>
+<p>Renew now to continue your fitness journey without interruption!</p>
+<center><a href="https://f3fitness.in/login" class="button">Renew Now</a></center>
+<p style="font-size:13px; color:#777777;">Visit the gym or renew online to keep your momentum going.</p>"""
+    },
+    ("renewal_reminder", "whatsapp"): {
+        "content": "⏰ Hi {{name}},\n\nYour F3 Fitness membership expires on *{{expiry_date}}* ({{days_left}} days left).\n\nRenew now to keep your fitness journey going! 💪\n\n- F3 Fitness"
+    },
+    ("freeze_started", "email"): {
+        "subject": "Membership Freeze Confirmed ❄️",
+        "content": """<h2>Membership Freeze Confirmed ❄️</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Your membership freeze request has been applied successfully.</p>
+<div class="highlight-box">
+  <strong>Freeze Period:</strong> {{freeze_start_date}} to {{freeze_end_date}}<br>
+  <strong>Total Freeze Days:</strong> {{freeze_days}}<br>
+  <strong>New Membership Expiry:</strong> {{new_expiry_date}}<br>
+  <strong>Freeze Fee:</strong> Rs.{{freeze_fee}}
+</div>
+<p>You can resume your workouts after the freeze period ends.</p>"""
+    },
+    ("freeze_started", "whatsapp"): {
+        "content": "❄️ Hi {{name}}, your membership has been frozen.\n\nFreeze: {{freeze_start_date}} to {{freeze_end_date}}\nDays: {{freeze_days}}\nNew Expiry: {{new_expiry_date}}\nFee: Rs.{{freeze_fee}}\n\n- F3 Fitness"
+    },
+    ("freeze_ended", "email"): {
+        "subject": "Membership Freeze Ended ✅",
+        "content": """<h2>Freeze Ended ✅</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Your membership freeze has been ended {{end_mode}}.</p>
+<div class="highlight-box">
+  <strong>Freeze End Date:</strong> {{freeze_end_date}}<br>
+  <strong>Current Membership Expiry:</strong> {{new_expiry_date}}
+</div>
+<p>Welcome back to your fitness routine! 💪</p>"""
+    },
+    ("freeze_ended", "whatsapp"): {
+        "content": "✅ Hi {{name}}, your membership freeze has been ended {{end_mode}}.\n\nFreeze ends on: {{freeze_end_date}}\nCurrent Expiry: {{new_expiry_date}}\n\nWelcome back! 💪\n- F3 Fitness"
+    },
+    ("freeze_ending_tomorrow", "email"): {
+        "subject": "Freeze Ends Tomorrow ⏰",
+        "content": """<h2>Freeze Ending Tomorrow ⏰</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Your membership freeze is ending tomorrow.</p>
+<div class="highlight-box">
+  <strong>Freeze End Date:</strong> {{freeze_end_date}}<br>
+  <strong>Membership Expiry:</strong> {{new_expiry_date}}
+</div>
+<p>We look forward to seeing you back at F3 Fitness! 💪</p>"""
+    },
+    ("freeze_ending_tomorrow", "whatsapp"): {
+        "content": "⏰ Hi {{name}}, your membership freeze ends tomorrow ({{freeze_end_date}}).\n\nCurrent Expiry: {{new_expiry_date}}\nSee you at F3 Fitness! 💪"
+    },
+    ("membership_activated", "email"): {
+        "subject": "Membership Activated! 🎉",
+        "content": """<h2>Membership Activated! 🎉</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Your membership is now active!</p>
+<div class="highlight-box">
+  <strong>Plan:</strong> {{plan_name}}<br>
+  <strong>Start Date:</strong> {{start_date}}<br>
+  <strong>End Date:</strong> {{end_date}}
+</div>
+<p>See you at the gym! 💪</p>
+<center><a href="https://f3fitness.in/login" class="button">View Dashboard</a></center>"""
+    },
+    ("membership_activated", "whatsapp"): {
+        "content": "🎉 Hi {{name}}!\n\nYour *{{plan_name}}* membership is now active!\n\n📅 Start: {{start_date}}\n📅 End: {{end_date}}\n\nLet's crush those fitness goals! 💪\n\n- F3 Fitness Gym"
+    },
+    ("payment_received", "email"): {
+        "subject": "Payment Received - F3 Fitness Gym 💰",
+        "content": """<h2>Payment Received! 💰</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Thank you for your payment. Here are the details:</p>
+<div class="highlight-box">
+  <strong>Receipt No:</strong> {{receipt_no}}<br>
+  <strong>Amount:</strong> Rs.{{amount}}<br>
+  <strong>Payment Mode:</strong> {{payment_mode}}
+</div>
+<p>Thank you for being a valued member of F3 Fitness!</p>
+<center><a href="https://f3fitness.in/login" class="button">View Receipt</a></center>"""
+    },
+    ("payment_received", "whatsapp"): {
+        "content": "💰 Hi {{name}}, payment received!\n\nReceipt: {{receipt_no}}\nAmount: Rs.{{amount}}\nMode: {{payment_mode}}\n\nThank you! - F3 Fitness Gym"
+    },
+    ("invoice_sent", "email"): {
+        "subject": "Your Invoice {{receipt_no}} - F3 Fitness 🧾",
+        "content": """<h2>Invoice Attached 🧾</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Please find your invoice PDF attached for your recent payment.</p>
+<div class="highlight-box">
+  <strong>Receipt No:</strong> {{receipt_no}}<br>
+  <strong>Amount Paid:</strong> Rs.{{amount}}<br>
+  <strong>Date:</strong> {{payment_date}}
+</div>
+<p>Thank you for being a valued member of F3 Fitness! 💪</p>"""
+    },
+    ("invoice_sent", "whatsapp"): {
+        "content": "🧾 F3 Fitness Invoice\nReceipt: {{receipt_no}}\nAmount: Rs.{{amount}}\nDate: {{payment_date}}\n\nYour invoice PDF is attached."
+    },
+    ("holiday", "email"): {
+        "subject": "Holiday Notice - F3 Fitness Gym 🏖️",
+        "content": """<h2>Holiday Notice 🏖️</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Please note that F3 Fitness Gym will be closed on:</p>
+<div class="highlight-box" style="text-align:center;">
+  <strong style="font-size:20px; color:#0891b2;">{{holiday_date}}</strong><br>
+  <span>{{holiday_reason}}</span>
+</div>
+<p>Plan your workouts accordingly. See you soon!</p>"""
+    },
+    ("holiday", "whatsapp"): {
+        "content": "🏖️ Hi {{name}},\n\nF3 Fitness Gym will be closed on *{{holiday_date}}* for {{holiday_reason}}.\n\nPlan your workouts accordingly. See you soon! 💪\n\n- F3 Fitness"
+    },
+    ("announcement", "email"): {
+        "subject": "📢 {{announcement_title}} - F3 Fitness Gym",
+        "content": """<h2>📢 {{announcement_title}}</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<div class="highlight-box">
+  {{announcement_content}}
+</div>
+<p>Stay fit, stay healthy!</p>
+<center><a href="https://f3fitness.in" class="button">Visit Website</a></center>"""
+    },
+    ("announcement", "whatsapp"): {
+        "content": "📢 *{{announcement_title}}*\n\nHi {{name}},\n\n{{announcement_content}}\n\n- F3 Fitness Gym"
+    },
+    ("new_user_credentials", "email"): {
+        "subject": "F3 Fitness Account Details (Service Message)",
+        "content": """<h2>F3 Fitness Account Created ✅</h2>
+<p>Hi <strong>{{name}}</strong>,</p>
+<p>Your member account has been created successfully. Use these login details:</p>
+<div class="highlight-box">
+  <strong>Member ID:</strong> {{member_id}}<br>
+  <strong>Email:</strong> {{email}}<br>
+  <strong>Password:</strong> <code style="color:#dc2626; font-weight:700;">{{password}}</code>
+</div>
+<p style="color:#dc2626; font-weight:500;">⚠️ Please change your password after your first login.</p>
+<center><a href="https://f3fitness.in/login" class="button">Login Now</a></center>
+<p style="font-size:13px; color:#777777;">This is an important service message from F3 Fitness.</p>"""
+    },
+    ("new_user_credentials", "whatsapp"): {
+        "content": "Hello {{name}},\n\nYour F3 Fitness member account has been created successfully.\n\nMember ID: {{member_id}}\nEmail: {{email}}\nPassword: {{password}}\n\nLogin: https://f3fitness.in/login\n\nPlease change your password after first login.\n\n- F3 Fitness Health Club"
+    },
+    ("test_email", "email"): {
+        "subject": "F3 Fitness Gym - Test Email ✅",
+        "content": """<h2>SMTP Test Successful! ✅</h2>
+<p>This is a test email from F3 Fitness Gym.</p>
+<div class="highlight-box">
+  Your SMTP configuration is working correctly.<br>
+  You can now send emails to your members!
+</div>
+<p>Keep motivating your members! 💪</p>"""
+    }
+}
+
+EMPTY_TEMPLATE = {"subject": "", "content": ""}
+
+# Same boundaries str.replace("{{key}}") would find: "{{{name}}}" -> "{" + name + "}"
+_PLACEHOLDER = re.compile(r"\{\{([^{}]*)\}\}")
+COMPILE_CACHE_SIZE = 512
+
+
+def compile_template(text: str) -> Tuple[tuple, tuple]:
+    """Split ``text`` into literal chunks and ``{{key}}`` names.
+
+    Returns ``(literals, keys)`` with ``len(literals) == len(keys) + 1``.
+    """
+    literals: List[str] = []
+    keys: List[str] = []
+    position = 0
+    for match in _PLACEHOLDER.finditer(text or ""):
+        literals.append(text[position:match.start()])
+        keys.append(match.group(1))
+        position = match.end()
+    literals.append((text or "")[position:])
+    return tuple(literals), tuple(keys)
+
+
+def render_compiled(compiled: Tuple[tuple, tuple], variables: dict) -> str:
+    """Fill a compiled template; unknown ``{{key}}`` placeholders are left as-is."""
+    literals, keys = compiled
+    if not keys:
+        return literals[0]
+    parts = [literals[0]]
+    for index, key in enumerate(keys):
+        if key in variables:
+            parts.append(str(variables[key]))
+        else:
+            parts.append("{{" + key + "}}")
+        parts.append(literals[index + 1])
+    return "".join(parts)
+
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def compile_cached(text: str) -> Tuple[tuple, tuple]:
+    """``compile_template`` memoized on the template text (results are immutable)."""
+    return compile_template(text)
+
+
+def render_template(text: str, variables: dict) -> str:
+    """Single-pass ``{{key}}`` substitution for an arbitrary template string."""
+    return render_compiled(compile_cached(text or ""), variables)
+
+
+class CompiledTemplate:
+    """A template document with its subject and content pre-compiled."""
+
+    __slots__ = ("doc", "_subject", "_content")
+
+    def __init__(self, doc: dict):
+        self.doc = doc
+        self._subject = compile_template(doc.get("subject") or "")
+        self._content = compile_template(doc.get("content") or "")
+
+    @property
+    def subject(self) -> str:
+        return self.doc.get("subject") or ""
+
+    @property
+    def content(self) -> str:
+        return self.doc.get("content") or ""
+
+    def render_subject(self, variables: dict, default: str = "") -> str:
+        if not self.subject:
+            return render_compiled(compile_cached(default), variables) if default else ""
+        return render_compiled(self._subject, variables)
+
+    def render_content(self, variables: dict) -> str:
+        return render_compiled(self._content, variables)
+
+
+class TemplateRegistry:
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = float(ttl)
+        self._compiled: Dict[Tuple[str, str], CompiledTemplate] = {}
+        self._overrides: Optional[Dict[Tuple[str, str], dict]] = None
+        self._loaded_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.loads = 0
+
+    def invalidate(self) -> None:
+        self._overrides = None
+        self._compiled = {}
+
+    async def _ensure_loaded(self, db) -> None:
+        if self._overrides is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._overrides is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            docs = await db.templates.find({}, {"_id": 0}).to_list(1000)
+            self._overrides = {(d.get("template_type"), d.get("channel")): d for d in docs}
+            self._compiled = {}
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    async def get(self, db, template_type: str, channel: str) -> CompiledTemplate:
+        await self._ensure_loaded(db)
+        key = (template_type, channel)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            doc = self._overrides.get(key) or DEFAULT_TEMPLATES.get(key) or EMPTY_TEMPLATE
+            compiled = CompiledTemplate(doc)
+            self._compiled[key] = compiled
+        return compiled
+
+    async def overrides(self, db) -> List[dict]:
+        await self._ensure_loaded(db)
+        return [dict(doc) for doc in self._overrides.values()]
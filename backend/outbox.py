@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+"""Durable outbox for outgoing notifications (email, WhatsApp).
+
+Request handlers ``enqueue()`` a job document instead of talking to a
+provider; a dispatcher started from the app lifespan claims due jobs and
+runs them on a bounded pool of tasks. A job document looks like::
+
+    {id, channel, provider, payload, idempotency_key, batch_id, priority,
+     status, attempts, max_attempts, next_attempt_at, locked_until,
+     last_error, created_at, updated_at, sent_at, finished_at}
+
+``status`` moves pending -> processing -> sent, or back to pending with an
+exponential backoff when the handler fails, and finally to ``dead`` once
+``max_attempts`` is used up. A handler raising ``PermanentFailure`` (invalid
+recipient, missing template) goes to ``dead`` at once, since retrying cannot
+help. One raising ``ProviderUnavailable`` (provider not configured yet) is
+put back for ``backoff_max`` seconds without using up an attempt, so a gap
+in the settings does not dead-letter the queue. Dead jobs stay in the
+collection (the dead letter queue) until an admin retries them or
+retention removes them.
+
+A sent job's payload is dropped (it can hold OTPs, passwords and rendered
+invoices), and every job that reaches a final status (sent, dead,
+cancelled) gets ``finished_at``, which the retention TTL index ages out.
+
+Concurrency is capped three ways: ``workers`` in total, per channel and per
+provider (e.g. one Evolution session at a time). A provider can also have a
+token-bucket rate limit (messages/second with a burst). The caps are per
+process; claiming is an atomic ``find_one_and_update`` so several
+workers/processes never run the same job. A job whose worker died is picked
+up again after its lease (``locked_until``) expires, which makes delivery
+at-least-once.
+
+Jobs are claimed by ``priority`` (lower first), then due time, so bulk sends
+(PRIORITY_BULK) never delay transactional ones queued behind them. Jobs that
+share a ``batch_id`` (one broadcast) can be held, released and cancelled
+together: held jobs are simply not claimable. A whole provider can be paused
+the same way (``pause_provider``), e.g. while its session is known to be
+down; its jobs wait without using up attempts.
+
+``idempotency_key`` is unique (sparse) in the collection: enqueueing the same
+key twice returns the existing job instead of sending twice.
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "notification_outbox"
+JOB_STATUSES = ("pending", "processing", "sent", "dead", "held", "cancelled")
+PRIORITY_TRANSACTIONAL = 0
+PRIORITY_BULK = 10
+
+FINAL_STATUSES = ("sent", "dead", "cancelled")
+
+Handler = Callable[[dict], Awaitable[Any]]
+
+
+class PermanentFailure(Exception):
+    """Raised by a handler when a retry cannot succeed; the job is dead-lettered at once."""
+
+
+class ProviderUnavailable(Exception):
+    """Raised by a handler when the provider cannot be used right now (e.g. not configured);
+    the job waits ``backoff_max`` seconds and the attempt is not counted."""
+
+
+def parse_limits(spec: Optional[str], cast=int) -> Dict[str, Any]:
+    """``"smtp=4,evolution=1"`` -> ``{"smtp": 4, "evolution": 1}`` (bad entries are skipped)."""
+    limits = {}
+    for item in (spec or "").split(","):
+        name, _, value = item.partition("=")
+        try:
+            limits[name.strip().lower()] = cast(value.strip())
+        except ValueError:
+            continue
+    limits.pop("", None)
+    return limits
+
+
+def parse_rates(spec: Optional[str]) -> Dict[str, Tuple[float, int]]:
+    """``"evolution=1.6,smtp=20:40"`` -> ``{provider: (per_second, burst)}``; burst defaults to 1."""
+    rates = {}
+    for name, value in parse_limits(spec, str).items():
+        rate, _, burst = value.partition(":")
+        try:
+            rates[name] = (float(rate), int(burst or 1))
+        except ValueError:
+            continue
+    return rates
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``; one token per send."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = max(float(rate), 1e-6)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def ready(self, now: Optional[float] = None) -> bool:
+        self._refill(time.monotonic() if now is None else now)
+        return self.tokens >= 1
+
+    def take(self, now: Optional[float] = None) -> None:
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= 1
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        """Seconds until the next token is available (0 if one is)."""
+        self._refill(time.monotonic() if now is None else now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Outbox:
+    def __init__(self, collection_getter: Callable[[], Any], name: str = "outbox", workers: int = 8,
+                 channel_limits: Optional[Dict[str, int]] = None,
+                 provider_limits: Optional[Dict[str, int]] = None,
+                 provider_rates: Optional[Dict[str, Tuple[float, int]]] = None,
+                 max_attempts: int = 5, backoff_base: float = 5.0, backoff_max: float = 900.0,
+                 lease_seconds: float = 300.0, send_timeout: float = 120.0, poll_interval: float = 1.0):
+        # Resolved lazily so tests/scripts can swap the database after import
+        self._collection_getter = collection_getter
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.channel_limits = dict(channel_limits or {})
+        self.provider_limits = dict(provider_limits or {})
+        self.provider_rates = dict(provider_rates or {})
+        self._buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in self.provider_rates.items()}
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.lease_seconds = float(lease_seconds)
+        self.send_timeout = float(send_timeout)
+        self.poll_interval = float(poll_interval)
+        self._handlers: Dict[str, Handler] = {}
+        self._inflight: set = set()
+        self._channel_inflight: Dict[str, int] = defaultdict(int)
+        self._provider_inflight: Dict[str, int] = defaultdict(int)
+        self._paused_providers: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.counters: Dict[str, int] = {
+            "enqueued": 0, "deduplicated": 0, "sent": 0, "retried": 0, "dead": 0, "permanent_failures": 0,
+            "deferred": 0, "claimed": 0,
+        }
+
+    @property
+    def collection(self):
+        return self._collection_getter()
+
+    def register(self, channel: str, handler: Handler) -> None:
+        """``handler(payload)`` delivers one job; a falsy result or an exception is a failure
+        (retried, unless it is a ``PermanentFailure`` or ``ProviderUnavailable``)."""
+        self._handlers[channel] = handler
+
+    # ---- producer side ----
+
+    def _job(self, channel: str, payload: dict, provider: str, idempotency_key: Optional[str],
+             max_attempts: Optional[int], delay: float, batch_id: Optional[str] = None,
+             priority: int = PRIORITY_TRANSACTIONAL) -> dict:
+        now = _utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "channel": channel,
+            "provider": (provider or "default").lower(),
+            "payload": payload,
+            "priority": int(priority),
+            "status": "pending",
+            "attempts": 0,
+            "max_attempts": int(max_attempts or self.max_attempts),
+            "next_attempt_at": now + timedelta(seconds=max(0.0, delay)),
+            "locked_until": None,
+            "last_error": None,
+            "created_at": now,
+            "updated_at": now,
+            "sent_at": None,
+            "finished_at": None,
+        }
+        if idempotency_key:
+            job["idempotency_key"] = idempotency_key
+        if batch_id:
+            job["batch_id"] = batch_id
+        return job
+
+    async def enqueue(self, channel: str, payload: dict, provider: str = "default",
+                      idempotency_key: Optional[str] = None, max_attempts: Optional[int] = None,
+                      delay: float = 0.0) -> str:
+        """Persist a job and wake the dispatcher; returns the job id.
+
+        A duplicate ``idempotency_key`` returns the id of the job already queued.
+        """
+        job = self._job(channel, payload, provider, idempotency_key, max_attempts, delay)
+        try:
+            await self.collection.insert_one(job)
+        except DuplicateKeyError:
+            self.counters["deduplicated"] += 1
+            existing = await self.collection.find_one({"idempotency_key": idempotency_key}, {"_id": 0, "id": 1})
+            return existing["id"] if existing else job["id"]
+        self.counters["enqueued"] += 1
+        self._notify()
+        return job["id"]
+
+    async def enqueue_many(self, jobs: Iterable[dict]) -> int:
+        """Bulk ``enqueue``; each item has ``channel``, ``payload`` and optionally
+        ``provider``/``idempotency_key``/``max_attempts``/``delay``/``batch_id``/``priority``.
+        Returns jobs inserted."""
+        docs = [
+            self._job(j["channel"], j["payload"], j.get("provider", "default"), j.get("idempotency_key"),
+                      j.get("max_attempts"), j.get("delay", 0.0), j.get("batch_id"),
+                      j.get("priority", PRIORITY_TRANSACTIONAL))
+            for j in jobs
+        ]
+        if not docs:
+            return 0
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+            inserted = len(docs)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            inserted = len(docs) - len(errors)
+            self.counters["deduplicated"] += len(errors)
+        self.counters["enqueued"] += inserted
+        self._notify()
+        return inserted
+
+    def _notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def pause_provider(self, provider: str) -> None:
+        """Stop claiming ``provider`` jobs until ``resume_provider``."""
+        if provider not in self._paused_providers:
+            logger.info(f"{self.name}: pausing {provider} jobs")
+            self._paused_providers.add(provider)
+
+    def resume_provider(self, provider: str) -> None:
+        if provider in self._paused_providers:
+            logger.info(f"{self.name}: resuming {provider} jobs")
+            self._paused_providers.discard(provider)
+            self._notify()
+
+    # ---- lifecycle ----
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._dispatch_loop())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Stop claiming and give in-flight sends ``timeout`` seconds to finish.
+
+        Anything still running is cancelled; its lease expires and another
+        process (or the next start) picks it up again.
+        """
+        self._stopping = True
+        self._notify()
+        if self._task is not None:
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight:
+            done, pending = await asyncio.wait(set(self._inflight), timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+    # ---- dispatching ----
+
+    def _saturated(self, inflight: Dict[str, int], limits: Dict[str, int]) -> List[str]:
+        return [name for name, limit in limits.items() if inflight[name] >= limit]
+
+    def _rate_limited(self, now: float) -> List[str]:
+        return [name for name, bucket in self._buckets.items() if not bucket.ready(now)]
+
+    async def _claim(self) -> Optional[dict]:
+        now = _utcnow()
+        query: Dict[str, Any] = {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "processing", "locked_until": {"$lt": now}},
+        ]}
+        busy_channels = self._saturated(self._channel_inflight, self.channel_limits)
+        busy_providers = self._saturated(self._provider_inflight, self.provider_limits)
+        busy_providers += self._rate_limited(time.monotonic())
+        busy_providers += sorted(self._paused_providers)
+        query["channel"] = {"$in": [c for c in self._handlers if c not in busy_channels]}
+        if busy_providers:
+            query["provider"] = {"$nin": busy_providers}
+        if not query["channel"]["$in"]:
+            return None
+        job = await self.collection.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": "processing",
+                    "locked_until": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            projection={"_id": 0},
+            sort=[("priority", 1), ("next_attempt_at", 1)],
+        )
+        if job:
+            job["attempts"] = job.get("attempts", 0) + 1  # returned document is pre-update
+            self.counters["claimed"] += 1
+        return job
+
+    def _next_wait(self) -> float:
+        now = time.monotonic()
+        waits = [bucket.wait_time(now) for bucket in self._buckets.values() if not bucket.ready(now)]
+        return max(0.01, min([self.poll_interval, *waits]))
+
+    async def _dispatch_loop(self) -> None:
+        while not self._stopping:
+            job = None
+            if len(self._inflight) < self.workers:
+                try:
+                    job = await self._claim()
+                except Exception as e:
+                    logger.error(f"{self.name}: claim failed: {e}")
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_wait())
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            self._start_job(job)
+
+    def _start_job(self, job: dict) -> None:
+        channel, provider = job.get("channel"), job.get("provider")
+        self._channel_inflight[channel] += 1
+        self._provider_inflight[provider] += 1
+        bucket = self._buckets.get(provider)
+        if bucket is not None:
+            bucket.take()
+        task = asyncio.get_running_loop().create_task(self._run_job(job))
+        self._inflight.add(task)
+
+        def _done(t: asyncio.Task) -> None:
+            self._inflight.discard(t)
+            self._channel_inflight[channel] -= 1
+            self._provider_inflight[provider] -= 1
+            self._notify()
+
+        task.add_done_callback(_done)
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds before retry ``attempts + 1``: exponential, capped, +/-20% jitter."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _run_job(self, job: dict) -> None:
+        handler = self._handlers.get(job.get("channel"))
+        error = None
+        permanent = deferred = False
+        try:
+            result = await asyncio.wait_for(handler(job.get("payload") or {}), timeout=self.send_timeout)
+            if not result:
+                error = "provider reported failure"
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            error = f"send timed out after {self.send_timeout:.0f}s"
+        except PermanentFailure as e:
+            error = str(e) or e.__class__.__name__
+            permanent = True
+        except ProviderUnavailable as e:
+            error = str(e) or e.__class__.__name__
+            deferred = True
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+
+        now = _utcnow()
+        unset = {"after_attempt": ""}
+        if error is None:
+            update = {"status": "sent", "sent_at": now, "finished_at": now, "locked_until": None, "last_error": None}
+            unset["payload"] = ""
+            self.counters["sent"] += 1
+        elif permanent or job["attempts"] >= job.get("max_attempts", self.max_attempts):
+            update = {"status": "dead", "finished_at": now, "locked_until": None, "last_error": error}
+            self.counters["dead"] += 1
+            if permanent:
+                self.counters["permanent_failures"] += 1
+                logger.warning(f"{self.name}: job {job['id']} ({job.get('channel')}) dead, not retryable: {error}")
+            else:
+                logger.warning(f"{self.name}: job {job['id']} ({job.get('channel')}) dead after {job['attempts']} attempts: {error}")
+        elif deferred:
+            update = {
+                "status": "pending",
+                "locked_until": None,
+                "last_error": error,
+                "next_attempt_at": now + timedelta(seconds=self.backoff_max),
+                # Claiming counted an attempt the provider never saw
+                "attempts": job["attempts"] - 1,
+            }
+            self.counters["deferred"] += 1
+        else:
+            update = {
+                "status": "pending",
+                "locked_until": None,
+                "last_error": error,
+                "next_attempt_at": now + timedelta(seconds=self.backoff(job["attempts"])),
+            }
+            self.counters["retried"] += 1
+        update["updated_at"] = now
+        query = {"id": job["id"], "status": "processing"}
+        try:
+            if update["status"] == "pending" and job.get("batch_id"):
+                # A hold/cancel that arrived while this job was in flight wins over the retry
+                current = await self.collection.find_one(query, {"_id": 0, "after_attempt": 1})
+                if current and current.get("after_attempt"):
+                    update["status"] = current["after_attempt"]
+                    if update["status"] == "cancelled":
+                        update["finished_at"] = now
+                        unset["payload"] = ""
+            await self.collection.update_one(query, {"$set": update, "$unset": unset})
+        except Exception as e:
+            logger.error(f"{self.name}: could not record result of job {job['id']}: {e}")
+
+    # ---- admin ----
+
+    async def retry(self, job_id: str) -> bool:
+        """Move a dead job back to pending with a fresh attempt budget."""
+        now = _utcnow()
+        result = await self.collection.update_one(
+            {"id": job_id, "status": "dead"},
+            {"$set": {"status": "pending", "attempts": 0, "next_attempt_at": now, "updated_at": now,
+                      "finished_at": None}},
+        )
+        if result.modified_count:
+            self._notify()
+        return bool(result.modified_count)
+
+    async def _move_batch(self, batch_id: str, from_statuses: List[str], to_status: str) -> int:
+        now = _utcnow()
+        update: Dict[str, Any] = {"$set": {"status": to_status, "updated_at": now}}
+        if to_status in FINAL_STATUSES:
+            update["$set"]["finished_at"] = now
+            update["$unset"] = {"payload": ""}
+        result = await self.collection.update_many(
+            {"batch_id": batch_id, "status": {"$in": from_statuses}}, update,
+        )
+        # In-flight jobs finish; if they fail they land here instead of pending
+        in_flight = {"batch_id": batch_id, "status": "processing"}
+        if to_status == "pending":
+            await self.collection.update_many(in_flight, {"$unset": {"after_attempt": ""}})
+        else:
+            await self.collection.update_many(in_flight, {"$set": {"after_attempt": to_status}})
+        return result.modified_count
+
+    async def hold_batch(self, batch_id: str) -> int:
+        """Park a batch's unsent jobs; in-flight sends still finish."""
+        return await self._move_batch(batch_id, ["pending"], "held")
+
+    async def release_batch(self, batch_id: str) -> int:
+        released = await self._move_batch(batch_id, ["held"], "pending")
+        if released:
+            self._notify()
+        return released
+
+    async def cancel_batch(self, batch_id: str) -> int:
+        return await self._move_batch(batch_id, ["pending", "held"], "cancelled")
+
+    async def batch_counts(self, batch_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """``{batch_id: {status: count}}`` for the given batches."""
+        counts: Dict[str, Dict[str, int]] = {batch_id: {} for batch_id in batch_ids}
+        pipeline = [
+            {"$match": {"batch_id": {"$in": list(batch_ids)}}},
+            {"$group": {"_id": {"batch_id": "$batch_id", "status": "$status"}, "count": {"$sum": 1}}},
+        ]
+        async for row in self.collection.aggregate(pipeline):
+            key = row["_id"]
+            counts.setdefault(key.get("batch_id"), {})[key.get("status")] = row["count"]
+        return counts
+
+    async def status_counts(self) -> Dict[str, Dict[str, int]]:
+        """``{channel: {status: count}}`` across the collection."""
+        counts: Dict[str, Dict[str, int]] = {}
+        pipeline = [{"$group": {"_id": {"channel": "$channel", "status": "$status"}, "count": {"$sum": 1}}}]
+        async for row in self.collection.aggregate(pipeline):
+            key = row["_id"]
+            counts.setdefault(key.get("channel"), {})[key.get("status")] = row["count"]
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "running": self._task is not None and not self._task.done(),
+            "workers": self.workers,
+            "in_flight": len(self._inflight),
+            "in_flight_by_channel": {k: v for k, v in self._channel_inflight.items() if v},
+            "in_flight_by_provider": {k: v for k, v in self._provider_inflight.items() if v},
+            "channel_limits": self.channel_limits,
+            "provider_limits": self.provider_limits,
+            "paused_providers": sorted(self._paused_providers),
+            "provider_rates": {name: {"per_second": rate, "burst": burst} for name, (rate, burst) in self.provider_rates.items()},
+            **self.counters,
+        }
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Keyset (cursor) pagination helpers.
+
+Lists are sorted newest first on a timestamp-like field with ``id`` as the
+tie-breaker, so a page boundary is the ``(sort_value, id)`` pair of the last
+row returned. Cursors are opaque URL-safe tokens; clients just echo back
+what the previous page handed them.
+"""
+import base64
+import json
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(sort_value: Any, doc_id: Any) -> str:
+    raw = json.dumps([sort_value, doc_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[Any, Any]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        sort_value, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return sort_value, doc_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def keyset_filter(field: str, token: Optional[str], id_field: str = "id") -> dict:
+    """Mongo filter selecting rows strictly after ``token`` in (field desc, id desc) order."""
+    if not token:
+        return {}
+    sort_value, doc_id = decode_cursor(token)
+    return {"$or": [
+        {field: {"$lt": sort_value}},
+        {field: sort_value, id_field: {"$lt": doc_id}},
+    ]}
+
+
+def keyset_sort(field: str, id_field: str = "id") -> List[Tuple[str, int]]:
+    return [(field, -1), (id_field, -1)]
+
+
+def merge_filters(query: dict, extra: dict) -> dict:
+    """AND ``extra`` into ``query`` without clobbering an existing ``$or``."""
+    if not extra:
+        return query
+    if not query:
+        return extra
+    return {"$and": [query, extra]}
+
+
+def next_cursor(rows: List[dict], limit: int, field: str, id_field: str = "id") -> Optional[str]:
+    """Cursor for the page after ``rows`` (fetched with ``limit + 1``), or None.
+
+    Trims the look-ahead row from ``rows`` in place.
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = rows[-1]
+    return encode_cursor(last.get(field), last.get(id_field))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""bcrypt hashing/verification off the event loop.
+
+bcrypt is deliberately slow (~250ms per call at the default cost), and the
+``bcrypt`` wheel releases the GIL while it works, so running it on a small
+thread pool keeps the uvicorn worker free to serve other requests while a
+burst of logins is in flight.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+
+def _hash_sync(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+
+
+def _verify_sync(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+    except ValueError:
+        # Malformed/legacy hash in the database: treat as a failed login
+        return False
+
+
+class PasswordService:
+    """Async facade over bcrypt backed by a dedicated ThreadPoolExecutor."""
+
+    def __init__(self, max_workers: Optional[int] = None, rounds: int = 12):
+        self.max_workers = max(1, int(max_workers or min(4, os.cpu_count() or 1)))
+        self.rounds = int(rounds)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def hash(self, password: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _hash_sync, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        if not hashed:
+            return False
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _verify_sync, password, hashed)
+
+    def hash_sync(self, password: str) -> str:
+        """Blocking variant for scripts and code that is not running on the loop."""
+        return _hash_sync(password, self.rounds)
+
+    def verify_sync(self, password: str, hashed: str) -> bool:
+        return _verify_sync(password, hashed)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def password_service_from_env() -> PasswordService:
+    return PasswordService(
+        max_workers=int(os.environ.get("PASSWORD_HASH_WORKERS", "0")) or None,
+        rounds=int(os.environ.get("BCRYPT_ROUNDS", "12")),
+    )
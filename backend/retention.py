@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""Retention for the operational collections (delivery/activity logs, OTPs).
+
+Every document written to these collections carries ``stored_at`` - a real
+BSON date (the older ISO ``timestamp`` strings cannot back a TTL index).
+Each collection has a policy, configurable per deployment::
+
+    RETENTION_EMAIL_LOGS_DAYS=90     (0 keeps documents forever)
+    RETENTION_WHATSAPP_LOGS_DAYS=90
+    RETENTION_ACTIVITY_LOGS_DAYS=365
+    RETENTION_OTPS_DAYS=1
+    RETENTION_NOTIFICATION_OUTBOX_DAYS=14
+    RETENTION_ARCHIVE_DIR=backend/archives
+    RETENTION_ARCHIVE_GRACE_DAYS=3
+
+Two mechanisms enforce it:
+
+* the nightly archiver (``archive_expired``) streams documents older than
+  ``days`` into gzip-compressed NDJSON under the archive directory and
+  deletes each batch once it is on disk
+* a TTL index on ``stored_at`` is the backstop; for archived collections
+  it fires ``grace_days`` later, so the archiver always gets there first
+
+Documents from before ``stored_at`` existed are matched on their legacy
+string field (``timestamp`` / ``expires_at``), which sorts chronologically.
+
+The notification outbox is aged on ``finished_at`` instead, which only jobs
+that reached a final status (sent, dead, cancelled) carry; queued jobs are
+never expired.
+The archiver takes a lease in ``maintenance_locks`` so only one worker runs
+it per day.
+
+    python retention.py --run        # archive now
+"""
+import asyncio
+import gzip
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bson import json_util
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+STORED_AT = "stored_at"
+LOCKS_COLLECTION = "maintenance_locks"
+DEFAULT_ARCHIVE_DIR = Path(__file__).parent / "archives"
+_JSON_OPTIONS = json_util.JSONOptions(json_mode=json_util.JSONMode.RELAXED, tz_aware=True)
+
+
+class RetentionPolicy:
+    __slots__ = ("collection", "days", "archive", "legacy_field", "grace_days", "field", "legacy_match",
+                 "legacy_is_date")
+
+    def __init__(self, collection: str, days: int, archive: bool = True, legacy_field: str = "timestamp",
+                 grace_days: int = 3, field: str = STORED_AT, legacy_match: Optional[dict] = None,
+                 legacy_is_date: bool = False):
+        """``field`` is the BSON date the TTL index and the archiver age documents on;
+        documents without it fall back to ``legacy_field`` (an ISO string unless
+        ``legacy_is_date``), restricted to ``legacy_match``."""
+        self.collection = collection
+        self.days = max(0, int(days))
+        self.archive = bool(archive)
+        self.legacy_field = legacy_field
+        self.grace_days = max(0, int(grace_days))
+        self.field = field
+        self.legacy_match = dict(legacy_match or {})
+        self.legacy_is_date = bool(legacy_is_date)
+
+    @property
+    def ttl_seconds(self) -> Optional[int]:
+        if not self.days:
+            return None
+        return (self.days + (self.grace_days if self.archive else 0)) * 86400
+
+    def cutoff(self, now: datetime) -> datetime:
+        return now - timedelta(days=self.days)
+
+    def expired_filter(self, now: datetime) -> dict:
+        cutoff = self.cutoff(now)
+        legacy_cutoff = cutoff if self.legacy_is_date else cutoff.isoformat()
+        return {"$or": [
+            {self.field: {"$lt": cutoff}},
+            {**self.legacy_match, self.field: {"$exists": False}, self.legacy_field: {"$lt": legacy_cutoff}},
+        ]}
+
+    def as_dict(self) -> dict:
+        return {
+            "collection": self.collection,
+            "days": self.days,
+            "archive": self.archive,
+            "field": self.field,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+def policies_from_env() -> Dict[str, RetentionPolicy]:
+    grace = int(os.environ.get("RETENTION_ARCHIVE_GRACE_DAYS", "3"))
+    archive = os.environ.get("RETENTION_ARCHIVE_ENABLED", "true").lower() not in ("0", "false", "no")
+    policies = [
+        RetentionPolicy("email_logs", int(os.environ.get("RETENTION_EMAIL_LOGS_DAYS", "90")), archive, grace_days=grace),
+        RetentionPolicy("whatsapp_logs", int(os.environ.get("RETENTION_WHATSAPP_LOGS_DAYS", "90")), archive, grace_days=grace),
+        RetentionPolicy("activity_logs", int(os.environ.get("RETENTION_ACTIVITY_LOGS_DAYS", "365")), archive, grace_days=grace),
+        # OTPs are short-lived secrets: expire them, never archive them
+        RetentionPolicy("otps", int(os.environ.get("RETENTION_OTPS_DAYS", "1")), archive=False, legacy_field="expires_at"),
+        # Finished outbox jobs (their payloads can hold OTPs, passwords and invoices) are deleted too
+        RetentionPolicy(
+            "notification_outbox", int(os.environ.get("RETENTION_NOTIFICATION_OUTBOX_DAYS", "14")), archive=False,
+            field="finished_at", legacy_field="updated_at", legacy_is_date=True,
+            legacy_match={"status": {"$in": ["sent", "dead", "cancelled"]}},
+        ),
+    ]
+    return {policy.collection: policy for policy in policies}
+
+
+RETENTION_POLICIES = policies_from_env()
+
+
+def ttl_index_models(policies: Dict[str, RetentionPolicy] = RETENTION_POLICIES) -> Dict[str, List[IndexModel]]:
+    """TTL index declarations for db_indexes.INDEX_SPECS."""
+    return {
+        name: [IndexModel([(policy.field, ASCENDING)], name=f"{name}_{policy.field}_ttl",
+                          expireAfterSeconds=policy.ttl_seconds)]
+        for name, policy in policies.items() if policy.ttl_seconds
+    }
+
+
+def archive_dir() -> Path:
+    return Path(os.environ.get("RETENTION_ARCHIVE_DIR") or DEFAULT_ARCHIVE_DIR)
+
+
+def _write_lines(handle, docs: List[dict]) -> None:
+    handle.write("".join(json_util.dumps(doc, json_options=_JSON_OPTIONS) + "\n" for doc in docs).encode("utf-8"))
+    handle.flush()
+    os.fsync(handle.fileno())
+
+
+async def archive_collection(db, policy: RetentionPolicy, now: datetime, directory: Path, batch_size: int = 1000,
+                             transform: Optional[Callable[[List[dict]], Awaitable[Any]]] = None) -> dict:
+    """Stream expired documents to ``<dir>/<collection>/<collection>-<stamp>.ndjson.gz``, deleting as it goes.
+
+    Each batch is fsynced before it is deleted; a crash leaves a ``.part``
+    file holding everything deleted so far.
+    """
+    collection = db[policy.collection]
+    result = {"collection": policy.collection, "archived": 0, "deleted": 0, "file": None}
+    cursor = collection.find(policy.expired_filter(now)).sort("_id", ASCENDING).batch_size(batch_size)
+    target_dir = directory / policy.collection
+    final_path = target_dir / f"{policy.collection}-{now.strftime('%Y%m%d-%H%M%S')}.ndjson.gz"
+    part_path = final_path.with_name(final_path.name + ".part")
+    handle = None
+    batch: List[dict] = []
+
+    async def _flush_batch():
+        nonlocal handle
+        if handle is None:
+            await asyncio.to_thread(target_dir.mkdir, parents=True, exist_ok=True)
+            handle = await asyncio.to_thread(gzip.open, part_path, "wb")
+        ids = [doc["_id"] for doc in batch]
+        if transform is not None:
+            await transform(batch)
+        await asyncio.to_thread(_write_lines, handle, batch)
+        result["archived"] += len(batch)
+        deleted = await collection.delete_many({"_id": {"$in": ids}})
+        result["deleted"] += deleted.deleted_count
+
+    try:
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                await _flush_batch()
+                batch = []
+        if batch:
+            await _flush_batch()
+    finally:
+        if handle is not None:
+            await asyncio.to_thread(handle.close)
+    if handle is not None:
+        await asyncio.to_thread(os.replace, part_path, final_path)
+        result["file"] = str(final_path)
+    return result
+
+
+async def delete_expired(db, policy: RetentionPolicy, now: datetime) -> dict:
+    deleted = await db[policy.collection].delete_many(policy.expired_filter(now))
+    return {"collection": policy.collection, "archived": 0, "deleted": deleted.deleted_count, "file": None}
+
+
+async def archive_expired(db, policies: Dict[str, RetentionPolicy] = RETENTION_POLICIES,
+                          directory: Optional[Path] = None, now: Optional[datetime] = None,
+                          transforms: Optional[Dict[str, Callable[[List[dict]], Awaitable[Any]]]] = None) -> List[dict]:
+    """Apply every policy once: archive-then-delete, or plain delete when not archived."""
+    now = now or datetime.now(timezone.utc)
+    directory = directory or archive_dir()
+    transforms = transforms or {}
+    results = []
+    for policy in policies.values():
+        if not policy.days:
+            continue
+        try:
+            if policy.archive:
+                results.append(await archive_collection(db, policy, now, directory,
+                                                        transform=transforms.get(policy.collection)))
+            else:
+                results.append(await delete_expired(db, policy, now))
+        except Exception as e:
+            logger.error(f"Retention for {policy.collection} failed: {e}")
+            results.append({"collection": policy.collection, "error": str(e)})
+    return results
+
+
+async def sweep_orphan_bodies(db, logs_collection: str, bodies_collection: str, older_than: datetime,
+                              batch_size: int = 1000) -> int:
+    """Delete stored bodies created before ``older_than`` that no log references any more."""
+    removed = 0
+    batch: List[str] = []
+
+    async def _sweep():
+        referenced = set(await db[logs_collection].distinct("body_ref.hash", {"body_ref.hash": {"$in": batch}}))
+        orphans = [h for h in batch if h not in referenced]
+        if not orphans:
+            return 0
+        return (await db[bodies_collection].delete_many({"_id": {"$in": orphans}})).deleted_count
+
+    async for doc in db[bodies_collection].find({"created_at": {"$lt": older_than}}, {"_id": 1}).batch_size(batch_size):
+        batch.append(doc["_id"])
+        if len(batch) >= batch_size:
+            removed += await _sweep()
+            batch = []
+    if batch:
+        removed += await _sweep()
+    return removed
+
+
+async def _storage_stats(db, name: str) -> dict:
+    try:
+        stats = await db[name].aggregate([{"$collStats": {"storageStats": {}}}]).to_list(1)
+        return stats[0]["storageStats"]
+    except Exception:
+        # Older servers / restricted roles: the collStats command
+        return await db.command("collStats", name)
+
+
+async def collection_sizes(db) -> dict:
+    """Document count and on-disk sizes per collection, largest first (bytes)."""
+    rows = []
+    for name in await db.list_collection_names():
+        if name.startswith("system."):
+            continue
+        try:
+            stats = await _storage_stats(db, name)
+        except Exception as e:
+            rows.append({"collection": name, "error": str(e)})
+            continue
+        rows.append({
+            "collection": name,
+            "count": int(stats.get("count") or 0),
+            "size": int(stats.get("size") or 0),
+            "storage_size": int(stats.get("storageSize") or 0),
+            "index_size": int(stats.get("totalIndexSize") or 0),
+        })
+    rows.sort(key=lambda row: row.get("storage_size", 0) + row.get("index_size", 0), reverse=True)
+    totals = {field: sum(row.get(field, 0) for row in rows) for field in ("count", "size", "storage_size", "index_size")}
+    return {"collections": rows, "totals": totals}
+
+
+async def acquire_daily_lease(db, name: str, day: str, lease_seconds: float = 3600) -> bool:
+    """True for exactly one caller per ``day`` (until a lease holder dies and the lease expires)."""
+    now = datetime.now(timezone.utc)
+    try:
+        # No match means the lease is held or today's run is done; the upsert
+        # then collides with the existing _id
+        await db[LOCKS_COLLECTION].update_one(
+            {"_id": name, "last_run": {"$ne": day},
+             "$or": [{"locked_until": None}, {"locked_until": {"$lt": now}}]},
+            {"$set": {"locked_until": now + timedelta(seconds=lease_seconds), "started_at": now}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def release_daily_lease(db, name: str, day: str, report: Any = None) -> None:
+    await db[LOCKS_COLLECTION].update_one(
+        {"_id": name},
+        {"$set": {"locked_until": None, "last_run": day, "last_report": report,
+                  "finished_at": datetime.now(timezone.utc)}},
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Archive and delete expired operational documents")
+    parser.add_argument("--run", action="store_true", help="archive/delete everything past its retention now")
+    args = parser.parse_args()
+    if not args.run:
+        parser.error("nothing to do; pass --run")
+
+    load_dotenv(Path(__file__).parent / ".env")
+    mongo_client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+
+    async def _main():
+        print(json.dumps(await archive_expired(mongo_client[os.environ["DB_NAME"]]), indent=2, default=str))
+
+    asyncio.run(_main())
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, BackgroundTasks, Request, Form, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, BackgroundTasks, Request, Response, Form, Body
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
@@ -13,9 +13,7 @@ from pydantic import BaseModel, Field, EmailStr, ConfigDict
 from typing import List, Optional, Literal
 import uuid
 from datetime import datetime, timezone, timedelta
-import bcrypt
 from jose import JWTError, jwt
-import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
@@ -32,6 +30,31 @@ import qrcode
 from contextlib import asynccontextmanager
 from io import BytesIO
 from logo_base64 import F3_LOGO_BASE64
+from db_indexes import reconcile_indexes, summarize_report
+from cache import TTLCache
+from password_service import password_service_from_env
+from buffered_writer import BufferedWriter
+from log_bodies import BodyStore, BODY_COLLECTION, preview_text
+from log_stats import LogStats, LOG_STATS_COLLECTION
+from invoice_cache import InvoiceCache, INVOICE_CACHE_COLLECTION, content_version, etag_for, etag_matches
+from pagination import keyset_filter, keyset_sort, merge_filters, next_cursor
+from email_shell import email_shell, wrap_email
+from http_clients import provider_http_from_env
+from fast2sms_meta import Fast2SMSMetadata, Fast2SMSMetadataError, METADATA_FIELD as FAST2SMS_METADATA_FIELD
+from smtp_pool import SMTPPool
+from connection_monitor import ConnectionMonitor
+from retention import (
+    RETENTION_POLICIES, LOCKS_COLLECTION, acquire_daily_lease, release_daily_lease,
+    archive_expired, sweep_orphan_bodies, collection_sizes,
+)
+from outbox import Outbox, OUTBOX_COLLECTION, PermanentFailure, ProviderUnavailable, parse_limits, parse_rates
+from broadcast_jobs import BroadcastJobs, BROADCAST_COLLECTION, BROADCAST_STATUSES
+from notification_templates import TemplateRegistry, TEMPLATE_TYPES, CHANNELS, compile_template, render_compiled, render_template
+from birthdays import dob_keys, find_birthdays, backfill_dob_keys
+from daily_stats import load_daily_stats, store_daily_stats, bump_daily_stats, replace_section
+from attendance_summary import (
+    SUMMARY_COLLECTION, record_check_in, remove_summaries, ensure_attendance_summaries, summary_view
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -46,6 +69,17 @@ SECRET_KEY = os.environ.get('JWT_SECRET', 'f3-fitness-gym-secret-key-2024')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
 
+# Authenticated-user cache (per process). Holds a slim projection only; TTL bounds
+# staleness across workers, local writes invalidate explicitly.
+USER_CACHE_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "email": 1, "member_id": 1, "role": 1,
+    "phone_number": 1, "country_code": 1, "is_active": 1, "is_disabled": 1
+}
+user_cache = TTLCache(
+    maxsize=int(os.environ.get("USER_CACHE_MAXSIZE", "2048")),
+    ttl=float(os.environ.get("USER_CACHE_TTL_SECONDS", "60"))
+)
+
 # Create the main app with lifespan
 app = FastAPI(title="F3 Fitness Gym API")
 
@@ -287,6 +321,8 @@ class AttendanceResponse(BaseModel):
     check_in_time: str
     marked_by: Optional[str] = None  # 'self', 'admin', 'receptionist'
     marked_by_name: Optional[str] = None
+    gender: Optional[str] = None
+    profile_photo_url: Optional[str] = None  # only with include_photos=true
 
 # Holiday Models
 class HolidayBase(BaseModel):
@@ -551,6 +587,7 @@ class DashboardStats(BaseModel):
     today_collection: float
     present_today: int
     absent_today: int
+    expiring_soon: int = 0
     today_birthdays: List[dict] = []
     upcoming_birthdays: List[dict] = []
     upcoming_renewals: List[dict] = []
@@ -593,11 +630,25 @@ class TestimonialResponse(BaseModel):
 
 # ==================== HELPER FUNCTIONS ====================
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+# bcrypt runs on a dedicated thread pool (PASSWORD_HASH_WORKERS) so a burst of
+# logins does not stall every other request on the event loop.
+password_service = password_service_from_env()
+
+# Keep-alive (HTTP/2 when h2 is installed) clients per WhatsApp provider; opened in lifespan
+provider_http = provider_http_from_env()
+
+# Authenticated SMTP sessions shared by every send_email call
+smtp_pool = SMTPPool(
+    max_size=int(os.environ.get("SMTP_POOL_SIZE", "4")),
+    idle_timeout=float(os.environ.get("SMTP_POOL_IDLE_SECONDS", "60")),
+    max_messages=int(os.environ.get("SMTP_POOL_MAX_MESSAGES", "100")),
+)
+
+async def hash_password(password: str) -> str:
+    return await password_service.hash(password)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+async def verify_password(password: str, hashed: str) -> bool:
+    return await password_service.verify(password, hashed)
 
 def create_access_token(data: dict, remember_me: bool = False) -> str:
     to_encode = data.copy()
@@ -610,28 +661,89 @@ def create_access_token(data: dict, remember_me: bool = False) -> str:
 def generate_otp(length: int = 6) -> str:
     return ''.join(random.choices(string.digits, k=length))
 
+# Activity logs are written behind the request: log_activity only queues the
+# document and a background task batches them into insert_many.
+activity_writer = BufferedWriter(
+    lambda: db.activity_logs,
+    name="activity_logs",
+    max_batch=int(os.environ.get("ACTIVITY_LOG_BATCH_SIZE", "200")),
+    flush_interval=float(os.environ.get("ACTIVITY_LOG_FLUSH_SECONDS", "1.0")),
+    max_queue=int(os.environ.get("ACTIVITY_LOG_MAX_QUEUE", "10000")),
+    overflow=os.environ.get("ACTIVITY_LOG_OVERFLOW", "drop_oldest")
+)
+
+# Email/WhatsApp delivery logs (and the email bodies they reference) are batched
+# the same way; readers that need the latest entry flush first.
+def _message_log_writer(collection_name: str, on_flush=None) -> BufferedWriter:
+    return BufferedWriter(
+        lambda: db[collection_name],
+        name=collection_name,
+        max_batch=int(os.environ.get("MESSAGE_LOG_BATCH_SIZE", "200")),
+        flush_interval=float(os.environ.get("MESSAGE_LOG_FLUSH_SECONDS", "1.0")),
+        max_queue=int(os.environ.get("MESSAGE_LOG_MAX_QUEUE", "10000")),
+        on_flush=on_flush,
+    )
+
+# Dashboard counters for the delivery logs, bumped as each batch is flushed
+def _log_stats(collection_name: str) -> LogStats:
+    return LogStats(
+        lambda: db[collection_name],
+        lambda: db[LOG_STATS_COLLECTION],
+        collection_name,
+        lambda: get_ist_today_start(),
+        reconcile_seconds=float(os.environ.get("LOG_STATS_RECONCILE_SECONDS", "3600")),
+        cache_ttl=float(os.environ.get("LOG_STATS_CACHE_SECONDS", "5")),
+    )
+
+email_log_stats = _log_stats("email_logs")
+whatsapp_log_stats = _log_stats("whatsapp_logs")
+email_log_writer = _message_log_writer("email_logs", on_flush=email_log_stats.record)
+whatsapp_log_writer = _message_log_writer("whatsapp_logs", on_flush=whatsapp_log_stats.record)
+email_bodies = BodyStore(_message_log_writer(BODY_COLLECTION), lambda: db[BODY_COLLECTION])
+MESSAGE_LOG_WRITERS = (email_log_writer, whatsapp_log_writer, email_bodies.writer)
+
+# Rendered invoice PDFs (see invoice_cache.py)
+invoice_pdfs = InvoiceCache(
+    lambda: db[INVOICE_CACHE_COLLECTION],
+    memory_size=int(os.environ.get("INVOICE_PDF_MEMORY_CACHE_SIZE", "32")),
+)
+
 async def log_activity(user_id: str, action: str, description: str, ip_address: str = None, metadata: dict = None):
-    """Log user activity"""
-    await db.activity_logs.insert_one({
+    """Log user activity (buffered; persisted within ACTIVITY_LOG_FLUSH_SECONDS)"""
+    activity_writer.add({
         "id": str(uuid.uuid4()),
         "user_id": user_id,
         "action": action,
         "description": description,
         "ip_address": ip_address,
         "metadata": metadata or {},
-        "timestamp": get_ist_now().isoformat()
+        "timestamp": get_ist_now().isoformat(),
+        "stored_at": datetime.now(timezone.utc),
     })
 
+async def fetch_users_by_id(user_ids, projection: dict = None) -> dict:
+    """One $in query for a set of user ids -> {user_id: user_doc}"""
+    ids = list({uid for uid in user_ids if uid})
+    if not ids:
+        return {}
+    fields = {"_id": 0, "id": 1, **(projection or {"name": 1, "member_id": 1})}
+    users = await db.users.find({"id": {"$in": ids}}, fields).to_list(len(ids))
+    return {u["id"]: u for u in users}
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+        user = user_cache.get(user_id)
         if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+            user = await db.users.find_one({"id": user_id}, USER_CACHE_PROJECTION)
+            if user is None:
+                raise HTTPException(status_code=401, detail="User not found")
+            user_cache.set(user_id, user)
+        # Handlers may mutate the dict they receive; never hand out the cached one.
+        return dict(user)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
@@ -679,371 +791,21 @@ def get_ist_today_end():
 def wrap_email_in_template(content: str, title: str = "F3 Fitness Notification") -> str:
     """Wrap email content in professional F3 Fitness template - light/white theme with detailed footer.
     If content already appears to be a complete HTML email (has its own styling), returns it as-is with DOCTYPE wrapper.
+    The shell itself is pre-split at import time (see email_shell.py).
     """
-    # Check if content is already a complete styled email (user-customized template)
-    content_stripped = content.strip()
-    is_complete_email = (
-        content_stripped.startswith('<!DOCTYPE') or
-        content_stripped.startswith('<html') or
-        (content_stripped.startswith('<div') and 'style=' in content_stripped[:200] and ('max-width' in content_stripped[:300] or 'background' in content_stripped[:300]))
-    )
-    
-    if is_complete_email:
-        # Content is already a complete styled email, just wrap in basic HTML structure
-        return f'''<!DOCTYPE html>
-<html>
-<head>
-<meta charset="UTF-8">
-<meta name="viewport" content="width=device-width, initial-scale=1.0">
-<title>{title}</title>
-</head>
-<body style="margin:0; padding:0; font-family: Arial, sans-serif; background: #f4f6f8;">
-{content}
-</body>
-</html>'''
-    
-    # Simple content - wrap in full professional template
-    return f'''<!DOCTYPE html>
-<html>
-<head>
-<meta charset="UTF-8">
-<meta name="viewport" content="width=device-width, initial-scale=1.0">
-<title>{title}</title>
-<link href="https://fonts.googleapis.com/css2?family=Poppins:wght@400;500;600;700&display=swap" rel="stylesheet">
-<style>
-body {{ margin:0; padding:0; font-family: 'Poppins', Arial, sans-serif; background: linear-gradient(135deg,#f4f6f8,#eef1f5); }}
-.wrapper {{ padding:40px 15px; }}
-.container {{ max-width:620px; margin:0 auto; background:#ffffff; border-radius:16px; overflow:hidden; box-shadow:0 15px 40px rgba(0,0,0,0.08); border:1px solid #eaeaea; }}
-.top-accent {{ height:6px; background: linear-gradient(135deg,#0ea5b7,#0b7285); }}
-.header {{ padding:35px 30px 25px 30px; text-align:center; background:linear-gradient(135deg,#0ea5b7,#0b7285); }}
-.logo {{ max-width:160px; margin-bottom:10px; }}
-.tagline {{ font-size:13px; letter-spacing:2px; text-transform:uppercase; color:#e0f2fe; margin-top:5px; font-weight:600; }}
-.content {{ padding:40px 35px 35px 35px; color:#374151; font-size:16px; line-height:1.7; }}
-.content h2 {{ margin-top:0; font-size:24px; color:#111827; }}
-.highlight-box {{ background:#f0f9ff; border-left:4px solid #0ea5b7; padding:18px; border-radius:6px; margin:25px 0; font-size:14px; color:#0f766e; }}
-.button {{ display:inline-block; margin-top:25px; background: linear-gradient(135deg,#0ea5b7,#0b7285); color:#ffffff; padding:14px 32px; text-decoration:none; border-radius:50px; font-weight:600; font-size:14px; letter-spacing:0.5px; box-shadow:0 8px 20px rgba(14,165,183,0.25); }}
-.footer {{ background:#f3f4f6; padding:25px 25px; font-size:14px; color:#6b7280; border-top:1px solid #e5e7eb; text-align:center; line-height:1.7; }}
-.footer-title {{ font-size:18px; font-weight:700; color:#111827; margin-bottom:10px; }}
-.footer-address {{ max-width:480px; margin:0 auto 15px auto; }}
-.footer-contact {{ margin-bottom:10px; }}
-.footer-hours {{ margin-bottom:20px; }}
-.footer-social {{ color:#0ea5b7; font-weight:700; }}
-.footer a {{ color:#0ea5b7; text-decoration:none; font-weight:500; }}
-.small {{ margin-top:20px; padding-top:15px; border-top:1px solid #e5e7eb; font-size:11px; color:#9ca3af; }}
-.divider {{ height:1px; background:#e5e5e5; margin:25px 0; }}
-.otp-code {{ background:#f0f9ff; border:2px solid #0ea5b7; padding:20px; border-radius:10px; text-align:center; font-size:32px; font-weight:700; color:#0b7285; letter-spacing:8px; }}
-</style>
-</head>
-<body>
-<div class="wrapper">
-  <div class="container">
-    <div class="top-accent"></div>
-    <div class="header">
-      <img src="https://customer-assets.emergentagent.com/job_f3-fitness-gym/artifacts/0x0pk4uv_Untitled%20%28500%20x%20300%20px%29%20%282%29.png" alt="F3 Fitness Logo" class="logo">
-      <div class="tagline">TRAIN • TRANSFORM • TRIUMPH</div>
-    </div>
-    <div class="content">
-      {content}
-    </div>
-    <div class="footer">
-      <div class="footer-title">F3 Fitness Health Club</div>
-      <div class="footer-address">
-        4th Avenue Plot No 4R-B, Mode, near Mandir Marg,<br>
-        Sector 4, Vidyadhar Nagar, Jaipur, Rajasthan 302039
-      </div>
-      <div class="footer-contact">
-        📞 072300 52193 &nbsp;|&nbsp; 📧 info@f3fitness.in
-      </div>
-      <div class="footer-hours">
-        🕒 Mon–Sat: 5:00 AM – 10:00 PM &nbsp;|&nbsp; Sun: 6:00 AM – 12:00 PM
-      </div>
-      <div>
-        Follow us on Instagram: <a href="https://instagram.com/f3fitnessclub" class="footer-social">@f3fitnessclub</a>
-      </div>
-      <div class="small">
-        © 2026 F3 Fitness Health Club. All rights reserved.
-      </div>
-    </div>
-  </div>
-</div>
-</body>
-</html>'''
+    return wrap_email(content, title)
+
+# Admin overrides merged over DEFAULT_TEMPLATES, compiled once per process
+template_registry = TemplateRegistry(ttl=float(os.environ.get("TEMPLATE_CACHE_TTL_SECONDS", "300")))
 
 async def get_template(template_type: str, channel: str) -> dict:
-    """Get notification template"""
-    template = await db.templates.find_one({"template_type": template_type, "channel": channel}, {"_id": 0})
-    if template:
-        return template
-    # Return default templates - now using the wrap_email_in_template for emails
-    defaults = {
-        ("welcome", "email"): {
-            "subject": "Welcome to F3 Fitness Gym! 💪",
-            "content": """<h2>Welcome to F3 Fitness 💪</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Thank you for joining F3 Fitness Gym - Jaipur's premier fitness destination.</p>
-<div class="highlight-box">
-  <strong>Your Member ID:</strong> {{member_id}}<br>
-  We're excited to be part of your fitness journey!
-</div>
-<p>Stay consistent. Stay disciplined. Your transformation starts now.</p>
-<center><a href="https://f3fitness.in" class="button">Visit Our Website</a></center>
-<div class="divider"></div>
-<p style="font-size:13px; color:#777777;">If you have any questions, feel free to reach out to us anytime.</p>"""
-        },
-        ("otp", "email"): {
-            "subject": "Your F3 Fitness OTP Code 🔐",
-            "content": """<h2>Verify Your Account 🔐</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Please use the following OTP to verify your account:</p>
-<div class="otp-code">{{otp}}</div>
-<div class="highlight-box">
-  This code will expire in 10 minutes. Do not share this code with anyone.
-</div>
-<p style="font-size:13px; color:#777777;">If you didn't request this code, please ignore this email.</p>"""
-        },
-        ("otp", "whatsapp"): {
-            "content": "🔐 Your F3 Fitness OTP is: *{{otp}}*\n\nThis code expires in 10 minutes. Do not share with anyone."
-        },
-        ("password_reset", "email"): {
-            "subject": "Reset Your F3 Fitness Password 🔑",
-            "content": """<h2>Password Reset Request 🔑</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>We received a request to reset your password. Your new temporary password is:</p>
-<div class="otp-code">{{otp}}</div>
-<div class="highlight-box">
-  Please log in with this password and change it immediately from your profile settings.
-</div>
-<p style="font-size:13px; color:#777777;">If you didn't request this, please contact us immediately.</p>"""
-        },
-        ("password_reset", "whatsapp"): {
-            "content": "🔑 Hi {{name}}, your F3 Fitness password has been reset.\n\nYour new temporary password: *{{otp}}*\n\nPlease login and change it immediately from your profile."
-        },
-        ("welcome", "whatsapp"): {
-            "content": "🏋️ Welcome to F3 Fitness Gym, {{name}}!\n\nYour Member ID: *{{member_id}}*\n\nLet's crush your fitness goals together! 💪\n\n- F3 Fitness Team"
-        },
-        ("attendance", "email"): {
-            "subject": "Attendance Marked - F3 Fitness Gym ✅",
-            "content": """<h2>Great Job, {{name}}! ✅</h2>
-<p>Your attendance has been marked for today.</p>
-<div class="highlight-box">
-  Keep showing up consistently - that's the key to achieving your fitness goals! 💪
-</div>
-<p>See you at the gym!</p>
-<p><strong>Your F3 Fitness Team</strong></p>"""
-        },
-        ("attendance", "whatsapp"): {
-            "content": "✅ Attendance marked!\n\nGreat job showing up today, {{name}}. Keep the momentum going! 🔥\n\n- F3 Fitness"
-        },
-        ("absent_warning", "email"): {
-            "subject": "We Miss You at F3 Fitness! 😢",
-            "content": """<h2>We Miss You, {{name}}! 😢</h2>
-<p>It's been <strong>{{days}} days</strong> since your last visit.</p>
-<div class="highlight-box">
-  Your fitness goals are waiting! Remember: Consistency is key to achieving your dream physique. 💪
-</div>
-<p>See you soon at the gym!</p>
-<center><a href="https://f3fitness.in" class="button">Plan Your Visit</a></center>"""
-        },
-        ("absent_warning", "whatsapp"): {
-            "content": "😢 Hey {{name}},\n\nIt's been {{days}} days since your last gym visit. Your fitness goals miss you!\n\nCome back stronger 💪\n\n- F3 Fitness Team"
-        },
-        ("birthday", "email"): {
-            "subject": "Happy Birthday from F3 Fitness! 🎂",
-            "content": """<h2>🎉 Happy Birthday, {{name}}! 🎂</h2>
-<p>Wishing you a fantastic birthday filled with health, happiness, and gains!</p>
-<div class="highlight-box">
-  Here's to another year of crushing your fitness goals! May this year bring you closer to your dream physique.
-</div>
-<p>Celebrate well and see you at the gym!</p>
-<p><strong>Your F3 Fitness Family</strong></p>"""
-        },
-        ("birthday", "whatsapp"): {
-            "content": "🎂 Happy Birthday, {{name}}! 🎉\n\nWishing you a year full of health, happiness and fitness gains!\n\nEnjoy your special day!\n\n- F3 Fitness Gym 💪"
-        },
-        ("plan_shared", "email"): {
-            "subject": "Your New {{plan_type}} Plan is Ready! 📋",
-            "content": """<h2>New {{plan_type}} Plan Ready! 📋</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Your trainer has created a new plan for you:</p>
-<div class="highlight-box">
-  <strong>Plan Type:</strong> {{plan_type}}<br>
-  <strong>Title:</strong> {{plan_title}}
-</div>
-<p>Log in to your dashboard to view the full details.</p>
-<center><a href="https://f3fitness.in/login" class="button">View Your Plan</a></center>
-<p>Let's achieve your goals together!</p>"""
-        },
-        ("plan_shared", "whatsapp"): {
-            "content": "📋 Hi {{name}}!\n\nYour trainer has created a new {{plan_type}} plan: *{{plan_title}}*\n\nCheck your F3 Fitness dashboard to view it! 💪"
-        },
-        ("renewal_reminder", "email"): {
-            "subject": "Your Membership Expires Soon! ⏰",
-            "content": """<h2>Renewal Reminder ⏰</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<div class="highlight-box">
-  Your membership expires on <strong>{{expiry_date}}</strong><br>
-  <strong>Days Remaining:</strong> {{days_left}} days
-</div>
-<p>Renew now to continue your fitness journey without interruption!</p>
-<center><a href="https://f3fitness.in/login" class="button">Renew Now</a></center>
-<p style="font-size:13px; color:#777777;">Visit the gym or renew online to keep your momentum going.</p>"""
-        },
-        ("renewal_reminder", "whatsapp"): {
-            "content": "⏰ Hi {{name}},\n\nYour F3 Fitness membership expires on *{{expiry_date}}* ({{days_left}} days left).\n\nRenew now to keep your fitness journey going! 💪\n\n- F3 Fitness"
-        },
-        ("freeze_started", "email"): {
-            "subject": "Membership Freeze Confirmed ❄️",
-            "content": """<h2>Membership Freeze Confirmed ❄️</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Your membership freeze request has been applied successfully.</p>
-<div class="highlight-box">
-  <strong>Freeze Period:</strong> {{freeze_start_date}} to {{freeze_end_date}}<br>
-  <strong>Total Freeze Days:</strong> {{freeze_days}}<br>
-  <strong>New Membership Expiry:</strong> {{new_expiry_date}}<br>
-  <strong>Freeze Fee:</strong> Rs.{{freeze_fee}}
-</div>
-<p>You can resume your workouts after the freeze period ends.</p>"""
-        },
-        ("freeze_started", "whatsapp"): {
-            "content": "❄️ Hi {{name}}, your membership has been frozen.\n\nFreeze: {{freeze_start_date}} to {{freeze_end_date}}\nDays: {{freeze_days}}\nNew Expiry: {{new_expiry_date}}\nFee: Rs.{{freeze_fee}}\n\n- F3 Fitness"
-        },
-        ("freeze_ended", "email"): {
-            "subject": "Membership Freeze Ended ✅",
-            "content": """<h2>Freeze Ended ✅</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Your membership freeze has been ended {{end_mode}}.</p>
-<div class="highlight-box">
-  <strong>Freeze End Date:</strong> {{freeze_end_date}}<br>
-  <strong>Current Membership Expiry:</strong> {{new_expiry_date}}
-</div>
-<p>Welcome back to your fitness routine! 💪</p>"""
-        },
-        ("freeze_ended", "whatsapp"): {
-            "content": "✅ Hi {{name}}, your membership freeze has been ended {{end_mode}}.\n\nFreeze ends on: {{freeze_end_date}}\nCurrent Expiry: {{new_expiry_date}}\n\nWelcome back! 💪\n- F3 Fitness"
-        },
-        ("freeze_ending_tomorrow", "email"): {
-            "subject": "Freeze Ends Tomorrow ⏰",
-            "content": """<h2>Freeze Ending Tomorrow ⏰</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Your membership freeze is ending tomorrow.</p>
-<div class="highlight-box">
-  <strong>Freeze End Date:</strong> {{freeze_end_date}}<br>
-  <strong>Membership Expiry:</strong> {{new_expiry_date}}
-</div>
-<p>We look forward to seeing you back at F3 Fitness! 💪</p>"""
-        },
-        ("freeze_ending_tomorrow", "whatsapp"): {
-            "content": "⏰ Hi {{name}}, your membership freeze ends tomorrow ({{freeze_end_date}}).\n\nCurrent Expiry: {{new_expiry_date}}\nSee you at F3 Fitness! 💪"
-        },
-        ("membership_activated", "email"): {
-            "subject": "Membership Activated! 🎉",
-            "content": """<h2>Membership Activated! 🎉</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Your membership is now active!</p>
-<div class="highlight-box">
-  <strong>Plan:</strong> {{plan_name}}<br>
-  <strong>Start Date:</strong> {{start_date}}<br>
-  <strong>End Date:</strong> {{end_date}}
-</div>
-<p>See you at the gym! 💪</p>
-<center><a href="https://f3fitness.in/login" class="button">View Dashboard</a></center>"""
-        },
-        ("membership_activated", "whatsapp"): {
-            "content": "🎉 Hi {{name}}!\n\nYour *{{plan_name}}* membership is now active!\n\n📅 Start: {{start_date}}\n📅 End: {{end_date}}\n\nLet's crush those fitness goals! 💪\n\n- F3 Fitness Gym"
-        },
-        ("payment_received", "email"): {
-            "subject": "Payment Received - F3 Fitness Gym 💰",
-            "content": """<h2>Payment Received! 💰</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Thank you for your payment. Here are the details:</p>
-<div class="highlight-box">
-  <strong>Receipt No:</strong> {{receipt_no}}<br>
-  <strong>Amount:</strong> Rs.{{amount}}<br>
-  <strong>Payment Mode:</strong> {{payment_mode}}
-</div>
-<p>Thank you for being a valued member of F3 Fitness!</p>
-<center><a href="https://f3fitness.in/login" class="button">View Receipt</a></center>"""
-        },
-        ("payment_received", "whatsapp"): {
-            "content": "💰 Hi {{name}}, payment received!\n\nReceipt: {{receipt_no}}\nAmount: Rs.{{amount}}\nMode: {{payment_mode}}\n\nThank you! - F3 Fitness Gym"
-        },
-        ("invoice_sent", "email"): {
-            "subject": "Your Invoice {{receipt_no}} - F3 Fitness 🧾",
-            "content": """<h2>Invoice Attached 🧾</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Please find your invoice PDF attached for your recent payment.</p>
-<div class="highlight-box">
-  <strong>Receipt No:</strong> {{receipt_no}}<br>
-  <strong>Amount Paid:</strong> Rs.{{amount}}<br>
-  <strong>Date:</strong> {{payment_date}}
-</div>
-<p>Thank you for being a valued member of F3 Fitness! 💪</p>"""
-        },
-        ("invoice_sent", "whatsapp"): {
-            "content": "🧾 F3 Fitness Invoice\nReceipt: {{receipt_no}}\nAmount: Rs.{{amount}}\nDate: {{payment_date}}\n\nYour invoice PDF is attached."
-        },
-        ("holiday", "email"): {
-            "subject": "Holiday Notice - F3 Fitness Gym 🏖️",
-            "content": """<h2>Holiday Notice 🏖️</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Please note that F3 Fitness Gym will be closed on:</p>
-<div class="highlight-box" style="text-align:center;">
-  <strong style="font-size:20px; color:#0891b2;">{{holiday_date}}</strong><br>
-  <span>{{holiday_reason}}</span>
-</div>
-<p>Plan your workouts accordingly. See you soon!</p>"""
-        },
-        ("holiday", "whatsapp"): {
-            "content": "🏖️ Hi {{name}},\n\nF3 Fitness Gym will be closed on *{{holiday_date}}* for {{holiday_reason}}.\n\nPlan your workouts accordingly. See you soon! 💪\n\n- F3 Fitness"
-        },
-        ("announcement", "email"): {
-            "subject": "📢 {{announcement_title}} - F3 Fitness Gym",
-            "content": """<h2>📢 {{announcement_title}}</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<div class="highlight-box">
-  {{announcement_content}}
-</div>
-<p>Stay fit, stay healthy!</p>
-<center><a href="https://f3fitness.in" class="button">Visit Website</a></center>"""
-        },
-        ("announcement", "whatsapp"): {
-            "content": "📢 *{{announcement_title}}*\n\nHi {{name}},\n\n{{announcement_content}}\n\n- F3 Fitness Gym"
-        },
-        ("new_user_credentials", "email"): {
-            "subject": "F3 Fitness Account Details (Service Message)",
-            "content": """<h2>F3 Fitness Account Created ✅</h2>
-<p>Hi <strong>{{name}}</strong>,</p>
-<p>Your member account has been created successfully. Use these login details:</p>
-<div class="highlight-box">
-  <strong>Member ID:</strong> {{member_id}}<br>
-  <strong>Email:</strong> {{email}}<br>
-  <strong>Password:</strong> <code style="color:#dc2626; font-weight:700;">{{password}}</code>
-</div>
-<p style="color:#dc2626; font-weight:500;">⚠️ Please change your password after your first login.</p>
-<center><a href="https://f3fitness.in/login" class="button">Login Now</a></center>
-<p style="font-size:13px; color:#777777;">This is an important service message from F3 Fitness.</p>"""
-        },
-        ("new_user_credentials", "whatsapp"): {
-            "content": "Hello {{name}},\n\nYour F3 Fitness member account has been created successfully.\n\nMember ID: {{member_id}}\nEmail: {{email}}\nPassword: {{password}}\n\nLogin: https://f3fitness.in/login\n\nPlease change your password after first login.\n\n- F3 Fitness Health Club"
-        },
-        ("test_email", "email"): {
-            "subject": "F3 Fitness Gym - Test Email ✅",
-            "content": """<h2>SMTP Test Successful! ✅</h2>
-<p>This is a test email from F3 Fitness Gym.</p>
-<div class="highlight-box">
-  Your SMTP configuration is working correctly.<br>
-  You can now send emails to your members!
-</div>
-<p>Keep motivating your members! 💪</p>"""
-        }
-    }
-    return defaults.get((template_type, channel), {"subject": "", "content": ""})
+    """Get notification template (admin override or built-in default)"""
+    compiled = await template_registry.get(db, template_type, channel)
+    return dict(compiled.doc)
 
 def replace_template_vars(template: str, variables: dict) -> str:
-    """Replace template variables like {{name}} with actual values"""
-    for key, value in variables.items():
-        template = template.replace(f"{{{{{key}}}}}", str(value))
-    return template
+    """Replace template variables like {{name}} with actual values (unknown ones are kept)"""
+    return render_template(template, variables)
 
 def sanitize_invoice_whatsapp_message(message: str) -> str:
     """Keep invoice WhatsApp captions attachment-first, without fallback links."""
@@ -1095,9 +857,41 @@ def get_public_base_url() -> str:
         or "https://f3fitness.in"
     ).rstrip("/")
 
-async def send_email(to_email: str, subject: str, body: str, attachments: Optional[List[dict]] = None):
-    """Send email using configured SMTP settings"""
-    settings = await db.settings.find_one({"id": "1"}, {"_id": 0})
+# The settings document is read by every notification send. Cache it per process;
+# settings writes invalidate, SETTINGS_CACHE_TTL_SECONDS bounds staleness across workers.
+settings_cache = TTLCache(maxsize=1, ttl=float(os.environ.get("SETTINGS_CACHE_TTL_SECONDS", "30")))
+
+async def get_cached_settings() -> dict:
+    """Settings document (without _id), or {} when not configured yet"""
+    settings = settings_cache.get("settings")
+    if settings is None:
+        settings = await db.settings.find_one({"id": "1"}, {"_id": 0}) or {}
+        settings_cache.set("settings", settings)
+    # Callers may annotate the dict they receive; never hand out the cached one.
+    return dict(settings)
+
+def invalidate_settings_cache():
+    settings_cache.clear()
+
+async def _persist_fast2sms_metadata(entry: dict) -> None:
+    await db.settings.update_one({"id": "1"}, {"$set": {FAST2SMS_METADATA_FIELD: entry}}, upsert=True)
+    invalidate_settings_cache()
+
+# Resolved WABA sender, template list and connection status; provider_http is created further down
+fast2sms_metadata = Fast2SMSMetadata(
+    lambda: provider_http.get("fast2sms"),
+    _persist_fast2sms_metadata,
+    ttl=float(os.environ.get("FAST2SMS_METADATA_TTL_SECONDS", "3600")),
+    failure_ttl=float(os.environ.get("FAST2SMS_METADATA_FAILURE_TTL_SECONDS", "60")),
+)
+
+async def send_email(to_email: str, subject: str, body: str, attachments: Optional[List[dict]] = None,
+                     raise_unsendable: bool = False):
+    """Send email using configured SMTP settings.
+
+    With raise_unsendable (the outbox), a missing SMTP setup raises ProviderUnavailable
+    instead of returning False."""
+    settings = await get_cached_settings()
     body_html = body or ""
     # Best-effort OTP extraction for reception fallback (supports common 4-8 digit OTP formats)
     otp_detected = None
@@ -1110,19 +904,23 @@ async def send_email(to_email: str, subject: str, body: str, attachments: Option
         "id": str(uuid.uuid4()),
         "to_email": to_email,
         "subject": (subject or "")[:200],
-        "body_preview": (body_html.replace("\n", " ").replace("\r", " ")[:300] + "...") if len(body_html) > 300 else body_html,
-        # Store HTML for click-to-preview in Email Logs. Truncate to keep log docs bounded.
-        "body_html": (body_html[:50000] + "\n<!-- truncated -->") if len(body_html) > 50000 else body_html,
+        "body_preview": preview_text(body_html),
+        # Shell reference + compressed, deduplicated content; body_html is rebuilt for the preview
+        "body_ref": email_bodies.email_ref(body_html),
         "otp_detected": otp_detected,
         "status": "pending",
         "error": None,
-        "timestamp": get_ist_now().isoformat()
+        "timestamp": get_ist_now().isoformat(),
+        # BSON date for the retention TTL index (retention.py)
+        "stored_at": datetime.now(timezone.utc),
     }
     if not settings or not settings.get("smtp_host"):
         logger.warning("SMTP not configured")
         log_data["status"] = "failed"
         log_data["error"] = "SMTP not configured"
-        await db.email_logs.insert_one(log_data)
+        email_log_writer.add(log_data)
+        if raise_unsendable:
+            raise ProviderUnavailable(log_data["error"])
         return False
     
     try:
@@ -1142,48 +940,16 @@ async def send_email(to_email: str, subject: str, body: str, attachments: Option
             part.add_header("Content-Type", att.get("content_type", "application/octet-stream"))
             message.attach(part)
         
-        port = settings["smtp_port"]
-        smtp_secure = settings.get("smtp_secure", True)
-        
-        # Port 587 uses STARTTLS, Port 465 uses direct SSL
-        if port == 587:
-            # Use STARTTLS for port 587
-            await aiosmtplib.send(
-                message,
-                hostname=settings["smtp_host"],
-                port=port,
-                username=settings["smtp_user"],
-                password=settings["smtp_pass"],
-                start_tls=True
-            )
-        elif port == 465:
-            # Use direct TLS for port 465
-            await aiosmtplib.send(
-                message,
-                hostname=settings["smtp_host"],
-                port=port,
-                username=settings["smtp_user"],
-                password=settings["smtp_pass"],
-                use_tls=True
-            )
-        else:
-            # For other ports, use the smtp_secure setting
-            await aiosmtplib.send(
-                message,
-                hostname=settings["smtp_host"],
-                port=port,
-                username=settings["smtp_user"],
-                password=settings["smtp_pass"],
-                start_tls=smtp_secure
-            )
+        # Reuses a logged-in session; TLS mode per port is in smtp_pool.connection_options
+        await smtp_pool.send(settings, message)
         log_data["status"] = "sent"
-        await db.email_logs.insert_one(log_data)
+        email_log_writer.add(log_data)
         return True
     except Exception as e:
         logger.error(f"Email send failed: {e}")
         log_data["status"] = "failed"
         log_data["error"] = str(e)
-        await db.email_logs.insert_one(log_data)
+        email_log_writer.add(log_data)
         return False
 
 def _normalize_phone_e164(number: str) -> str:
@@ -1228,9 +994,8 @@ async def _evolution_request(
 
     url = f"{base_url}{path}"
     headers = {"apikey": api_key}
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        response = await client.request(method.upper(), url, headers=headers, json=json_body, params=params)
-    return response
+    client = provider_http.get("evolution")
+    return await client.request(method.upper(), url, headers=headers, json=json_body, params=params, timeout=timeout)
 
 async def _get_evolution_connection_state(settings: dict) -> dict:
     instance_name = _evolution_instance_name(settings)
@@ -1301,25 +1066,20 @@ async def _send_whatsapp_evolution(
     api_key = str(settings.get("evolution_api_key") or "").strip()
     instance_name = _evolution_instance_name(settings)
     if not base_url:
-        log_data["status"] = "failed"
-        log_data["error"] = "Evolution API base URL not configured"
-        await _log_whatsapp(log_data, log_to_db)
-        return False
+        await _whatsapp_unsendable(log_data, log_to_db, ProviderUnavailable("Evolution API base URL not configured"))
     if not api_key:
-        log_data["status"] = "failed"
-        log_data["error"] = "Evolution API key not configured"
-        await _log_whatsapp(log_data, log_to_db)
-        return False
+        await _whatsapp_unsendable(log_data, log_to_db, ProviderUnavailable("Evolution API key not configured"))
     if not instance_name:
-        log_data["status"] = "failed"
-        log_data["error"] = "Evolution instance name not configured"
-        await _log_whatsapp(log_data, log_to_db)
-        return False
+        await _whatsapp_unsendable(log_data, log_to_db, ProviderUnavailable("Evolution instance name not configured"))
 
     target_number = _normalize_phone_digits(to_number_clean)
     if not target_number:
+        await _whatsapp_unsendable(log_data, log_to_db, PermanentFailure("Recipient number is invalid"))
+
+    # Fail fast instead of waiting out the request timeout for every message
+    if evolution_monitor.known_disconnected(instance_name):
         log_data["status"] = "failed"
-        log_data["error"] = "Recipient number is invalid"
+        log_data["error"] = f"Evolution instance '{instance_name}' is not connected (state: {evolution_monitor.state.get('state')})"
         await _log_whatsapp(log_data, log_to_db)
         return False
 
@@ -1385,6 +1145,7 @@ async def _send_whatsapp_evolution(
             and "connection closed" in str(body).lower()
         )
         if connection_closed:
+            evolution_monitor.wake()
             await asyncio.sleep(2)
             response = await _perform_send()
             try:
@@ -1422,32 +1183,32 @@ async def _send_whatsapp_evolution(
 
 async def _log_whatsapp(log_data: dict, log_to_db: bool = True):
     if log_to_db:
-        await db.whatsapp_logs.insert_one(log_data)
+        whatsapp_log_writer.add({**log_data, "stored_at": datetime.now(timezone.utc)})
+
+async def _whatsapp_unsendable(log_data: dict, log_to_db: bool, error: Exception):
+    """Log a send that was never attempted, then raise PermanentFailure (bad recipient or
+    template) or ProviderUnavailable (provider not configured); send_whatsapp turns it into False."""
+    log_data["status"] = "failed"
+    log_data["error"] = str(error)
+    await _log_whatsapp(log_data, log_to_db)
+    raise error
 
 async def _send_whatsapp_twilio(settings: dict, to_number_clean: str, message: str, log_data: dict, log_to_db: bool = True, media_url: Optional[str] = None):
     if not settings.get("twilio_account_sid"):
-        log_data["status"] = "failed"
-        log_data["error"] = "Twilio Account SID not configured"
-        await _log_whatsapp(log_data, log_to_db)
-        return False
+        await _whatsapp_unsendable(log_data, log_to_db, ProviderUnavailable("Twilio Account SID not configured"))
     if not settings.get("twilio_auth_token"):
-        log_data["status"] = "failed"
-        log_data["error"] = "Twilio Auth Token not configured"
-        await _log_whatsapp(log_data, log_to_db)
-        return False
+        await _whatsapp_unsendable(log_data, log_to_db, ProviderUnavailable("Twilio Auth Token not configured"))
     if not settings.get("twilio_whatsapp_number"):
-        log_data["status"] = "failed"
-        log_data["error"] = "Twilio WhatsApp number not configured"
-        await _log_whatsapp(log_data, log_to_db)
-        return False
+        await _whatsapp_unsendable(log_data, log_to_db, ProviderUnavailable("Twilio WhatsApp number not configured"))
 
     try:
         if settings.get("use_sandbox") and settings.get("sandbox_url"):
-            async with httpx.AsyncClient(timeout=20) as client:
-                response = await client.post(
-                    settings["sandbox_url"],
-                    data={"To": f"whatsapp:{to_number_clean}", "Body": message}
-                )
+            client = provider_http.get("twilio")
+            response = await client.post(
+                settings["sandbox_url"],
+                data={"To": f"whatsapp:{to_number_clean}", "Body": message},
+                timeout=20
+            )
             if response.status_code == 200:
                 log_data["status"] = "sent"
                 log_data["message_sid"] = "sandbox"
@@ -1458,7 +1219,12 @@ async def _send_whatsapp_twilio(settings: dict, to_number_clean: str, message: s
             return response.status_code == 200
 
         from twilio.rest import Client
-        twilio_client = Client(settings["twilio_account_sid"], settings["twilio_auth_token"])
+        # Async SDK calls on the shared pooled session (the sync client blocked the event loop)
+        twilio_client = Client(
+            settings["twilio_account_sid"],
+            settings["twilio_auth_token"],
+            http_client=provider_http.twilio_http_client()
+        )
         from_number = _normalize_phone_e164(settings["twilio_whatsapp_number"])
         twilio_kwargs = {
             "from_": f'whatsapp:{from_number}',
@@ -1467,7 +1233,7 @@ async def _send_whatsapp_twilio(settings: dict, to_number_clean: str, message: s
         }
         if media_url:
             twilio_kwargs["media_url"] = [media_url]
-        msg = twilio_client.messages.create(**twilio_kwargs)
+        msg = await twilio_client.messages.create_async(**twilio_kwargs)
         log_data["status"] = "sent"
         log_data["message_sid"] = getattr(msg, "sid", None)
         await _log_whatsapp(log_data, log_to_db)
@@ -1482,62 +1248,22 @@ async def _send_whatsapp_twilio(settings: dict, to_number_clean: str, message: s
 async def _send_whatsapp_fast2sms(settings: dict, to_number_clean: str, message: str, log_data: dict, log_to_db: bool = True, media_url: Optional[str] = None):
     api_key = settings.get("fast2sms_api_key")
     if not api_key:
-        log_data["status"] = "failed"
-        log_data["error"] = "Fast2SMS API key not configured"
-        await _log_whatsapp(log_data, log_to_db)
-        return False
+        await _whatsapp_unsendable(log_data, log_to_db, ProviderUnavailable("Fast2SMS API key not configured"))
 
     base_url = (settings.get("fast2sms_base_url") or "https://www.fast2sms.com").rstrip("/")
     endpoint = f"{base_url}/dev/whatsapp-session"
     display_number = str(settings.get("fast2sms_waba_number") or "").strip()
     phone_number_id = str(settings.get("fast2sms_phone_number_id") or "").strip()
 
-    async def _resolve_waba_sender():
-        nonlocal display_number, phone_number_id
-        if display_number and phone_number_id:
-            return
-        try:
-            async with httpx.AsyncClient(timeout=20) as client:
-                response = await client.get(
-                    f"{base_url}/dev/dlt_manager/whatsapp",
-                    headers={"authorization": api_key},
-                    params={"authorization": api_key}
-                )
-            if response.status_code >= 400:
-                return
-            data = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
-            if not isinstance(data, list):
-                return
-
-            def _digits(v):
-                return "".join(ch for ch in str(v or "") if ch.isdigit())
-
-            matched = None
-            if display_number:
-                want = _digits(display_number)
-                for row in data:
-                    if _digits(row.get("number")) == want:
-                        matched = row
-                        break
-            if not matched:
-                for row in data:
-                    if str(row.get("connection_status", "")).upper() == "CONNECTED":
-                        matched = row
-                        break
-            if not matched and data:
-                matched = data[0]
-
-            if matched:
-                display_number = display_number or str(matched.get("number") or "")
-                phone_number_id = phone_number_id or str(matched.get("phone_number_id") or "")
-                log_data["fast2sms_sender_auto_resolved"] = {
-                    "display_number": display_number,
-                    "phone_number_id": phone_number_id
-                }
-        except Exception:
-            return
-
-    await _resolve_waba_sender()
+    # One cached account lookup instead of one per message (see fast2sms_meta.py)
+    display_number, phone_number_id, resolved = await fast2sms_metadata.resolve_sender(
+        settings, display_number, phone_number_id
+    )
+    if resolved:
+        log_data["fast2sms_sender_auto_resolved"] = {
+            "display_number": display_number,
+            "phone_number_id": phone_number_id
+        }
 
     if media_url and media_url not in (message or ""):
         final_message = f"{message}\n\nInvoice PDF: {media_url}"
@@ -1608,8 +1334,8 @@ async def _send_whatsapp_fast2sms(settings: dict, to_number_clean: str, message:
         return last_response
 
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            response = await _attempt_send(client)
+        client = provider_http.get("fast2sms")
+        response = await _attempt_send(client)
         body_text = response.text[:500] if response.text else ""
         try:
             body_json = response.json()
@@ -1652,6 +1378,7 @@ async def _send_whatsapp_fast2sms_template(
     Returns:
       True/False for attempted send result,
       None when template mode is not configured for the given template (caller may fallback to session API).
+    Raises PermanentFailure when the template is selected but its message_id or variables are missing.
     """
     template_field_map = {
         "otp": "fast2sms_template_otp_message_id",
@@ -1676,10 +1403,8 @@ async def _send_whatsapp_fast2sms_template(
     message_id = str(settings.get(msg_id_key) or "").strip()
     if not message_id:
         log_data["provider_mode"] = "fast2sms_template"
-        log_data["status"] = "failed"
-        log_data["error"] = f"Fast2SMS template message_id is missing for template '{template_type}'"
-        await _log_whatsapp(log_data, log_to_db)
-        return False
+        await _whatsapp_unsendable(log_data, log_to_db, PermanentFailure(
+            f"Fast2SMS template message_id is missing for template '{template_type}'"))
 
     template_vars = template_vars or {}
     if template_type == "otp":
@@ -1724,55 +1449,18 @@ async def _send_whatsapp_fast2sms_template(
         return None
     if any(v is None for v in variables_values) or any(v == "" for v in variables_values):
         log_data["provider_mode"] = "fast2sms_template"
-        log_data["status"] = "failed"
-        log_data["error"] = f"Missing template variables for '{template_type}'"
-        await _log_whatsapp(log_data, log_to_db)
-        return False
+        await _whatsapp_unsendable(log_data, log_to_db, PermanentFailure(
+            f"Missing template variables for '{template_type}'"))
 
     display_number = str(settings.get("fast2sms_waba_number") or "").strip()
     phone_number_id = str(settings.get("fast2sms_phone_number_id") or "").strip()
     display_number_digits = "".join(ch for ch in display_number if ch.isdigit()) if display_number else ""
 
-    async def _resolve_waba_sender():
-        nonlocal display_number, phone_number_id, display_number_digits
-        if display_number and phone_number_id:
-            return
-        try:
-            async with httpx.AsyncClient(timeout=20) as client:
-                response = await client.get(
-                    f"{base_url}/dev/dlt_manager/whatsapp",
-                    headers={"authorization": api_key},
-                    params={"authorization": api_key}
-                )
-            if response.status_code >= 400:
-                return
-            data = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
-            if not isinstance(data, list):
-                return
-            def _digits(v):
-                return "".join(ch for ch in str(v or "") if ch.isdigit())
-            matched = None
-            if display_number:
-                want = _digits(display_number)
-                for row in data:
-                    if _digits(row.get("number")) == want:
-                        matched = row
-                        break
-            if not matched:
-                for row in data:
-                    if str(row.get("connection_status", "")).upper() == "CONNECTED":
-                        matched = row
-                        break
-            if not matched and data:
-                matched = data[0]
-            if matched:
-                display_number = display_number or str(matched.get("number") or "")
-                phone_number_id = phone_number_id or str(matched.get("phone_number_id") or "")
-                display_number_digits = "".join(ch for ch in display_number if ch.isdigit()) if display_number else ""
-        except Exception:
-            return
-
-    await _resolve_waba_sender()
+    display_number, phone_number_id, resolved = await fast2sms_metadata.resolve_sender(
+        settings, display_number, phone_number_id
+    )
+    if resolved:
+        display_number_digits = "".join(ch for ch in display_number if ch.isdigit()) if display_number else ""
     endpoint = f"{base_url}/dev/whatsapp"
     headers = {"authorization": api_key}
     numbers_variants = [to_number_clean, to_number_clean.lstrip("+")]
@@ -1807,51 +1495,51 @@ async def _send_whatsapp_fast2sms_template(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            last_resp = None
-            attempts = []
-            for sender in sender_variants:
-                for num in numbers_variants:
-                    body = {**payload_base, **sender, "numbers": num}
-                    variants = [
-                        ("get", body),
-                        ("post_json", body),
-                        ("post_form", body),
-                    ]
-                    for mode, payload in variants:
-                        attempts.append({"mode": mode, "keys": sorted(list(payload.keys()))})
-                        if mode == "get":
-                            resp = await client.get(endpoint, headers=headers, params={**payload, "authorization": api_key})
-                        elif mode == "post_json":
-                            resp = await client.post(endpoint, headers=headers, json=payload)
-                        else:
-                            resp = await client.post(endpoint, headers=headers, data=payload)
-                        last_resp = resp
-                        if 200 <= resp.status_code < 300:
-                            try:
-                                body_json = resp.json()
-                            except Exception:
-                                body_json = None
-                            failed_flag = isinstance(body_json, dict) and (
-                                body_json.get("return") is False or str(body_json.get("status", "")).lower() in {"fail", "failed", "error"}
-                            )
-                            if not failed_flag:
-                                log_data["provider_mode"] = "fast2sms_template"
-                                log_data["provider_attempts"] = attempts
-                                log_data["status"] = "sent"
-                                log_data["message_sid"] = (body_json or {}).get("request_id") or (body_json or {}).get("message_id") or "fast2sms-template"
-                                log_data["provider_response"] = body_json or resp.text[:500]
-                                await _log_whatsapp(log_data, log_to_db)
-                                return True
-            if last_resp is None:
-                return None
-            err_text = last_resp.text[:500] if getattr(last_resp, "text", None) else ""
-            log_data["provider_mode"] = "fast2sms_template"
-            log_data["provider_attempts"] = attempts
-            log_data["status"] = "failed"
-            log_data["error"] = f"Fast2SMS template API returned status {last_resp.status_code}: {err_text}"
-            await _log_whatsapp(log_data, log_to_db)
-            return False
+        client = provider_http.get("fast2sms")
+        last_resp = None
+        attempts = []
+        for sender in sender_variants:
+            for num in numbers_variants:
+                body = {**payload_base, **sender, "numbers": num}
+                variants = [
+                    ("get", body),
+                    ("post_json", body),
+                    ("post_form", body),
+                ]
+                for mode, payload in variants:
+                    attempts.append({"mode": mode, "keys": sorted(list(payload.keys()))})
+                    if mode == "get":
+                        resp = await client.get(endpoint, headers=headers, params={**payload, "authorization": api_key})
+                    elif mode == "post_json":
+                        resp = await client.post(endpoint, headers=headers, json=payload)
+                    else:
+                        resp = await client.post(endpoint, headers=headers, data=payload)
+                    last_resp = resp
+                    if 200 <= resp.status_code < 300:
+                        try:
+                            body_json = resp.json()
+                        except Exception:
+                            body_json = None
+                        failed_flag = isinstance(body_json, dict) and (
+                            body_json.get("return") is False or str(body_json.get("status", "")).lower() in {"fail", "failed", "error"}
+                        )
+                        if not failed_flag:
+                            log_data["provider_mode"] = "fast2sms_template"
+                            log_data["provider_attempts"] = attempts
+                            log_data["status"] = "sent"
+                            log_data["message_sid"] = (body_json or {}).get("request_id") or (body_json or {}).get("message_id") or "fast2sms-template"
+                            log_data["provider_response"] = body_json or resp.text[:500]
+                            await _log_whatsapp(log_data, log_to_db)
+                            return True
+        if last_resp is None:
+            return None
+        err_text = last_resp.text[:500] if getattr(last_resp, "text", None) else ""
+        log_data["provider_mode"] = "fast2sms_template"
+        log_data["provider_attempts"] = attempts
+        log_data["status"] = "failed"
+        log_data["error"] = f"Fast2SMS template API returned status {last_resp.status_code}: {err_text}"
+        await _log_whatsapp(log_data, log_to_db)
+        return False
     except Exception as e:
         log_data["provider_mode"] = "fast2sms_template"
         log_data["status"] = "failed"
@@ -1869,10 +1557,14 @@ async def send_whatsapp(
     media_filename: Optional[str] = None,
     media_mimetype: Optional[str] = None,
     template_type: Optional[str] = None,
-    template_vars: Optional[dict] = None
+    template_vars: Optional[dict] = None,
+    raise_unsendable: bool = False
 ):
-    """Send WhatsApp message using configured provider (Twilio, Fast2SMS, or Evolution)."""
-    settings = await db.settings.find_one({"id": "1"}, {"_id": 0}) or {}
+    """Send WhatsApp message using configured provider (Twilio, Fast2SMS, or Evolution).
+
+    Returns False when the message could not be sent. With raise_unsendable (the outbox),
+    PermanentFailure / ProviderUnavailable are raised instead so the job is not retried blindly."""
+    settings = await get_cached_settings()
     provider = (settings.get("whatsapp_provider") or "twilio").lower()
     to_number_clean = _normalize_phone_e164(to_number)
 
@@ -1889,97 +1581,171 @@ async def send_whatsapp(
         "timestamp": get_ist_now().isoformat()
     }
 
-    if provider == "fast2sms":
-        if template_type:
-            template_result = await _send_whatsapp_fast2sms_template(
-                settings, to_number_clean, template_type, template_vars, dict(log_data), log_to_db
+    try:
+        if provider == "fast2sms":
+            if template_type:
+                template_result = await _send_whatsapp_fast2sms_template(
+                    settings, to_number_clean, template_type, template_vars, dict(log_data), log_to_db
+                )
+                if template_result is True:
+                    return True
+                # False means template send attempted+failed and is already logged. Do not double-send via session.
+                if template_result is False:
+                    return False
+            return await _send_whatsapp_fast2sms(settings, to_number_clean, message, log_data, log_to_db, media_url=media_url)
+        if provider == "evolution":
+            return await _send_whatsapp_evolution(
+                settings,
+                to_number_clean,
+                message,
+                log_data,
+                log_to_db,
+                media_url=media_url,
+                media_base64=media_base64,
+                media_filename=media_filename,
+                media_mimetype=media_mimetype
             )
-            if template_result is True:
-                return True
-            # False means template send attempted+failed and is already logged. Do not double-send via session.
-            if template_result is False:
-                return False
-        return await _send_whatsapp_fast2sms(settings, to_number_clean, message, log_data, log_to_db, media_url=media_url)
-    if provider == "evolution":
-        return await _send_whatsapp_evolution(
-            settings,
-            to_number_clean,
-            message,
-            log_data,
-            log_to_db,
-            media_url=media_url,
-            media_base64=media_base64,
-            media_filename=media_filename,
-            media_mimetype=media_mimetype
-        )
 
-    return await _send_whatsapp_twilio(settings, to_number_clean, message, log_data, log_to_db, media_url=media_url)
+        return await _send_whatsapp_twilio(settings, to_number_clean, message, log_data, log_to_db, media_url=media_url)
+    except (PermanentFailure, ProviderUnavailable):
+        # Already logged by _whatsapp_unsendable
+        if raise_unsendable:
+            raise
+        return False
+
+# ==================== NOTIFICATION OUTBOX ====================
+
+# Durable queue in front of send_email/send_whatsapp; workers start in lifespan
+outbox = Outbox(
+    lambda: db[OUTBOX_COLLECTION],
+    name="notification_outbox",
+    workers=int(os.environ.get("OUTBOX_WORKERS", "8")),
+    channel_limits=parse_limits(os.environ.get("OUTBOX_CHANNEL_LIMITS", "email=4,whatsapp=4")),
+    provider_limits=parse_limits(os.environ.get("OUTBOX_PROVIDER_LIMITS", "smtp=4,twilio=4,fast2sms=4,evolution=1")),
+    # Token buckets, "provider=per_second[:burst]"; Evolution sends used to be spaced 0.6s apart inline
+    provider_rates=parse_rates(os.environ.get("OUTBOX_PROVIDER_RATES", "evolution=1.6")),
+    max_attempts=int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "5")),
+    backoff_base=float(os.environ.get("OUTBOX_BACKOFF_SECONDS", "5")),
+    backoff_max=float(os.environ.get("OUTBOX_BACKOFF_MAX_SECONDS", "900")),
+    lease_seconds=float(os.environ.get("OUTBOX_LEASE_SECONDS", "300")),
+)
+
+async def _deliver_email(payload: dict) -> bool:
+    return await send_email(payload["to_email"], payload["subject"], payload["body"], payload.get("attachments"),
+                            raise_unsendable=True)
+
+async def _deliver_whatsapp(payload: dict) -> bool:
+    return await send_whatsapp(**payload, raise_unsendable=True)
+
+outbox.register("email", _deliver_email)
+outbox.register("whatsapp", _deliver_whatsapp)
+
+async def _probe_evolution() -> Optional[dict]:
+    """Connection state while Evolution is the active, configured provider; None otherwise"""
+    settings = await get_cached_settings()
+    if (settings.get("whatsapp_provider") or "twilio").lower() != "evolution":
+        return None
+    if not _evolution_api_base_url(settings) or not str(settings.get("evolution_api_key") or "").strip():
+        return None
+    return await _get_evolution_connection_state(settings)
+
+def _gate_evolution_jobs(disconnected: bool) -> None:
+    # Queued Evolution messages wait (attempts untouched) while the instance is down
+    if disconnected:
+        outbox.pause_provider("evolution")
+    else:
+        outbox.resume_provider("evolution")
+
+evolution_monitor = ConnectionMonitor(
+    _probe_evolution,
+    name="evolution",
+    interval=float(os.environ.get("EVOLUTION_MONITOR_INTERVAL_SECONDS", "30")),
+    max_interval=float(os.environ.get("EVOLUTION_MONITOR_MAX_INTERVAL_SECONDS", "300")),
+    on_change=_gate_evolution_jobs,
+)
+
+# Broadcasts are outbox batches plus one progress document each
+broadcast_jobs = BroadcastJobs(lambda: db[BROADCAST_COLLECTION], outbox, get_ist_now)
+
+async def current_whatsapp_provider() -> str:
+    settings = await get_cached_settings()
+    return (settings.get("whatsapp_provider") or "twilio").lower()
+
+def email_job(to_email: str, subject: str, body: str, attachments: Optional[List[dict]] = None,
+              idempotency_key: Optional[str] = None) -> dict:
+    return {
+        "channel": "email",
+        "provider": "smtp",
+        "payload": {"to_email": to_email, "subject": subject, "body": body, "attachments": attachments},
+        "idempotency_key": idempotency_key,
+    }
+
+def whatsapp_job(provider: str, to_number: str, message: str, idempotency_key: Optional[str] = None, **options) -> dict:
+    """``options`` are the remaining send_whatsapp keyword arguments (media_*, template_*)."""
+    return {
+        "channel": "whatsapp",
+        "provider": provider,
+        "payload": {"to_number": to_number, "message": message, "log_to_db": True, **options},
+        "idempotency_key": idempotency_key,
+    }
+
+async def queue_email(to_email: str, subject: str, body: str, attachments: Optional[List[dict]] = None,
+                      idempotency_key: Optional[str] = None) -> str:
+    """Enqueue an email for the outbox workers; returns the job id"""
+    job = email_job(to_email, subject, body, attachments, idempotency_key)
+    return await outbox.enqueue(job["channel"], job["payload"], job["provider"], job["idempotency_key"])
 
-async def send_notification(user: dict, template_type: str, variables: dict, background_tasks: BackgroundTasks = None):
-    """Send notification via both email and WhatsApp"""
+async def queue_whatsapp(to_number: str, message: str, idempotency_key: Optional[str] = None, **options) -> str:
+    """Enqueue a WhatsApp message for the outbox workers; returns the job id"""
+    job = whatsapp_job(await current_whatsapp_provider(), to_number, message, idempotency_key, **options)
+    return await outbox.enqueue(job["channel"], job["payload"], job["provider"], job["idempotency_key"])
+
+def _channel_key(idempotency_key: Optional[str], channel: str) -> Optional[str]:
+    return f"{idempotency_key}:{channel}" if idempotency_key else None
+
+async def send_notification(user: dict, template_type: str, variables: dict, background_tasks: BackgroundTasks = None,
+                            idempotency_key: Optional[str] = None):
+    """Queue a notification via both email and WhatsApp (delivered by the outbox workers).
+
+    ``background_tasks`` is accepted for existing callers and no longer used.
+    ``idempotency_key`` (suffixed per channel) prevents a repeat run from sending twice.
+    """
     # Prepare variables
     vars_with_user = {**variables, "name": user.get("name"), "member_id": user.get("member_id")}
     
-    # Get templates
-    email_template = await get_template(template_type, "email")
-    whatsapp_template = await get_template(template_type, "whatsapp")
+    # Get templates (compiled, from the registry)
+    email_template = await template_registry.get(db, template_type, "email")
+    whatsapp_template = await template_registry.get(db, template_type, "whatsapp")
     
     send_email_allowed = True
     send_whatsapp_allowed = True
     if template_type == "attendance":
-        settings = await db.settings.find_one(
-            {"id": "1"},
-            {"_id": 0, "attendance_confirmation_whatsapp_enabled": 1, "attendance_confirmation_email_enabled": 1, "absent_warning_whatsapp_enabled": 1}
-        ) or {}
+        settings = await get_cached_settings()
         send_whatsapp_allowed = settings.get("attendance_confirmation_whatsapp_enabled", True)
         send_email_allowed = settings.get("attendance_confirmation_email_enabled", True)
     elif template_type == "absent_warning":
-        settings = await db.settings.find_one(
-            {"id": "1"},
-            {"_id": 0, "absent_warning_whatsapp_enabled": 1}
-        ) or {}
+        settings = await get_cached_settings()
         send_whatsapp_allowed = settings.get("absent_warning_whatsapp_enabled", True)
 
     # Send email - wrap in professional template
-    if send_email_allowed and user.get("email") and email_template.get("content"):
-        subject = replace_template_vars(email_template.get("subject", "F3 Fitness Notification"), vars_with_user)
-        content = replace_template_vars(email_template["content"], vars_with_user)
+    if send_email_allowed and user.get("email") and email_template.content:
+        subject = email_template.render_subject(vars_with_user, "F3 Fitness Notification")
+        content = email_template.render_content(vars_with_user)
         # Wrap content in professional template
         body = wrap_email_in_template(content, subject)
-        if background_tasks:
-            background_tasks.add_task(send_email, user["email"], subject, body)
-        else:
-            await send_email(user["email"], subject, body)
+        await queue_email(user["email"], subject, body, idempotency_key=_channel_key(idempotency_key, "email"))
     
     # Send WhatsApp (attendance confirmations can be disabled independently to save cost)
-    if send_whatsapp_allowed and user.get("phone_number") and whatsapp_template.get("content"):
+    if send_whatsapp_allowed and user.get("phone_number") and whatsapp_template.content:
         phone = user.get("country_code", "+91") + user["phone_number"].lstrip("0")
-        message = replace_template_vars(whatsapp_template["content"], vars_with_user)
-        if background_tasks:
-            background_tasks.add_task(
-                send_whatsapp,
-                to_number=phone,
-                message=message,
-                log_to_db=True,
-                media_url=None,
-                media_base64=None,
-                media_filename=None,
-                media_mimetype=None,
-                template_type=template_type,
-                template_vars=vars_with_user
-            )
-        else:
-            await send_whatsapp(
-                to_number=phone,
-                message=message,
-                log_to_db=True,
-                media_url=None,
-                media_base64=None,
-                media_filename=None,
-                media_mimetype=None,
-                template_type=template_type,
-                template_vars=vars_with_user
-            )
+        message = whatsapp_template.render_content(vars_with_user)
+        await queue_whatsapp(
+            phone,
+            message,
+            idempotency_key=_channel_key(idempotency_key, "whatsapp"),
+            template_type=template_type,
+            template_vars=vars_with_user
+        )
 
 async def send_account_credentials_notification(
     user: dict,
@@ -1987,7 +1753,7 @@ async def send_account_credentials_notification(
     plain_password: str,
     background_tasks: Optional[BackgroundTasks] = None
 ):
-    """Send account-created login credentials to member via email + WhatsApp."""
+    """Queue account-created login credentials to member via email + WhatsApp."""
     vars_with_user = {
         "name": user.get("name"),
         "member_id": user.get("member_id"),
@@ -2005,39 +1771,17 @@ async def send_account_credentials_notification(
         )
         content = replace_template_vars(email_template["content"], vars_with_user)
         body = wrap_email_in_template(content, subject)
-        if background_tasks:
-            background_tasks.add_task(send_email, user["email"], subject, body)
-        else:
-            await send_email(user["email"], subject, body)
+        await queue_email(user["email"], subject, body)
 
     if user.get("phone_number") and whatsapp_template.get("content"):
         phone = user.get("country_code", "+91") + user["phone_number"].lstrip("0")
         message = replace_template_vars(whatsapp_template["content"], vars_with_user)
-        if background_tasks:
-            background_tasks.add_task(
-                send_whatsapp,
-                to_number=phone,
-                message=message,
-                log_to_db=True,
-                media_url=None,
-                media_base64=None,
-                media_filename=None,
-                media_mimetype=None,
-                template_type="new_user_credentials",
-                template_vars=vars_with_user
-            )
-        else:
-            await send_whatsapp(
-                to_number=phone,
-                message=message,
-                log_to_db=True,
-                media_url=None,
-                media_base64=None,
-                media_filename=None,
-                media_mimetype=None,
-                template_type="new_user_credentials",
-                template_vars=vars_with_user
-            )
+        await queue_whatsapp(
+            phone,
+            message,
+            template_type="new_user_credentials",
+            template_vars=vars_with_user
+        )
 
 async def send_notification_to_all(template_type: str, variables: dict, background_tasks: BackgroundTasks):
     """Send notification to all active members"""
@@ -2071,7 +1815,7 @@ async def send_expiry_reminders():
                 await send_notification(user, "renewal_reminder", {
                     "expiry_date": expiry.strftime("%d %b %Y"),
                     "days_left": days_left
-                })
+                }, idempotency_key=f"renewal_reminder:{membership.get('id')}:{now.date().isoformat()}")
         
         logger.info(f"Sent {len(memberships)} expiry reminders")
     except Exception as e:
@@ -2081,16 +1825,11 @@ async def send_birthday_wishes():
     """Send birthday wishes to members"""
     logger.info("Running birthday wishes task...")
     try:
-        now = get_ist_now()
-        today_str = now.strftime("%m-%d")
-        
-        users = await db.users.find({
-            "role": "member",
-            "date_of_birth": {"$regex": f".*-{today_str}$"}
-        }, {"_id": 0}).to_list(1000)
+        today = get_ist_now().date()
+        users = await find_birthdays(db, today, 0, extra_filter={"role": "member"})
         
         for user in users:
-            await send_notification(user, "birthday", {})
+            await send_notification(user, "birthday", {}, idempotency_key=f"birthday:{user.get('id')}:{today.isoformat()}")
         
         logger.info(f"Sent {len(users)} birthday wishes")
     except Exception as e:
@@ -2124,13 +1863,45 @@ async def send_freeze_ending_tomorrow_reminders():
                 await send_notification(user, "freeze_ending_tomorrow", {
                     "freeze_end_date": freeze_end.strftime("%d %b %Y"),
                     "new_expiry_date": datetime.fromisoformat(membership["end_date"]).strftime("%d %b %Y")
-                })
+                }, idempotency_key=f"freeze_ending_tomorrow:{membership.get('id')}:{freeze_end.isoformat()}")
                 sent_count += 1
                 break
         logger.info(f"Sent {sent_count} freeze ending tomorrow reminders")
     except Exception as e:
         logger.error(f"Error in freeze ending tomorrow reminders: {e}")
 
+RETENTION_ARCHIVE_HOUR = int(os.environ.get("RETENTION_ARCHIVE_HOUR", "3"))
+RETENTION_LEASE = "retention"
+
+async def run_retention(force: bool = False) -> Optional[dict]:
+    """Archive and delete expired logs/OTPs (retention.py); once per IST day unless forced.
+
+    Returns None when another worker holds the lease or today's run is done.
+    """
+    day = get_ist_now().date().isoformat()
+    # A forced run only waits out a run in progress; it still counts as today's
+    if not await acquire_daily_lease(db, RETENTION_LEASE, f"manual-{uuid.uuid4()}" if force else day):
+        return None
+    report = {"day": day, "started_at": get_ist_now().isoformat()}
+    try:
+        report["collections"] = await archive_expired(db, RETENTION_POLICIES, transforms={"email_logs": email_bodies.expand})
+        email_policy = RETENTION_POLICIES.get("email_logs")
+        if email_policy and email_policy.days:
+            # Bodies whose logs were just archived; buffered logs must be in the collection first
+            await email_log_writer.flush()
+            report["orphan_bodies_deleted"] = await sweep_orphan_bodies(
+                db, "email_logs", BODY_COLLECTION, datetime.now(timezone.utc) - timedelta(days=1)
+            )
+            email_bodies.forget()
+        for log_stats in (email_log_stats, whatsapp_log_stats):
+            if any(entry.get("collection") == log_stats.name and entry.get("deleted") for entry in report["collections"]):
+                await log_stats.reset()
+        report["finished_at"] = get_ist_now().isoformat()
+        logger.info(f"Retention run complete: {report}")
+    finally:
+        await release_daily_lease(db, RETENTION_LEASE, day, report)
+    return report
+
 async def scheduler_loop():
     """Background scheduler that runs daily tasks"""
     while True:
@@ -2141,16 +1912,45 @@ async def scheduler_loop():
                 await send_expiry_reminders()
                 await send_birthday_wishes()
                 await send_freeze_ending_tomorrow_reminders()
+            # Nightly log archival; the lease makes later checks today no-ops
+            if now.hour >= RETENTION_ARCHIVE_HOUR:
+                await run_retention()
             await asyncio.sleep(300)  # Check every 5 minutes
         except Exception as e:
             logger.error(f"Scheduler error: {e}")
             await asyncio.sleep(60)
 
 scheduler_task = None
+# One-off startup jobs (backfills); cancelled on shutdown if still running
+startup_tasks: List[asyncio.Task] = []
+
+async def _run_logged(label: str, coro):
+    try:
+        await coro
+    except Exception as e:
+        logger.error(f"{label} failed: {e}")
 
 @asynccontextmanager
 async def lifespan(app):
-    global scheduler_task
+    global scheduler_task, startup_tasks
+    # Make sure hot-path query indexes exist before serving traffic
+    if os.environ.get("MONGO_ENSURE_INDEXES", "true").lower() not in ("0", "false", "no"):
+        try:
+            index_report = await reconcile_indexes(db)
+            logger.info(f"Index reconciliation complete:\n{summarize_report(index_report)}")
+        except Exception as e:
+            logger.error(f"Index reconciliation failed: {e}")
+    activity_writer.start()
+    for writer in MESSAGE_LOG_WRITERS:
+        writer.start()
+    provider_http.open()
+    outbox.start()
+    evolution_monitor.start()
+    # First boot after the summary collection was introduced: backfill it
+    startup_tasks = [
+        asyncio.create_task(_run_logged("attendance summary backfill", ensure_attendance_summaries(db))),
+        asyncio.create_task(_run_logged("birthday key backfill", backfill_dob_keys(db))),
+    ]
     # Start scheduler on startup
     scheduler_task = asyncio.create_task(scheduler_loop())
     logger.info("Scheduler started")
@@ -2163,6 +1963,22 @@ async def lifespan(app):
         except asyncio.CancelledError:
             pass
     logger.info("Scheduler stopped")
+    # Both backfills resume on the next boot
+    for task in startup_tasks:
+        task.cancel()
+    await asyncio.gather(*startup_tasks, return_exceptions=True)
+    startup_tasks = []
+    await evolution_monitor.stop()
+    # Let in-flight sends finish; unfinished jobs are re-claimed after their lease
+    await outbox.stop(timeout=float(os.environ.get("OUTBOX_SHUTDOWN_TIMEOUT_SECONDS", "10")))
+    # Drain buffered audit and delivery log entries before the Mongo client goes away
+    await activity_writer.stop()
+    for writer in MESSAGE_LOG_WRITERS:
+        await writer.stop()
+    await provider_http.aclose()
+    await smtp_pool.close()
+    password_service.shutdown(wait=False)
+    client.close()
 
 # ==================== OTP ROUTES ====================
 
@@ -2194,7 +2010,8 @@ async def send_otp(req: SendOTPRequest, background_tasks: BackgroundTasks):
         "otp": otp,  # Single OTP for both channels
         "email": req.email,
         "expires_at": (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat(),
-        "verified": False
+        "verified": False,
+        "stored_at": datetime.now(timezone.utc),
     }
     
     await db.otps.delete_many({"phone_number": req.phone_number})
@@ -2284,10 +2101,11 @@ async def signup_with_otp(user: SignupWithOTP, background_tasks: BackgroundTasks
         "phone": f"{user.country_code}{user.phone_number.lstrip('0')}",
         "phone_number": user.phone_number,
         "country_code": user.country_code,
-        "password_hash": hash_password(user.password),
+        "password_hash": await hash_password(user.password),
         "role": "member",
         "gender": user.gender,
         "date_of_birth": user.date_of_birth,
+        **dob_keys(user.date_of_birth),
         "address": user.address,
         "city": user.city,
         "zip_code": user.zip_code,
@@ -2302,6 +2120,7 @@ async def signup_with_otp(user: SignupWithOTP, background_tasks: BackgroundTasks
     }
     
     await db.users.insert_one(user_doc)
+    await bump_daily_stats(db, stats_day(), inc={"total_members": 1})
     
     # Clean up OTP
     await db.otps.delete_one({"phone_number": user.phone_number})
@@ -2331,10 +2150,11 @@ async def signup(user: UserCreate, background_tasks: BackgroundTasks):
         "email": user.email,
         "phone_number": user.phone_number,
         "country_code": user.country_code,
-        "password_hash": hash_password(user.password),
+        "password_hash": await hash_password(user.password),
         "role": "member",
         "gender": user.gender,
         "date_of_birth": user.date_of_birth,
+        **dob_keys(user.date_of_birth),
         "address": user.address,
         "city": user.city,
         "zip_code": user.zip_code,
@@ -2348,6 +2168,7 @@ async def signup(user: UserCreate, background_tasks: BackgroundTasks):
     }
     
     await db.users.insert_one(user_doc)
+    await bump_daily_stats(db, stats_day(), inc={"total_members": 1})
     
     # Send account credentials notification
     await send_account_credentials_notification(user_doc, user.email, user.password, background_tasks)
@@ -2361,7 +2182,7 @@ async def login(credentials: UserLogin, request: Request):
         "$or": [{"email": credentials.email_or_phone}, {"phone_number": credentials.email_or_phone}]
     })
     
-    if not user or not verify_password(credentials.password, user["password_hash"]):
+    if not user or not await verify_password(credentials.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Check if user is active
@@ -2419,7 +2240,7 @@ async def reset_password(req: ResetPasswordRequest):
     if datetime.fromisoformat(reset["expires_at"]) < datetime.now(timezone.utc):
         raise HTTPException(status_code=400, detail="OTP/Token expired")
     
-    await db.users.update_one({"id": reset["user_id"]}, {"$set": {"password_hash": hash_password(req.new_password)}})
+    await db.users.update_one({"id": reset["user_id"]}, {"$set": {"password_hash": await hash_password(req.new_password)}})
     await db.password_resets.update_one({"_id": reset["_id"]}, {"$set": {"used": True}})
     await log_activity(
         reset["user_id"],
@@ -2439,7 +2260,7 @@ async def change_password(
     """Change password for logged in user"""
     user = await db.users.find_one({"id": current_user["id"]})
     
-    if not verify_password(current_password, user["password_hash"]):
+    if not await verify_password(current_password, user["password_hash"]):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
     if len(new_password) < 6:
@@ -2447,7 +2268,7 @@ async def change_password(
     
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {"password_hash": hash_password(new_password)}}
+        {"$set": {"password_hash": await hash_password(new_password)}}
     )
     await log_activity(
         current_user["id"],
@@ -2460,7 +2281,11 @@ async def change_password(
 
 @api_router.get("/auth/me", response_model=UserResponse)
 async def get_me(current_user: dict = Depends(get_current_user)):
-    return current_user
+    # current_user is a slim cached projection; the profile needs the full document
+    user = await db.users.find_one({"id": current_user["id"]}, {"_id": 0, "password_hash": 0})
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
 
 # ==================== USERS/MEMBERS ROUTES ====================
 
@@ -2515,10 +2340,11 @@ async def create_user(user: UserCreate, role: str = "member", current_user: dict
         "email": user.email,
         "phone_number": user.phone_number,
         "country_code": user.country_code,
-        "password_hash": hash_password(user.password),
+        "password_hash": await hash_password(user.password),
         "role": role,
         "gender": user.gender,
         "date_of_birth": user.date_of_birth,
+        **dob_keys(user.date_of_birth),
         "address": user.address,
         "city": user.city,
         "zip_code": user.zip_code,
@@ -2533,6 +2359,8 @@ async def create_user(user: UserCreate, role: str = "member", current_user: dict
     }
     
     await db.users.insert_one(user_doc)
+    if user_doc.get("role") == "member":
+        await bump_daily_stats(db, stats_day(), inc={"total_members": 1})
     
     # Send account credentials notification for admin-created users
     await send_account_credentials_notification(user_doc, user.email, user.password, background_tasks)
@@ -2553,8 +2381,13 @@ async def update_user(user_id: str, update: UserUpdate, current_user: dict = Dep
     
     if "role" in update_data and current_user["role"] != "admin":
         del update_data["role"]
+    if "date_of_birth" in update_data:
+        update_data.update(dob_keys(update_data["date_of_birth"]))
     
     await db.users.update_one({"id": user_id}, {"$set": update_data})
+    user_cache.invalidate(user_id)
+    if "date_of_birth" in update_data:
+        await bump_daily_stats(db, stats_day(), stale="birthdays")
     user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
     return user
 
@@ -2564,10 +2397,14 @@ async def delete_user(user_id: str, current_user: dict = Depends(get_admin_user)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    await stats_user_removed(user)
     await db.users.delete_one({"id": user_id})
+    user_cache.invalidate(user_id)
     # Also delete related data
+    await invoice_pdfs.forget_user(user_id)
     await db.memberships.delete_many({"user_id": user_id})
     await db.attendance.delete_many({"user_id": user_id})
+    await remove_summaries(db, [user_id])
     await db.health_logs.delete_many({"user_id": user_id})
     await db.calorie_logs.delete_many({"user_id": user_id})
     
@@ -2670,9 +2507,13 @@ async def bulk_delete_users(
     for user_id in user_ids:
         user = await db.users.find_one({"id": user_id})
         if user and user.get("role") != "admin":
+            await stats_user_removed(user)
             await db.users.delete_one({"id": user_id})
+            user_cache.invalidate(user_id)
+            await invoice_pdfs.forget_user(user_id)
             await db.memberships.delete_many({"user_id": user_id})
             await db.attendance.delete_many({"user_id": user_id})
+            await remove_summaries(db, [user_id])
             await db.health_logs.delete_many({"user_id": user_id})
             await db.calorie_logs.delete_many({"user_id": user_id})
             deleted_count += 1
@@ -2696,6 +2537,7 @@ async def toggle_user_status(
     
     is_disabled = action == "disable"
     await db.users.update_one({"id": user_id}, {"$set": {"is_disabled": is_disabled}})
+    user_cache.invalidate(user_id)
     
     # Send notification
     if background_tasks:
@@ -2741,6 +2583,8 @@ async def revoke_membership(
         {"id": membership["id"]},
         {"$set": {"status": "revoked", "revoked_at": get_ist_now().isoformat()}}
     )
+    user_cache.invalidate(user_id)
+    await stats_membership_status_changed(user_id, "active", "revoked")
     
     # Send notification
     if background_tasks:
@@ -2806,8 +2650,9 @@ async def admin_reset_user_password(
     
     await db.users.update_one(
         {"id": user_id},
-        {"$set": {"password_hash": hash_password(new_password)}}
+        {"$set": {"password_hash": await hash_password(new_password)}}
     )
+    user_cache.invalidate(user_id)
     
     # Send notification with new password
     if background_tasks:
@@ -3057,6 +2902,7 @@ async def create_membership(membership: MembershipCreate, background_tasks: Back
     }
     
     await db.memberships.insert_one(membership_doc)
+    await stats_membership_status_changed(membership.user_id, None, "active")
     
     # Add PT sessions if plan includes PT
     if plan.get("includes_pt") and plan.get("pt_sessions", 0) > 0:
@@ -3090,6 +2936,7 @@ async def create_membership(membership: MembershipCreate, background_tasks: Back
             "recorded_by_admin_id": current_user["id"]
         }
         await db.payments.insert_one(payment_doc)
+        await stats_record_payment(payment_doc)
         
         # Send payment notification
         await send_notification(user, "payment_received", {
@@ -3114,9 +2961,14 @@ async def create_membership(membership: MembershipCreate, background_tasks: Back
 
 @api_router.put("/memberships/{membership_id}/cancel")
 async def cancel_membership(membership_id: str, current_user: dict = Depends(get_admin_user)):
-    result = await db.memberships.update_one({"id": membership_id}, {"$set": {"status": "cancelled"}})
-    if result.matched_count == 0:
+    previous = await db.memberships.find_one_and_update(
+        {"id": membership_id},
+        {"$set": {"status": "cancelled"}},
+        projection={"_id": 0, "user_id": 1, "status": 1}
+    )
+    if previous is None:
         raise HTTPException(status_code=404, detail="Membership not found")
+    await stats_membership_status_changed(previous.get("user_id"), previous.get("status"), "cancelled")
     return {"message": "Membership cancelled"}
 
 @api_router.post("/memberships/{membership_id}/freeze")
@@ -3196,12 +3048,13 @@ async def freeze_membership(
         }
     }
     await db.memberships.update_one({"id": membership_id}, update_doc)
+    await bump_daily_stats(db, stats_day(), stale="renewals")
 
     # Optional freeze fee payment record
     if req.freeze_fee and req.freeze_fee > 0:
         payment_id = str(uuid.uuid4())
         receipt_no = f"F3-FRZ-{datetime.now().strftime('%Y%m%d')}-{payment_id[:8].upper()}"
-        await db.payments.insert_one({
+        freeze_payment_doc = {
             "id": payment_id,
             "receipt_no": receipt_no,
             "membership_id": membership_id,
@@ -3211,7 +3064,9 @@ async def freeze_membership(
             "payment_method": req.payment_method,
             "notes": req.notes or f"Membership freeze fee ({freeze_days} days)",
             "recorded_by_admin_id": current_user["id"]
-        })
+        }
+        await db.payments.insert_one(freeze_payment_doc)
+        await stats_record_payment(freeze_payment_doc)
 
     await log_activity(
         current_user["id"],
@@ -3326,6 +3181,7 @@ async def edit_membership_freeze(
             "updated_at": now_iso
         }}
     )
+    await bump_daily_stats(db, stats_day(), stale="renewals")
 
     await log_activity(
         current_user["id"],
@@ -3407,6 +3263,7 @@ async def end_membership_freeze_early(
             "updated_at": now_iso
         }}
     )
+    await bump_daily_stats(db, stats_day(), stale="renewals")
 
     await log_activity(
         current_user["id"],
@@ -3472,6 +3329,7 @@ async def cancel_upcoming_membership_freeze(
             "updated_at": now_iso
         }}
     )
+    await bump_daily_stats(db, stats_day(), stale="renewals")
 
     await log_activity(
         current_user["id"],
@@ -3490,13 +3348,25 @@ async def cancel_upcoming_membership_freeze(
 
 # ==================== PAYMENTS ROUTES ====================
 
+PAYMENTS_PAGE_SIZE = int(os.environ.get("PAYMENTS_PAGE_SIZE", "50"))
+PAYMENTS_MAX_PAGE_SIZE = 500
+
 @api_router.get("/payments", response_model=List[PaymentResponse])
 async def get_payments(
+    response: Response,
     user_id: Optional[str] = None,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
+    """List payments newest first.
+
+    Keyset paginated: pass ``limit`` and then the ``X-Next-Cursor`` response
+    header of the previous page as ``cursor``. Without ``limit`` a page of
+    PAYMENTS_PAGE_SIZE is returned (X-Has-More tells whether history continues).
+    """
     query = {}
     
     # Non-admin users can only see their own payments
@@ -3513,13 +3383,20 @@ async def get_payments(
         else:
             query["payment_date"] = {"$lte": date_to}
     
-    payments = await db.payments.find(query, {"_id": 0}).sort("payment_date", -1).to_list(1000)
+    page_size = min(max(1, limit or PAYMENTS_PAGE_SIZE), PAYMENTS_MAX_PAGE_SIZE)
+    query = merge_filters(query, keyset_filter("payment_date", cursor))
+    payments = await db.payments.find(query, {"_id": 0}).sort(keyset_sort("payment_date")).to_list(page_size + 1)
+    cursor_token = next_cursor(payments, page_size, "payment_date")
+    response.headers["X-Has-More"] = "true" if cursor_token else "false"
+    if cursor_token:
+        response.headers["X-Next-Cursor"] = cursor_token
     
+    users = await fetch_users_by_id(p["user_id"] for p in payments)
     for p in payments:
-        user = await db.users.find_one({"id": p["user_id"]}, {"_id": 0, "name": 1, "member_id": 1})
+        user = users.get(p["user_id"])
         if user:
-            p["user_name"] = user["name"]
-            p["member_id"] = user["member_id"]
+            p["user_name"] = user.get("name")
+            p["member_id"] = user.get("member_id")
     
     return payments
 
@@ -3603,6 +3480,7 @@ async def create_payment(payment: PaymentCreate, background_tasks: BackgroundTas
     }
     
     await db.payments.insert_one(payment_doc)
+    await stats_record_payment(payment_doc)
     await log_activity(
         current_user["id"],
         "payment_added",
@@ -3633,20 +3511,13 @@ async def create_payment(payment: PaymentCreate, background_tasks: BackgroundTas
 
 # ==================== INVOICE ROUTES ====================
 
-async def _build_invoice_pdf_bytes(payment_id: str):
-    """Generate invoice PDF bytes and filename for a payment."""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import mm
-    from reportlab.lib.colors import HexColor
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER, TA_RIGHT
-
+async def _invoice_inputs(payment_id: str):
+    """Everything printed on a payment's invoice: (payment, user, membership, plan)."""
     payment = await db.payments.find_one({"id": payment_id}, {"_id": 0})
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
 
-    user = await db.users.find_one({"id": payment["user_id"]}, {"_id": 0})
+    user = await db.users.find_one({"id": payment["user_id"]}, {"_id": 0, "name": 1, "member_id": 1, "phone_number": 1, "email": 1})
 
     membership = None
     plan = None
@@ -3654,6 +3525,36 @@ async def _build_invoice_pdf_bytes(payment_id: str):
         membership = await db.memberships.find_one({"id": payment["membership_id"]}, {"_id": 0})
         if membership:
             plan = await db.plans.find_one({"id": membership["plan_id"]}, {"_id": 0})
+    return payment, user, membership, plan
+
+async def _invoice_version(payment_id: str):
+    """(content version, inputs) of a payment's invoice; see invoice_cache.py"""
+    inputs = await _invoice_inputs(payment_id)
+    settings = await get_cached_settings() or {}
+    gym = {key: settings.get(key) for key in ("gym_name", "gym_address", "gym_phone", "gym_email")}
+    return content_version(*inputs, gym), inputs
+
+async def _build_invoice_pdf_bytes(payment_id: str, prepared=None):
+    """Invoice PDF bytes and filename for a payment, rendered once per content version.
+
+    ``prepared`` is a ``_invoice_version`` result the caller already has.
+    """
+    version, inputs = prepared or await _invoice_version(payment_id)
+    payment = inputs[0]
+    pdf_bytes, filename = await invoice_pdfs.get_or_render(
+        payment_id, version, payment.get("user_id"),
+        lambda: asyncio.to_thread(_render_invoice_pdf, *inputs)
+    )
+    return pdf_bytes, filename, payment
+
+def _render_invoice_pdf(payment: dict, user: Optional[dict], membership: Optional[dict], plan: Optional[dict]):
+    """Lay out the invoice PDF with ReportLab (CPU-bound; callers run it in a thread)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib.colors import HexColor
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as RLImage
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 
     receipt_no = payment.get("receipt_no", f"F3-{payment['id'][:8].upper()}")
     payment_date = payment.get("payment_date", "")
@@ -3779,7 +3680,7 @@ async def _build_invoice_pdf_bytes(payment_id: str):
     doc.build(elements)
     pdf_bytes = buffer.getvalue()
     filename = f"F3_Invoice_{receipt_no}.pdf"
-    return pdf_bytes, filename, payment
+    return pdf_bytes, filename
 
 def _build_demo_invoice_pdf_bytes():
     """Generate a lightweight dummy invoice PDF for template tests."""
@@ -3835,7 +3736,10 @@ def _build_demo_invoice_pdf_bytes():
     return buffer.getvalue(), filename
 
 async def send_invoice_to_member(user: dict, payment_id: str, background_tasks: Optional[BackgroundTasks] = None):
-    """Send invoice PDF by email attachment and WhatsApp (media/link) after payment creation."""
+    """Queue invoice PDF by email attachment and WhatsApp (media/link) after payment creation.
+
+    Keyed on the payment id, so a retried request never sends the invoice twice.
+    """
     payment = await db.payments.find_one({"id": payment_id}, {"_id": 0})
     if not payment or not user:
         return
@@ -3859,29 +3763,25 @@ async def send_invoice_to_member(user: dict, payment_id: str, background_tasks:
         "invoice_pdf_url": invoice_url
     }
 
-    email_template = await get_template("invoice_sent", "email")
-    whatsapp_template = await get_template("invoice_sent", "whatsapp")
+    email_template = await template_registry.get(db, "invoice_sent", "email")
+    whatsapp_template = await template_registry.get(db, "invoice_sent", "whatsapp")
 
-    invoice_subject = replace_template_vars(
-        email_template.get("subject", f"Invoice {receipt_no} - F3 Fitness"),
-        vars_with_user
-    )
-    invoice_email_content = replace_template_vars(email_template.get("content", ""), vars_with_user)
+    invoice_subject = email_template.render_subject(vars_with_user, f"Invoice {receipt_no} - F3 Fitness")
+    invoice_email_content = email_template.render_content(vars_with_user)
     invoice_html = wrap_email_in_template(invoice_email_content, invoice_subject)
 
     email_attachments = [{"filename": filename, "content_bytes": pdf_bytes, "content_type": "application/pdf"}]
     if user.get("email") and invoice_email_content:
-        if background_tasks:
-            background_tasks.add_task(send_email, user["email"], invoice_subject, invoice_html, email_attachments)
-        else:
-            await send_email(user["email"], invoice_subject, invoice_html, email_attachments)
+        await queue_email(
+            user["email"], invoice_subject, invoice_html, email_attachments,
+            idempotency_key=f"invoice:{payment_id}:email"
+        )
 
-    if user.get("phone_number") and whatsapp_template.get("content"):
+    if user.get("phone_number") and whatsapp_template.content:
         phone = user.get("country_code", "+91") + user["phone_number"].lstrip("0")
-        wa_text = replace_template_vars(whatsapp_template["content"], vars_with_user)
+        wa_text = whatsapp_template.render_content(vars_with_user)
         wa_text = sanitize_invoice_whatsapp_message(wa_text)
-        settings = await db.settings.find_one({"id": "1"}, {"_id": 0, "whatsapp_provider": 1}) or {}
-        provider = (settings.get("whatsapp_provider") or "twilio").lower()
+        provider = await current_whatsapp_provider()
         media_kwargs = {
             "media_url": invoice_url,
             "media_base64": None,
@@ -3895,31 +3795,16 @@ async def send_invoice_to_member(user: dict, payment_id: str, background_tasks:
                 "media_filename": filename,
                 "media_mimetype": "application/pdf"
             }
-        if background_tasks:
-            background_tasks.add_task(
-                send_whatsapp,
-                to_number=phone,
-                message=wa_text,
-                log_to_db=True,
-                media_url=media_kwargs["media_url"],
-                media_base64=media_kwargs["media_base64"],
-                media_filename=media_kwargs["media_filename"],
-                media_mimetype=media_kwargs["media_mimetype"],
-                template_type="invoice_sent",
-                template_vars=vars_with_user
-            )
-        else:
-            await send_whatsapp(
-                to_number=phone,
-                message=wa_text,
-                log_to_db=True,
-                media_url=media_kwargs["media_url"],
-                media_base64=media_kwargs["media_base64"],
-                media_filename=media_kwargs["media_filename"],
-                media_mimetype=media_kwargs["media_mimetype"],
-                template_type="invoice_sent",
-                template_vars=vars_with_user
-            )
+        job = whatsapp_job(
+            provider,
+            phone,
+            wa_text,
+            idempotency_key=f"invoice:{payment_id}:whatsapp",
+            template_type="invoice_sent",
+            template_vars=vars_with_user,
+            **media_kwargs
+        )
+        await outbox.enqueue(job["channel"], job["payload"], job["provider"], job["idempotency_key"])
 
 @api_router.get("/invoices/{payment_id}")
 async def get_invoice(payment_id: str, current_user: dict = Depends(get_current_user)):
@@ -3949,7 +3834,7 @@ async def get_invoice(payment_id: str, current_user: dict = Depends(get_current_
             amount_due = membership.get("final_price", 0) - total_paid
     
     # Get gym settings
-    settings = await db.settings.find_one({"id": "1"}, {"_id": 0})
+    settings = await get_cached_settings()
     
     return {
         "invoice": {
@@ -4018,34 +3903,35 @@ async def get_membership_payments(membership_id: str, current_user: dict = Depen
 
 # ==================== PDF INVOICE GENERATION ====================
 
+async def _invoice_pdf_response(request: Request, payment_id: str, disposition: str, prepared=None) -> Response:
+    """Cached invoice PDF with a content-version ETag; 304 when the client's copy is current."""
+    prepared = prepared or await _invoice_version(payment_id)
+    etag = etag_for(prepared[0])
+    # Revalidate on every open; an unchanged invoice costs a 304 and no render
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    pdf_bytes, filename, _ = await _build_invoice_pdf_bytes(payment_id, prepared)
+    headers["Content-Disposition"] = f'{disposition}; filename="{filename}"'
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
 @api_router.get("/invoices/{payment_id}/pdf")
-async def get_invoice_pdf(payment_id: str, current_user: dict = Depends(get_current_user)):
-    """Generate and download PDF invoice using reportlab"""
-    payment = await db.payments.find_one({"id": payment_id}, {"_id": 0})
-    if not payment:
-        raise HTTPException(status_code=404, detail="Payment not found")
+async def get_invoice_pdf(payment_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """Download the PDF invoice (cached per content version, see invoice_cache.py)"""
+    prepared = await _invoice_version(payment_id)
+    payment = prepared[1][0]
     
     # Check authorization
     if current_user["role"] != "admin" and payment["user_id"] != current_user["id"]:
         raise HTTPException(status_code=403, detail="Not authorized")
-    pdf_bytes, filename, _ = await _build_invoice_pdf_bytes(payment_id)
-    return StreamingResponse(
-        BytesIO(pdf_bytes),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
-    )
+    return await _invoice_pdf_response(request, payment_id, "attachment", prepared)
 
 @api_router.get("/invoices/{payment_id}/pdf/public")
-async def get_invoice_pdf_public(payment_id: str, token: str):
+async def get_invoice_pdf_public(payment_id: str, token: str, request: Request):
     """Public (token-protected) invoice PDF endpoint used for WhatsApp document/link sharing."""
     if not verify_invoice_share_token(token, payment_id):
         raise HTTPException(status_code=403, detail="Invalid or expired invoice token")
-    pdf_bytes, filename, _ = await _build_invoice_pdf_bytes(payment_id)
-    return StreamingResponse(
-        BytesIO(pdf_bytes),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'inline; filename=\"{filename}\"'}
-    )
+    return await _invoice_pdf_response(request, payment_id, "inline")
 
 @api_router.get("/invoices/demo/pdf/public")
 async def get_demo_invoice_pdf_public():
@@ -4059,142 +3945,151 @@ async def get_demo_invoice_pdf_public():
 
 # ==================== WHATSAPP LOGS ROUTES ====================
 
+LOG_MAX_PAGE_SIZE = 500
+
+def _log_filter(status: Optional[str], date_from: Optional[str], date_to: Optional[str], **fields) -> dict:
+    """Equality filters plus an IST timestamp range; a bare date_to covers that whole day."""
+    query = {field: value for field, value in fields.items() if value}
+    if status:
+        query["status"] = status
+    timestamp = {}
+    if date_from:
+        timestamp["$gte"] = date_from
+    if date_to:
+        if len(date_to) == 10:
+            try:
+                timestamp["$lt"] = (datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="date_to must be YYYY-MM-DD or an ISO timestamp")
+        else:
+            timestamp["$lte"] = date_to
+    if timestamp:
+        query["timestamp"] = timestamp
+    return query
+
+async def _page_logs(collection, query: dict, limit: int, skip: int, after: Optional[str], response: Response):
+    """Newest-first page of logs.
+
+    With ``after`` (the ``next_after`` of the previous page) the page is read by
+    keyset on (timestamp, id) and ``skip`` is ignored; plain ``skip`` still works.
+    """
+    page_size = min(max(1, limit), LOG_MAX_PAGE_SIZE)
+    query = merge_filters(query, keyset_filter("timestamp", after))
+    cursor = collection.find(query, {"_id": 0}).sort(keyset_sort("timestamp"))
+    if not after and skip:
+        cursor = cursor.skip(skip)
+    logs = await cursor.to_list(page_size + 1)
+    token = next_cursor(logs, page_size, "timestamp")
+    response.headers["X-Has-More"] = "true" if token else "false"
+    if token:
+        response.headers["X-Next-Cursor"] = token
+    return logs, {"skip": 0 if after else skip, "limit": page_size, "has_more": bool(token), "next_after": token}
+
 @api_router.get("/email-logs")
 async def get_email_logs(
+    response: Response,
     status: Optional[str] = None,
+    recipient: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
     limit: int = 100,
     skip: int = 0,
+    after: Optional[str] = None,
     current_user: dict = Depends(get_admin_user)
 ):
-    """Get email delivery logs with filtering"""
-    query = {}
-    if status:
-        query["status"] = status
+    """Get email delivery logs with filtering (keyset paginated with ``after``)"""
+    query = _log_filter(status, date_from, date_to, to_email=(recipient or "").strip())
 
-    logs = await db.email_logs.find(query, {"_id": 0}).sort("timestamp", -1).skip(skip).limit(limit).to_list(limit)
-
-    total = await db.email_logs.count_documents({})
-    sent = await db.email_logs.count_documents({"status": "sent"})
-    failed = await db.email_logs.count_documents({"status": "failed"})
-    pending = await db.email_logs.count_documents({"status": "pending"})
+    await email_log_writer.flush()
+    await email_bodies.writer.flush()
+    logs, pagination = await _page_logs(db.email_logs, query, limit, skip, after, response)
+    await email_bodies.expand(logs)
 
+    counts = await email_log_stats.get()
     return {
         "logs": logs,
-        "stats": {"total": total, "sent": sent, "failed": failed, "pending": pending},
-        "pagination": {"skip": skip, "limit": limit, "total": total}
+        "stats": _log_status_counts(counts),
+        "pagination": {**pagination, "total": counts["total"]}
     }
 
 @api_router.delete("/email-logs")
 async def clear_email_logs(current_user: dict = Depends(get_admin_user)):
+    await email_log_writer.flush()
     result = await db.email_logs.delete_many({})
+    await db[BODY_COLLECTION].delete_many({})
+    email_bodies.forget()
+    await email_log_stats.reset()
     return {"message": f"Deleted {result.deleted_count} log entries"}
 
-@api_router.get("/email-logs/stats")
-async def get_email_stats(current_user: dict = Depends(get_admin_user)):
-    total = await db.email_logs.count_documents({})
-    sent = await db.email_logs.count_documents({"status": "sent"})
-    failed = await db.email_logs.count_documents({"status": "failed"})
-
-    recent_failures = await db.email_logs.find(
-        {"status": "failed"},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(10).to_list(10)
-
-    today_start = get_ist_today_start().isoformat()
-    today_sent = await db.email_logs.count_documents({
-        "status": "sent",
-        "timestamp": {"$gte": today_start}
-    })
-    today_failed = await db.email_logs.count_documents({
-        "status": "failed",
-        "timestamp": {"$gte": today_start}
-    })
+def _log_status_counts(counts: dict) -> dict:
+    by_status = counts["by_status"]
+    return {
+        "total": counts["total"],
+        "sent": by_status.get("sent", 0),
+        "failed": by_status.get("failed", 0),
+        "pending": by_status.get("pending", 0),
+    }
 
+async def _log_dashboard_stats(log_stats: LogStats, writer: BufferedWriter) -> dict:
+    await writer.flush()
+    counts = await log_stats.get()
+    total, sent = counts["total"], counts["by_status"].get("sent", 0)
     return {
         "total": total,
         "sent": sent,
-        "failed": failed,
+        "failed": counts["by_status"].get("failed", 0),
         "success_rate": round((sent / total * 100), 2) if total > 0 else 0,
-        "today": {"sent": today_sent, "failed": today_failed},
-        "recent_failures": recent_failures
+        "today": {"sent": counts["today"].get("sent", 0), "failed": counts["today"].get("failed", 0)},
+        "recent_failures": counts["recent_failures"]
     }
 
+@api_router.get("/email-logs/stats")
+async def get_email_stats(current_user: dict = Depends(get_admin_user)):
+    return await _log_dashboard_stats(email_log_stats, email_log_writer)
+
 @api_router.get("/whatsapp-logs")
 async def get_whatsapp_logs(
+    response: Response,
     status: Optional[str] = None,
+    provider: Optional[str] = None,
+    recipient: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
     limit: int = 100,
     skip: int = 0,
+    after: Optional[str] = None,
     current_user: dict = Depends(get_admin_user)
 ):
-    """Get WhatsApp message logs with filtering"""
-    query = {}
-    if status:
-        query["status"] = status
-    
-    logs = await db.whatsapp_logs.find(query, {"_id": 0}).sort("timestamp", -1).skip(skip).limit(limit).to_list(limit)
+    """Get WhatsApp message logs with filtering (keyset paginated with ``after``)"""
+    query = _log_filter(
+        status, date_from, date_to,
+        provider=(provider or "").strip().lower(),
+        # Logged numbers are E.164 (see send_whatsapp)
+        to_number=_normalize_phone_e164(recipient) if recipient and recipient.strip() else None,
+    )
     
-    # Get total counts for stats
-    total = await db.whatsapp_logs.count_documents({})
-    sent = await db.whatsapp_logs.count_documents({"status": "sent"})
-    failed = await db.whatsapp_logs.count_documents({"status": "failed"})
-    pending = await db.whatsapp_logs.count_documents({"status": "pending"})
+    await whatsapp_log_writer.flush()
+    logs, pagination = await _page_logs(db.whatsapp_logs, query, limit, skip, after, response)
     
+    counts = await whatsapp_log_stats.get()
     return {
         "logs": logs,
-        "stats": {
-            "total": total,
-            "sent": sent,
-            "failed": failed,
-            "pending": pending
-        },
-        "pagination": {
-            "skip": skip,
-            "limit": limit,
-            "total": total
-        }
+        "stats": _log_status_counts(counts),
+        "pagination": {**pagination, "total": counts["total"]}
     }
 
 @api_router.delete("/whatsapp-logs")
 async def clear_whatsapp_logs(current_user: dict = Depends(get_admin_user)):
     """Clear all WhatsApp logs"""
+    await whatsapp_log_writer.flush()
     result = await db.whatsapp_logs.delete_many({})
+    await whatsapp_log_stats.reset()
     return {"message": f"Deleted {result.deleted_count} log entries"}
 
 @api_router.get("/whatsapp-logs/stats")
 async def get_whatsapp_stats(current_user: dict = Depends(get_admin_user)):
     """Get WhatsApp message statistics"""
-    total = await db.whatsapp_logs.count_documents({})
-    sent = await db.whatsapp_logs.count_documents({"status": "sent"})
-    failed = await db.whatsapp_logs.count_documents({"status": "failed"})
-    
-    # Get recent failures for debugging
-    recent_failures = await db.whatsapp_logs.find(
-        {"status": "failed"},
-        {"_id": 0}
-    ).sort("timestamp", -1).limit(10).to_list(10)
-    
-    # Get today's stats
-    today_start = get_ist_today_start().isoformat()
-    today_sent = await db.whatsapp_logs.count_documents({
-        "status": "sent",
-        "timestamp": {"$gte": today_start}
-    })
-    today_failed = await db.whatsapp_logs.count_documents({
-        "status": "failed",
-        "timestamp": {"$gte": today_start}
-    })
-    
-    return {
-        "total": total,
-        "sent": sent,
-        "failed": failed,
-        "success_rate": round((sent / total * 100), 2) if total > 0 else 0,
-        "today": {
-            "sent": today_sent,
-            "failed": today_failed
-        },
-        "recent_failures": recent_failures
-    }
+    return await _log_dashboard_stats(whatsapp_log_stats, whatsapp_log_writer)
 
 @api_router.get("/payment-requests", response_model=List[PaymentRequestResponse])
 async def get_payment_requests(status: Optional[str] = None, current_user: dict = Depends(get_admin_user)):
@@ -4289,12 +4184,25 @@ async def reject_payment_request(
 
 # ==================== ATTENDANCE ROUTES ====================
 
+ATTENDANCE_PAGE_SIZE = int(os.environ.get("ATTENDANCE_PAGE_SIZE", "50"))
+ATTENDANCE_MAX_PAGE_SIZE = 500
+
 @api_router.get("/attendance", response_model=List[AttendanceResponse])
 async def get_attendance(
+    response: Response,
     user_id: Optional[str] = None,
     date: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    include_photos: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
+    """Member check-ins newest first, joined with user details in one aggregation.
+
+    Keyset paginated on check_in_time (``limit`` / ``cursor`` + X-Next-Cursor
+    header); without ``limit`` a page of ATTENDANCE_PAGE_SIZE is returned.
+    Profile photos are only joined in with ``include_photos=true``.
+    """
     query = {}
     if user_id:
         query["user_id"] = user_id
@@ -4302,24 +4210,44 @@ async def get_attendance(
         query["user_id"] = current_user["id"]
     
     if date:
-        query["check_in_time"] = {"$regex": f"^{date}"}
-    
-    attendance = await db.attendance.find(query, {"_id": 0}).sort("check_in_time", -1).to_list(10000)
-    
-    for a in attendance:
-        user = await db.users.find_one(
-            {"id": a["user_id"]},
-            {"_id": 0, "name": 1, "member_id": 1, "profile_photo_url": 1, "gender": 1, "role": 1}
-        )
-        if user:
-            if user.get("role") != "member":
-                continue
-            a["user_name"] = user.get("name", "Unknown User")
-            a["member_id"] = user.get("member_id")
-            a["profile_photo_url"] = user.get("profile_photo_url")
-            a["gender"] = user.get("gender")
-
-    attendance = [a for a in attendance if a.get("user_name")]
+        query["check_in_time"] = {"$regex": f"^{re.escape(date)}"}
+    query = merge_filters(query, keyset_filter("check_in_time", cursor))
+    page_size = min(max(1, limit or ATTENDANCE_PAGE_SIZE), ATTENDANCE_MAX_PAGE_SIZE)
+    
+    user_fields = {"_id": 0, "name": 1, "member_id": 1, "gender": 1, "role": 1}
+    if include_photos:
+        user_fields["profile_photo_url"] = 1
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"check_in_time": -1, "id": -1}},
+        # Project inside the join so password hashes and photos never leave the users collection
+        {"$lookup": {
+            "from": "users",
+            "let": {"user_id": "$user_id"},
+            "pipeline": [{"$match": {"$expr": {"$eq": ["$id", "$$user_id"]}}}, {"$project": user_fields}],
+            "as": "user",
+        }},
+        {"$unwind": "$user"},
+        # Only members appear in the attendance log
+        {"$match": {"user.role": "member"}},
+        {"$limit": page_size + 1},
+        {"$project": {"_id": 0}},
+    ]
+    rows = await db.attendance.aggregate(pipeline).to_list(page_size + 1)
+    
+    attendance = []
+    for a in rows:
+        user = a.pop("user", None) or {}
+        a["user_name"] = user.get("name") or "Unknown User"
+        a["member_id"] = user.get("member_id")
+        a["profile_photo_url"] = user.get("profile_photo_url") if include_photos else None
+        a["gender"] = user.get("gender")
+        attendance.append(a)
+    
+    cursor_token = next_cursor(attendance, page_size, "check_in_time")
+    response.headers["X-Has-More"] = "true" if cursor_token else "false"
+    if cursor_token:
+        response.headers["X-Next-Cursor"] = cursor_token
     return attendance
 
 @api_router.get("/attendance/today")
@@ -4330,31 +4258,32 @@ async def get_today_attendance(current_user: dict = Depends(get_admin_user)):
         {"check_in_time": {"$regex": f"^{today}"}},
         {"_id": 0}
     ).to_list(10000)
-    
-    active_memberships = await db.memberships.find({"status": "active"}, {"_id": 0, "user_id": 1}).to_list(10000)
-    active_user_ids = set(m["user_id"] for m in active_memberships)
+    users = await fetch_users_by_id((a["user_id"] for a in attendance), {"name": 1, "member_id": 1, "role": 1})
 
     present = []
-    present_member_user_ids = set()
     for a in attendance:
-        user = await db.users.find_one({"id": a["user_id"]}, {"_id": 0, "name": 1, "member_id": 1, "role": 1})
+        user = users.get(a["user_id"])
         if user:
             if user.get("role") != "member":
                 continue
-            present_member_user_ids.add(a["user_id"])
             present.append({
                 **a,
                 "user_name": user.get("name", "Unknown User"),
                 "member_id": user.get("member_id")
             })
 
-    absent_user_ids = active_user_ids - present_member_user_ids
-    
-    absent = []
-    for uid in absent_user_ids:
-        user = await db.users.find_one({"id": uid}, {"_id": 0, "id": 1, "name": 1, "member_id": 1, "phone_number": 1})
-        if user:
-            absent.append(user)
+    # Active members whose summary does not show a check-in today
+    absent = await db.memberships.aggregate([
+        {"$match": {"status": "active"}},
+        {"$group": {"_id": "$user_id"}},
+        {"$lookup": {"from": SUMMARY_COLLECTION, "localField": "_id", "foreignField": "user_id", "as": "summary"}},
+        {"$match": {"summary.last_check_in_date": {"$ne": today}}},
+        {"$lookup": {"from": "users", "localField": "_id", "foreignField": "id", "as": "user"}},
+        {"$unwind": "$user"},
+        {"$replaceRoot": {"newRoot": {
+            "id": "$user.id", "name": "$user.name", "member_id": "$user.member_id", "phone_number": "$user.phone_number"
+        }}}
+    ]).to_list(None)
     
     return {"present": present, "absent": absent, "present_count": len(present), "absent_count": len(absent)}
 
@@ -4424,6 +4353,12 @@ async def mark_attendance(attendance: AttendanceCreate, background_tasks: Backgr
     }
     
     await db.attendance.insert_one(attendance_doc)
+    await record_check_in(db, user["id"], now)
+    await bump_daily_stats(
+        db, stats_day(),
+        inc={"present_today": 1, "present_active_holders": 1 if (membership or {}).get("status") == "active" else 0},
+        pull={"regular_absentees": {"id": user["id"]}}
+    )
     await log_activity(
         current_user["id"],
         "attendance_marked",
@@ -4453,43 +4388,55 @@ async def get_user_attendance_history(user_id: str, current_user: dict = Depends
     attendance = await db.attendance.find({"user_id": user_id}, {"_id": 0}).sort("check_in_time", -1).to_list(1000)
     return attendance
 
-@api_router.get("/attendance/regular-absentees")
-async def get_regular_absentees(days: int = 7, current_user: dict = Depends(get_admin_user)):
-    """Get members absent for specified consecutive days"""
+async def query_regular_absentees(days: int = 7, limit: Optional[int] = None) -> List[dict]:
+    """Active members whose last check-in is older than ``days`` (or who never came).
+
+    One aggregation: distinct active-membership holders, joined to users and to
+    their attendance summary, filtered by the cutoff in the database.
+    Longest-absent first.
+    """
+    today = get_ist_now().date()
     cutoff_date = (get_ist_now() - timedelta(days=days)).strftime("%Y-%m-%d")
-    
-    # Get all active members
-    active_memberships = await db.memberships.find({"status": "active"}, {"_id": 0, "user_id": 1}).to_list(10000)
-    active_user_ids = [m["user_id"] for m in active_memberships]
+    pipeline = [
+        {"$match": {"status": "active"}},
+        {"$group": {"_id": "$user_id"}},
+        {"$lookup": {"from": "users", "localField": "_id", "foreignField": "id", "as": "user"}},
+        {"$unwind": "$user"},
+        {"$lookup": {"from": SUMMARY_COLLECTION, "localField": "_id", "foreignField": "user_id", "as": "summary"}},
+        {"$project": {
+            "_id": 0,
+            "id": "$user.id",
+            "name": "$user.name",
+            "member_id": "$user.member_id",
+            "phone_number": "$user.phone_number",
+            "last_attendance": {"$ifNull": [{"$arrayElemAt": ["$summary.last_check_in", 0]}, None]}
+        }},
+        # check_in_time < "YYYY-MM-DD" is the same as comparing its date part
+        {"$match": {"$or": [{"last_attendance": None}, {"last_attendance": {"$lt": cutoff_date}}]}},
+        {"$sort": {"last_attendance": 1, "name": 1}}
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    rows = await db.memberships.aggregate(pipeline).to_list(None)
     
     absentees = []
-    for user_id in active_user_ids:
-        # Get last attendance
-        last_attendance = await db.attendance.find_one(
-            {"user_id": user_id},
-            {"_id": 0},
-            sort=[("check_in_time", -1)]
-        )
-        
-        if not last_attendance:
-            # Never attended
-            user = await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1, "name": 1, "member_id": 1, "phone_number": 1})
-            if user:
-                user["days_absent"] = "Never attended"
-                absentees.append(user)
-        elif last_attendance["check_in_time"][:10] < cutoff_date:
-            # Absent for more than X days
-            user = await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1, "name": 1, "member_id": 1, "phone_number": 1})
-            if user:
-                # Compare date-to-date to avoid mixing timezone-aware and naive datetimes.
-                last_date = datetime.fromisoformat(last_attendance["check_in_time"][:10]).date()
-                days_absent = (get_ist_now().date() - last_date).days
-                user["days_absent"] = days_absent
-                user["last_attendance"] = last_attendance["check_in_time"]
-                absentees.append(user)
-    
+    for row in rows:
+        last = row.pop("last_attendance", None)
+        if not last:
+            row["days_absent"] = "Never attended"
+        else:
+            # Compare date-to-date to avoid mixing timezone-aware and naive datetimes.
+            last_date = datetime.fromisoformat(last[:10]).date()
+            row["days_absent"] = (today - last_date).days
+            row["last_attendance"] = last
+        absentees.append(row)
     return absentees
 
+@api_router.get("/attendance/regular-absentees")
+async def get_regular_absentees(days: int = 7, current_user: dict = Depends(get_admin_user)):
+    """Get members absent for specified consecutive days"""
+    return await query_regular_absentees(days)
+
 # ==================== TASK MANAGEMENT (LEADS) ROUTES ====================
 
 def _parse_iso_date_only(value: Optional[str]):
@@ -4620,21 +4567,21 @@ async def get_task_leads(lead_type: str, current_user: dict = Depends(get_admin_
     elif lead_type == "absent":
         cutoff_days = 3
         active_memberships = [m for m in membership_map.values()]
+        summaries = await db[SUMMARY_COLLECTION].find(
+            {"user_id": {"$in": [m.get("user_id") for m in active_memberships]}},
+            {"_id": 0, "user_id": 1, "last_check_in": 1}
+        ).to_list(None)
+        last_check_ins = {s["user_id"]: s.get("last_check_in") for s in summaries}
         for membership in active_memberships:
             user = user_map.get(membership.get("user_id"))
             if not user or user.get("is_disabled"):
                 continue
             if _current_freeze_info_for_membership(membership):
                 continue
-            last_attendance = await db.attendance.find_one(
-                {"user_id": user["id"]},
-                {"_id": 0, "check_in_time": 1},
-                sort=[("check_in_time", -1)]
-            )
             days_absent = None
             last_attendance_iso = None
-            if last_attendance and last_attendance.get("check_in_time"):
-                last_attendance_iso = last_attendance["check_in_time"]
+            if last_check_ins.get(user["id"]):
+                last_attendance_iso = last_check_ins[user["id"]]
                 last_date = _parse_iso_date_only(last_attendance_iso)
                 if last_date:
                     days_absent = (today - last_date).days
@@ -4814,6 +4761,7 @@ async def update_smtp_settings(settings: SMTPSettings, current_user: dict = Depe
         {"$set": update_data},
         upsert=True
     )
+    invalidate_settings_cache()
     await log_activity(
         current_user["id"],
         "settings_updated",
@@ -4855,6 +4803,9 @@ async def update_whatsapp_settings(settings: WhatsAppSettings, current_user: dic
         {"$set": update_data},
         upsert=True
     )
+    invalidate_settings_cache()
+    # A remembered lookup failure (or sender list) must not outlive the settings that caused it
+    fast2sms_metadata.invalidate()
     await log_activity(
         current_user["id"],
         "settings_updated",
@@ -4874,6 +4825,7 @@ async def update_attendance_confirmation_whatsapp_toggle(
         {"$set": {"attendance_confirmation_whatsapp_enabled": bool(req.enabled)}},
         upsert=True
     )
+    invalidate_settings_cache()
     await log_activity(
         current_user["id"],
         "settings_updated",
@@ -4895,6 +4847,7 @@ async def update_attendance_confirmation_email_toggle(
         {"$set": {"attendance_confirmation_email_enabled": bool(req.enabled)}},
         upsert=True
     )
+    invalidate_settings_cache()
     await log_activity(
         current_user["id"],
         "settings_updated",
@@ -4916,6 +4869,7 @@ async def update_absent_warning_whatsapp_toggle(
         {"$set": {"absent_warning_whatsapp_enabled": bool(req.enabled)}},
         upsert=True
     )
+    invalidate_settings_cache()
     await log_activity(
         current_user["id"],
         "settings_updated",
@@ -4929,7 +4883,7 @@ async def update_absent_warning_whatsapp_toggle(
 
 @api_router.post("/settings/whatsapp/test")
 async def test_whatsapp(to_number: str, current_user: dict = Depends(get_admin_user)):
-    settings = await db.settings.find_one({"id": "1"}, {"_id": 0}) or {}
+    settings = await get_cached_settings()
     provider = (settings.get("whatsapp_provider") or "twilio").lower()
 
     if provider == "fast2sms":
@@ -4983,6 +4937,7 @@ async def test_whatsapp(to_number: str, current_user: dict = Depends(get_admin_u
             }
         else:
             # Get the latest log entry for details
+            await whatsapp_log_writer.flush()
             latest_log = await db.whatsapp_logs.find_one(
                 {"to_number": {"$regex": to_number.replace('+', '').replace(' ', '')}},
                 sort=[("timestamp", -1)]
@@ -4996,43 +4951,48 @@ async def test_whatsapp(to_number: str, current_user: dict = Depends(get_admin_u
         raise HTTPException(status_code=500, detail=f"Error sending message: {str(e)}")
 
 @api_router.get("/settings/whatsapp/fast2sms/waba-templates")
-async def get_fast2sms_waba_templates(current_user: dict = Depends(get_admin_user)):
-    settings = await db.settings.find_one({"id": "1"}, {"_id": 0}) or {}
-    api_key = settings.get("fast2sms_api_key")
-    if not api_key:
-        raise HTTPException(status_code=400, detail="Fast2SMS API key is missing.")
+async def get_fast2sms_waba_templates(refresh: bool = False, current_user: dict = Depends(get_admin_user)):
+    """WABA numbers/templates from Fast2SMS, cached; ``refresh=true`` asks the provider again"""
+    settings = await get_cached_settings()
+    try:
+        entry, cached = await fast2sms_metadata.get(settings, refresh=refresh)
+    except Fast2SMSMetadataError as e:
+        if e.status_code >= 500:
+            logger.error(f"Fast2SMS template fetch failed: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {
+        "success": True,
+        "provider": "fast2sms",
+        "data": entry["payload"],
+        "sender": entry.get("sender"),
+        "fetched_at": entry["fetched_at"],
+        "cached": cached
+    }
 
-    base_url = (settings.get("fast2sms_base_url") or "https://www.fast2sms.com").rstrip("/")
-    url = f"{base_url}/dev/dlt_manager/whatsapp"
+@api_router.post("/settings/whatsapp/fast2sms/refresh")
+async def refresh_fast2sms_metadata(current_user: dict = Depends(get_admin_user)):
+    """Re-resolve the WABA sender and connection status now"""
+    settings = await get_cached_settings()
     try:
-        async with httpx.AsyncClient(timeout=20) as client:
-            response = await client.get(
-                url,
-                headers={"authorization": api_key},
-                params={"authorization": api_key}
-            )
-        try:
-            payload = response.json()
-        except Exception:
-            payload = {"raw": response.text}
-        if response.status_code >= 400:
-            raise HTTPException(status_code=response.status_code, detail=str(payload))
-        return {"success": True, "provider": "fast2sms", "data": payload}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Fast2SMS template fetch failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to fetch Fast2SMS WABA templates: {e}")
+        entry, _ = await fast2sms_metadata.get(settings, refresh=True)
+    except Fast2SMSMetadataError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {"success": True, "provider": "fast2sms", "sender": entry.get("sender"), "fetched_at": entry["fetched_at"]}
 
 @api_router.get("/settings/whatsapp/evolution/status")
-async def get_evolution_status(current_user: dict = Depends(get_admin_user)):
-    settings = await db.settings.find_one({"id": "1"}, {"_id": 0}) or {}
-    state = await _get_evolution_connection_state(settings)
-    return {"success": True, **state}
+async def get_evolution_status(refresh: bool = False, current_user: dict = Depends(get_admin_user)):
+    """Latest state from the background monitor; asks Evolution when ``refresh`` or nothing recent is known"""
+    settings = await get_cached_settings()
+    state = None if refresh else evolution_monitor.latest(_evolution_instance_name(settings))
+    if state is None:
+        state = await _get_evolution_connection_state(settings)
+        if evolution_monitor.active:
+            evolution_monitor.record(state)
+    return {"success": True, **state, "monitor": evolution_monitor.snapshot()}
 
 @api_router.post("/settings/whatsapp/evolution/connect")
 async def connect_evolution_instance(current_user: dict = Depends(get_admin_user)):
-    settings = await db.settings.find_one({"id": "1"}, {"_id": 0}) or {}
+    settings = await get_cached_settings()
     instance_name = _evolution_instance_name(settings)
     await _ensure_evolution_instance(settings)
     response = await _evolution_request(settings, "GET", f"/instance/connect/{instance_name}", timeout=45)
@@ -5047,6 +5007,8 @@ async def connect_evolution_instance(current_user: dict = Depends(get_admin_user
     pairing_code = str((payload or {}).get("pairingCode") or "").strip()
     count = int((payload or {}).get("count") or 0)
     connection_state = await _get_evolution_connection_state(settings)
+    if evolution_monitor.active:
+        evolution_monitor.record(connection_state)
 
     await log_activity(
         current_user["id"],
@@ -5069,7 +5031,7 @@ async def connect_evolution_instance(current_user: dict = Depends(get_admin_user
 
 @api_router.post("/settings/whatsapp/evolution/restart")
 async def restart_evolution_instance(current_user: dict = Depends(get_admin_user)):
-    settings = await db.settings.find_one({"id": "1"}, {"_id": 0}) or {}
+    settings = await get_cached_settings()
     instance_name = _evolution_instance_name(settings)
     response = await _evolution_request(settings, "PUT", f"/instance/restart/{instance_name}", timeout=45)
     try:
@@ -5084,11 +5046,12 @@ async def restart_evolution_instance(current_user: dict = Depends(get_admin_user
         "Restarted Evolution WhatsApp instance",
         metadata={"settings_section": "whatsapp", "provider": "evolution", "instance_name": instance_name}
     )
+    evolution_monitor.wake()
     return {"success": True, "provider": "evolution", "instance_name": instance_name, "raw": payload}
 
 @api_router.delete("/settings/whatsapp/evolution/logout")
 async def logout_evolution_instance(current_user: dict = Depends(get_admin_user)):
-    settings = await db.settings.find_one({"id": "1"}, {"_id": 0}) or {}
+    settings = await get_cached_settings()
     instance_name = _evolution_instance_name(settings)
     response = await _evolution_request(settings, "DELETE", f"/instance/logout/{instance_name}", timeout=45)
     try:
@@ -5103,28 +5066,20 @@ async def logout_evolution_instance(current_user: dict = Depends(get_admin_user)
         "Logged out Evolution WhatsApp instance",
         metadata={"settings_section": "whatsapp", "provider": "evolution", "instance_name": instance_name}
     )
+    evolution_monitor.wake()
     return {"success": True, "provider": "evolution", "instance_name": instance_name, "raw": payload}
 
 # ==================== TEMPLATE ROUTES ====================
 
 @api_router.get("/templates", response_model=List[TemplateResponse])
 async def get_templates(current_user: dict = Depends(get_admin_user)):
-    templates = await db.templates.find({}, {"_id": 0}).to_list(100)
+    templates = await template_registry.overrides(db)
     
     # Add default templates if not exist - include ALL template types
-    template_types = [
-        "welcome", "otp", "password_reset", "attendance", "absent_warning", 
-        "birthday", "holiday", "plan_shared", "renewal_reminder", 
-        "membership_activated", "payment_received", "invoice_sent", "announcement",
-        "freeze_started", "freeze_ended", "freeze_ending_tomorrow",
-        "new_user_credentials", "test_email"
-    ]
-    channels = ["email", "whatsapp"]
-    
     existing_keys = set(f"{t['template_type']}_{t['channel']}" for t in templates)
     
-    for tt in template_types:
-        for ch in channels:
+    for tt in TEMPLATE_TYPES:
+        for ch in CHANNELS:
             if f"{tt}_{ch}" not in existing_keys:
                 default = await get_template(tt, ch)
                 templates.append({
@@ -5151,6 +5106,7 @@ async def update_template(template: TemplateUpdate, current_user: dict = Depends
         {"$set": template_doc},
         upsert=True
     )
+    template_registry.invalidate()
     await log_activity(
         current_user["id"],
         "template_updated",
@@ -5167,6 +5123,7 @@ async def reset_template(template_type: str, channel: str, current_user: dict =
     
     # Delete the customized template so default will be used
     result = await db.templates.delete_one({"id": template_id})
+    template_registry.invalidate()
     if result.deleted_count > 0:
         await log_activity(
             current_user["id"],
@@ -5187,7 +5144,7 @@ async def test_send_template(req: TemplateTestSendRequest, current_user: dict =
         raise HTTPException(status_code=400, detail="Invalid channel")
     recipient = (req.recipient or "").strip()
     if not recipient:
-        settings = await db.settings.find_one({"id": "1"}, {"_id": 0}) or {}
+        settings = await get_cached_settings()
         if channel == "email":
             recipient = (settings.get("admin_test_email") or "").strip()
         else:
@@ -5250,7 +5207,7 @@ async def test_send_template(req: TemplateTestSendRequest, current_user: dict =
         media_mimetype = None
         if req.template_type == "invoice_sent":
             rendered_message = sanitize_invoice_whatsapp_message(rendered_message)
-            settings = await db.settings.find_one({"id": "1"}, {"_id": 0, "whatsapp_provider": 1}) or {}
+            settings = await get_cached_settings()
             provider = (settings.get("whatsapp_provider") or "twilio").lower()
             if provider == "evolution":
                 pdf_bytes, filename = _build_demo_invoice_pdf_bytes()
@@ -5272,6 +5229,7 @@ async def test_send_template(req: TemplateTestSendRequest, current_user: dict =
         )
 
     if not success:
+        await whatsapp_log_writer.flush()
         latest_log = await db.whatsapp_logs.find_one(sort=[("timestamp", -1)]) if channel == "whatsapp" else None
         detail = latest_log.get("error") if latest_log else None
         raise HTTPException(status_code=500, detail=detail or f"Failed to send test {channel}")
@@ -5304,6 +5262,115 @@ async def get_activity_logs(
     
     return logs
 
+# ==================== ADMIN MAINTENANCE ROUTES ====================
+
+@api_router.get("/admin/db/indexes")
+async def get_index_report(current_user: dict = Depends(get_admin_user)):
+    """Dry-run index report: missing, undeclared and unused indexes per collection"""
+    return await reconcile_indexes(db, dry_run=True)
+
+@api_router.get("/admin/db/collection-sizes")
+async def get_collection_sizes(current_user: dict = Depends(get_admin_user)):
+    """Document counts and storage/index bytes per collection, largest first"""
+    sizes = await collection_sizes(db)
+    sizes["retention"] = [policy.as_dict() for policy in RETENTION_POLICIES.values()]
+    return sizes
+
+@api_router.get("/admin/retention")
+async def get_retention_status(current_user: dict = Depends(get_admin_user)):
+    """Retention policies and the last archival run"""
+    lease = await db[LOCKS_COLLECTION].find_one({"_id": RETENTION_LEASE}) or {}
+    locked_until = lease.get("locked_until")
+    if locked_until is not None and locked_until.tzinfo is None:
+        locked_until = locked_until.replace(tzinfo=timezone.utc)
+    return {
+        "policies": [policy.as_dict() for policy in RETENTION_POLICIES.values()],
+        "archive_hour_ist": RETENTION_ARCHIVE_HOUR,
+        "last_run": lease.get("last_run"),
+        "running": bool(locked_until and locked_until > datetime.now(timezone.utc)),
+        "last_report": lease.get("last_report"),
+    }
+
+@api_router.post("/admin/retention/run")
+async def run_retention_now(current_user: dict = Depends(get_admin_user)):
+    """Archive/delete everything past its retention period now"""
+    report = await run_retention(force=True)
+    if report is None:
+        raise HTTPException(status_code=409, detail="A retention run is already in progress")
+    return report
+
+@api_router.get("/admin/runtime/stats")
+async def get_runtime_stats(current_user: dict = Depends(get_admin_user)):
+    """Per-process counters for in-memory caches and write buffers"""
+    return {
+        "user_cache": user_cache.stats(),
+        "settings_cache": settings_cache.stats(),
+        "activity_logger": activity_writer.stats(),
+        "message_logs": [writer.stats() for writer in MESSAGE_LOG_WRITERS],
+        "log_stats": [email_log_stats.stats(), whatsapp_log_stats.stats()],
+        "template_registry": {"loads": template_registry.loads},
+        "notification_outbox": outbox.stats(),
+        "provider_http": provider_http.stats(),
+        "fast2sms_metadata": fast2sms_metadata.stats(),
+        "evolution_monitor": evolution_monitor.snapshot(),
+        "smtp_pool": smtp_pool.stats(),
+        "invoice_pdfs": invoice_pdfs.stats()
+    }
+
+@api_router.get("/admin/outbox/stats")
+async def get_outbox_stats(current_user: dict = Depends(get_admin_user)):
+    """Outbox job counts per channel and status, plus this process's worker state"""
+    return {"counts": await outbox.status_counts(), "workers": outbox.stats()}
+
+@api_router.get("/admin/outbox/dead")
+async def get_dead_letters(
+    channel: Optional[str] = None,
+    limit: int = 100,
+    current_user: dict = Depends(get_admin_user)
+):
+    """Jobs that exhausted their retries or failed permanently, newest first (payload bodies omitted)"""
+    query = {"status": "dead"}
+    if channel:
+        query["channel"] = channel
+    return await db[OUTBOX_COLLECTION].find(
+        query,
+        {"_id": 0, "payload.body": 0, "payload.attachments": 0, "payload.media_base64": 0}
+    ).sort("updated_at", -1).to_list(max(1, min(limit, 1000)))
+
+@api_router.post("/admin/outbox/{job_id}/retry")
+async def retry_outbox_job(job_id: str, current_user: dict = Depends(get_admin_user)):
+    """Requeue a dead-lettered job with a fresh attempt budget"""
+    if not await outbox.retry(job_id):
+        raise HTTPException(status_code=404, detail="No dead job with this id")
+    return {"message": "Job requeued", "id": job_id}
+
+# ==================== BIRTHDAY ROUTES ====================
+
+@api_router.get("/birthdays/upcoming")
+async def get_upcoming_birthdays(
+    days: int = 7,
+    start: Optional[str] = None,
+    current_user: dict = Depends(get_admin_or_receptionist)
+):
+    """Members with a birthday between ``start`` (default today) and ``start + days``.
+
+    Wraps across Dec 31 -> Jan 1; each row carries ``days_until``.
+    """
+    if days < 0 or days > 365:
+        raise HTTPException(status_code=400, detail="days must be between 0 and 365")
+    try:
+        start_date = datetime.fromisoformat(start[:10]).date() if start else get_ist_now().date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid start date")
+    users = await find_birthdays(
+        db, start_date, days,
+        {"id": 1, "name": 1, "member_id": 1, "date_of_birth": 1, "phone_number": 1, "country_code": 1},
+        {"role": "member"}
+    )
+    for u in users:
+        u.pop("dob_md", None)
+    return {"start": start_date.isoformat(), "days": days, "count": len(users), "birthdays": users}
+
 # ==================== USER HISTORY ROUTES ====================
 
 @api_router.get("/users/{user_id}/history")
@@ -5332,14 +5399,10 @@ async def get_user_history(user_id: str, current_user: dict = Depends(get_admin_
         {"_id": 0}
     ).sort("payment_date", -1).to_list(100)
     
-    # Get attendance count
-    attendance_count = await db.attendance.count_documents({"user_id": user_id})
-    
-    # Get last attendance
-    last_attendance = await db.attendance.find_one(
-        {"user_id": user_id}, 
-        {"_id": 0},
-        sort=[("check_in_time", -1)]
+    # Attendance figures come from the materialized summary
+    attendance_stats = summary_view(
+        await db[SUMMARY_COLLECTION].find_one({"user_id": user_id}, {"_id": 0}),
+        get_ist_now().date()
     )
     
     # Calculate total payments
@@ -5361,8 +5424,11 @@ async def get_user_history(user_id: str, current_user: dict = Depends(get_admin_
             "total_memberships": len(memberships),
             "total_payments": len(payments),
             "total_amount_paid": total_paid,
-            "attendance_count": attendance_count,
-            "last_attendance": last_attendance.get("check_in_time") if last_attendance else None
+            "attendance_count": attendance_stats["total_visits"],
+            "last_attendance": attendance_stats["last_check_in"],
+            "current_streak": attendance_stats["current_streak"],
+            "longest_streak": attendance_stats["longest_streak"],
+            "visits_last_30_days": attendance_stats["visits_last_30_days"]
         }
     }
 
@@ -5396,6 +5462,7 @@ async def update_payment_gateway_settings(
         }},
         upsert=True
     )
+    invalidate_settings_cache()
     
     # Reinitialize Razorpay client
     global razorpay_client
@@ -5675,101 +5742,144 @@ async def delete_testimonial(testimonial_id: str, current_user: dict = Depends(g
 
 # ==================== DASHBOARD ROUTES ====================
 
-@api_router.get("/dashboard/stats", response_model=DashboardStats)
-async def get_dashboard_stats(current_user: dict = Depends(get_admin_user)):
-    total_members = await db.users.count_documents({"role": "member"})
-    active_memberships = await db.memberships.count_documents({"status": "active"})
-    
-    # Today's collection
-    today = get_ist_now().strftime("%Y-%m-%d")
-    today_payments = await db.payments.find(
-        {"payment_date": {"$regex": f"^{today}"}},
-        {"_id": 0, "amount_paid": 1}
-    ).to_list(10000)
-    today_collection = sum(p["amount_paid"] for p in today_payments)
-    
-    # Present today
-    today_attendance = await db.attendance.find(
-        {"check_in_time": {"$regex": f"^{today}"}},
-        {"_id": 0, "user_id": 1}
-    ).to_list(10000)
-    present_user_ids = set(a["user_id"] for a in today_attendance)
-    present_today = len(present_user_ids)
-    
-    # Absent today
-    active_membership_users = await db.memberships.find(
-        {"status": "active"},
-        {"_id": 0, "user_id": 1}
-    ).to_list(10000)
-    active_user_ids = set(m["user_id"] for m in active_membership_users)
-    absent_today = len(active_user_ids - present_user_ids)
-    
-    # Today's birthdays
-    today_mmdd = get_ist_now().strftime("-%m-%d")
-    all_members = await db.users.find({"role": "member", "date_of_birth": {"$exists": True, "$ne": None}}, {"_id": 0, "id": 1, "name": 1, "member_id": 1, "date_of_birth": 1, "phone_number": 1}).to_list(10000)
-    
-    today_birthdays = []
-    upcoming_birthdays = []
-    
-    for m in all_members:
-        if m.get("date_of_birth"):
-            dob = m["date_of_birth"]
-            if dob.endswith(today_mmdd):
-                today_birthdays.append({"name": m["name"], "member_id": m["member_id"], "phone_number": m.get("phone_number")})
-            else:
-                # Check upcoming 7 days
-                try:
-                    dob_date = datetime.strptime(dob, "%Y-%m-%d")
-                    this_year_bday = dob_date.replace(year=get_ist_now().year)
-                    days_until = (this_year_bday - datetime(get_ist_now().year, get_ist_now().month, get_ist_now().day)).days
-                    if 0 < days_until <= 7:
-                        upcoming_birthdays.append({
-                            "name": m["name"],
-                            "member_id": m["member_id"],
-                            "date": dob,
-                            "days_until": days_until
-                        })
-                except:
-                    pass
-    
-    upcoming_birthdays.sort(key=lambda x: x["days_until"])
-    
-    # Upcoming renewals (next 7 days)
-    upcoming_renewals = []
+DAILY_STATS_RECONCILE_SECONDS = int(os.environ.get("DAILY_STATS_RECONCILE_SECONDS", "900"))
+
+def stats_day() -> str:
+    return get_ist_now().strftime("%Y-%m-%d")
+
+async def stats_record_payment(payment_doc: dict):
+    """Fold a new payment into the daily_stats document of its payment day"""
+    day = str(payment_doc.get("payment_date") or "")[:10]
+    if day:
+        await bump_daily_stats(db, day, inc={
+            "today_collection": float(payment_doc.get("amount_paid") or 0),
+            "payments_count": 1
+        })
+
+async def stats_membership_status_changed(user_id: str, old_status: Optional[str], new_status: Optional[str]):
+    """Adjust active counters after a membership moved between statuses (None = created/deleted)"""
+    delta = int(new_status == "active") - int(old_status == "active")
+    inc = {}
+    if delta:
+        inc["active_memberships"] = delta
+        remaining = await db.memberships.count_documents({"user_id": user_id, "status": "active"})
+        if delta > 0 and remaining == 1:
+            inc["active_holders"] = 1
+        elif delta < 0 and remaining == 0:
+            inc["active_holders"] = -1
+    await bump_daily_stats(db, stats_day(), inc=inc, stale="renewals")
+
+async def stats_user_removed(user: dict):
+    """Call before deleting a user and their memberships"""
+    if user.get("role") != "member":
+        return
+    active = await db.memberships.count_documents({"user_id": user["id"], "status": "active"})
+    inc = {"total_members": -1}
+    if active:
+        inc.update({"active_memberships": -active, "active_holders": -1})
+    await bump_daily_stats(db, stats_day(), inc=inc, stale="renewals" if active else None)
+
+async def _dashboard_renewals() -> dict:
+    """Active memberships ending within 7 days (incl. overdue), with member details"""
     cutoff_date = (get_ist_now() + timedelta(days=7)).isoformat()
-    expiring_memberships = await db.memberships.find({
-        "status": "active",
-        "end_date": {"$lte": cutoff_date}
-    }, {"_id": 0}).to_list(100)
+    query = {"status": "active", "end_date": {"$lte": cutoff_date}}
+    expiring_soon = await db.memberships.count_documents(query)
+    expiring_memberships = await db.memberships.find(query, {"_id": 0, "user_id": 1, "end_date": 1}).to_list(100)
+    users = await fetch_users_by_id((m["user_id"] for m in expiring_memberships), {"name": 1, "member_id": 1, "phone_number": 1})
     
+    today = datetime(get_ist_now().year, get_ist_now().month, get_ist_now().day)
+    upcoming_renewals = []
     for m in expiring_memberships:
-        user = await db.users.find_one({"id": m["user_id"]}, {"_id": 0, "name": 1, "member_id": 1, "phone_number": 1})
+        user = users.get(m["user_id"])
         if user:
             end_date = datetime.fromisoformat(m["end_date"][:10])
-            days_left = (end_date - datetime(get_ist_now().year, get_ist_now().month, get_ist_now().day)).days
             upcoming_renewals.append({
                 "name": user["name"],
                 "member_id": user["member_id"],
                 "phone_number": user.get("phone_number"),
                 "end_date": m["end_date"][:10],
-                "days_left": days_left
+                "days_left": (end_date - today).days
             })
-    
     upcoming_renewals.sort(key=lambda x: x["days_left"])
+    return {"expiring_soon": expiring_soon, "upcoming_renewals": upcoming_renewals[:10]}
+
+async def _dashboard_birthdays() -> dict:
+    """Today's and the next 7 days' member birthdays (indexed dob_doy range reads)"""
+    today = get_ist_now().date()
+    fields = {"name": 1, "member_id": 1, "date_of_birth": 1, "phone_number": 1}
+    todays = await find_birthdays(db, today, 0, fields, {"role": "member"}, limit=5)
+    upcoming = await find_birthdays(db, today + timedelta(days=1), 6, fields, {"role": "member"})
+    return {
+        "today_birthdays": [
+            {"name": m["name"], "member_id": m["member_id"], "phone_number": m.get("phone_number")} for m in todays[:5]
+        ],
+        "upcoming_birthdays": [
+            {"name": m["name"], "member_id": m["member_id"], "date": m["date_of_birth"], "days_until": m["days_until"] + 1}
+            for m in upcoming[:5]
+        ]
+    }
+
+async def build_dashboard_snapshot() -> dict:
+    """Full recomputation of the dashboard; seeds/reconciles the daily_stats document"""
+    today = stats_day()
+    total_members = await db.users.count_documents({"role": "member"})
+    active_memberships = await db.memberships.count_documents({"status": "active"})
+    active_user_ids = set(await db.memberships.distinct("user_id", {"status": "active"}))
     
-    # Regular absentees (7+ days)
-    regular_absentees = await get_regular_absentees(7, current_user)
+    # Today's collection
+    collection = await db.payments.aggregate([
+        {"$match": {"payment_date": {"$regex": f"^{today}"}}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount_paid"}, "count": {"$sum": 1}}}
+    ]).to_list(1)
+    
+    # Present today
+    present_user_ids = set(await db.attendance.distinct("user_id", {"check_in_time": {"$regex": f"^{today}"}}))
+    
+    return {
+        "total_members": total_members,
+        "active_memberships": active_memberships,
+        "active_holders": len(active_user_ids),
+        "today_collection": float(collection[0]["total"]) if collection else 0.0,
+        "payments_count": collection[0]["count"] if collection else 0,
+        "present_today": len(present_user_ids),
+        "present_active_holders": len(present_user_ids & active_user_ids),
+        **(await _dashboard_birthdays()),
+        **(await _dashboard_renewals()),
+        # Regular absentees (7+ days)
+        "regular_absentees": await query_regular_absentees(7, limit=10)
+    }
+
+@api_router.get("/dashboard/stats", response_model=DashboardStats)
+async def get_dashboard_stats(current_user: dict = Depends(get_admin_user)):
+    """Served from the daily_stats read model; rebuilt once per day / reconcile interval"""
+    day = stats_day()
+    now = get_ist_now()
+    stats = await load_daily_stats(db, day)
+    built_at = datetime.fromisoformat(stats["built_at"]) if stats and stats.get("built_at") else None
+    if not built_at or (now - built_at).total_seconds() > DAILY_STATS_RECONCILE_SECONDS:
+        stats = await store_daily_stats(db, day, await build_dashboard_snapshot(), now)
+    else:
+        stale_sections = stats.get("stale_sections") or []
+        if "renewals" in stale_sections:
+            renewals = await _dashboard_renewals()
+            await replace_section(db, day, renewals, "renewals")
+            stats.update(renewals)
+        if "birthdays" in stale_sections:
+            birthdays = await _dashboard_birthdays()
+            await replace_section(db, day, birthdays, "birthdays")
+            stats.update(birthdays)
     
     return DashboardStats(
-        total_members=total_members,
-        active_memberships=active_memberships,
-        today_collection=today_collection,
-        present_today=present_today,
-        absent_today=absent_today,
-        today_birthdays=today_birthdays[:5],
-        upcoming_birthdays=upcoming_birthdays[:5],
-        upcoming_renewals=upcoming_renewals[:10],
-        regular_absentees=regular_absentees[:10]
+        total_members=stats.get("total_members", 0),
+        active_memberships=stats.get("active_memberships", 0),
+        today_collection=stats.get("today_collection", 0),
+        present_today=stats.get("present_today", 0),
+        absent_today=max(0, stats.get("active_holders", 0) - stats.get("present_active_holders", 0)),
+        expiring_soon=stats.get("expiring_soon", 0),
+        today_birthdays=stats.get("today_birthdays", []),
+        upcoming_birthdays=stats.get("upcoming_birthdays", []),
+        upcoming_renewals=stats.get("upcoming_renewals", []),
+        regular_absentees=stats.get("regular_absentees", [])[:10]
     )
 
 # ==================== TRAINER ROUTES ====================
@@ -5944,6 +6054,7 @@ async def verify_razorpay_payment(payment: RazorpayPaymentVerify, current_user:
     }
     
     await db.memberships.insert_one(membership_doc)
+    await stats_membership_status_changed(current_user["id"], None, "active")
     
     payment_doc = {
         "id": str(uuid.uuid4()),
@@ -5957,6 +6068,7 @@ async def verify_razorpay_payment(payment: RazorpayPaymentVerify, current_user:
     }
     
     await db.payments.insert_one(payment_doc)
+    await stats_record_payment(payment_doc)
     
     return {"message": "Payment verified and membership activated", "membership_id": membership_id}
 
@@ -5985,6 +6097,7 @@ async def upload_profile_photo(
     data_url = f"data:{file.content_type};base64,{base64_content}"
     
     await db.users.update_one({"id": target_user_id}, {"$set": {"profile_photo_url": data_url}})
+    user_cache.invalidate(target_user_id)
     
     return {"profile_photo_url": data_url, "url": data_url}
 
@@ -5995,6 +6108,7 @@ async def delete_profile_photo(user_id: str, current_user: dict = Depends(get_cu
         raise HTTPException(status_code=403, detail="Not authorized")
     
     await db.users.update_one({"id": user_id}, {"$set": {"profile_photo_url": None}})
+    user_cache.invalidate(user_id)
     return {"message": "Profile photo deleted"}
 
 @api_router.post("/upload/plan-pdf")
@@ -6088,11 +6202,12 @@ async def broadcast_whatsapp(
         {"_id": 0, "id": 1, "name": 1, "phone_number": 1, "country_code": 1, "member_id": 1, "email": 1}
     ).to_list(10000)
     context_map = await _build_broadcast_context_map([user["id"] for user in users if user.get("id")])
+    compiled_message = compile_template(request.message)
     
     sent_count = 0
     failed_count = 0
-    provider_settings = await db.settings.find_one({"id": "1"}, {"_id": 0, "whatsapp_provider": 1}) or {}
-    is_evolution = (provider_settings.get("whatsapp_provider") or "twilio").lower() == "evolution"
+    provider = await current_whatsapp_provider()
+    jobs = []
     
     for user in users:
         if user.get("phone_number"):
@@ -6102,34 +6217,26 @@ async def broadcast_whatsapp(
                 "email": user.get("email", ""),
                 **context_map.get(user.get("id"), {})
             }
-            personalized_message = replace_template_vars(request.message, vars_map)
+            personalized_message = render_compiled(compiled_message, vars_map)
             
             phone = f"{user.get('country_code', '+91')}{user['phone_number'].lstrip('0')}"
-            if is_evolution:
-                success = await send_whatsapp(
-                    to_number=phone,
-                    message=personalized_message
-                )
-                if success:
-                    sent_count += 1
-                else:
-                    failed_count += 1
-                await asyncio.sleep(0.6)
-            else:
-                background_tasks.add_task(
-                    send_whatsapp,
-                    to_number=phone,
-                    message=personalized_message
-                )
-                sent_count += 1
+            # Pacing (e.g. Evolution's rate limit) is enforced by the outbox token buckets
+            jobs.append(whatsapp_job(provider, phone, personalized_message))
+            sent_count += 1
         else:
             failed_count += 1
+    job = await broadcast_jobs.create(
+        "whatsapp", provider, jobs, created_by=current_user["id"], message=request.message,
+        target_audience=request.target_audience, skipped=failed_count,
+    )
     
     # Log activity
-    await log_activity(current_user["id"], "broadcast_whatsapp", f"Sent WhatsApp broadcast to {sent_count} members")
+    await log_activity(current_user["id"], "broadcast_whatsapp", f"Queued WhatsApp broadcast to {sent_count} members")
     
     return {
         "message": f"WhatsApp broadcast queued for {sent_count} members",
+        "job_id": job["id"],
+        "status": job["status"],
         "sent_count": sent_count,
         "failed_count": failed_count
     }
@@ -6157,91 +6264,83 @@ async def broadcast_email(
     sent_count = 0
     failed_count = 0
     
-    # Professional email template with detailed F3 Fitness footer
-    email_template = """<!DOCTYPE html>
-<html>
-<head>
-<meta charset="UTF-8">
-<meta name="viewport" content="width=device-width, initial-scale=1.0">
-<style>
-body { margin:0; padding:0; font-family: Arial, sans-serif; background: linear-gradient(135deg,#f4f6f8,#eef1f5); }
-.wrapper { padding:40px 15px; }
-.container { max-width:600px; margin:0 auto; background:#ffffff; border-radius:12px; overflow:hidden; box-shadow:0 8px 25px rgba(0,0,0,0.05); border:1px solid #e5e7eb; }
-.header { background:linear-gradient(135deg,#0ea5b7,#0b7285); padding:40px 30px; text-align:center; }
-.logo { width:160px; margin-bottom:10px; }
-.tagline { color:#e0f2fe; font-size:13px; letter-spacing:2px; font-weight:600; }
-.content { padding:40px 35px 35px 35px; color:#374151; font-size:16px; line-height:1.7; }
-.content h2 { margin-top:0; font-size:24px; color:#111827; }
-.highlight-box { margin-top:25px; padding:18px; background:#f0f9ff; border-left:4px solid #0ea5b7; border-radius:6px; font-size:14px; color:#0f766e; }
-.footer { background:#f3f4f6; padding:25px 25px; font-size:14px; color:#6b7280; border-top:1px solid #e5e7eb; text-align:center; line-height:1.7; }
-.footer-title { font-size:18px; font-weight:700; color:#111827; margin-bottom:10px; }
-.footer-address { max-width:480px; margin:0 auto 15px auto; }
-.footer-contact { margin-bottom:10px; }
-.footer-hours { margin-bottom:20px; }
-.footer-social { color:#0ea5b7; font-weight:700; text-decoration:none; }
-.footer a { color:#0ea5b7; text-decoration:none; font-weight:500; }
-.small { margin-top:20px; padding-top:15px; border-top:1px solid #e5e7eb; font-size:11px; color:#9ca3af; }
-</style>
-</head>
-<body>
-<div class="wrapper">
-  <div class="container">
-    <div class="header">
-      <img src="https://customer-assets.emergentagent.com/job_f3-fitness-gym/artifacts/0x0pk4uv_Untitled%20%28500%20x%20300%20px%29%20%282%29.png" alt="F3 Fitness Logo" class="logo">
-      <div class="tagline">TRAIN • TRANSFORM • TRIUMPH</div>
-    </div>
-    <div class="content">
-      <h2>Hello, {{name}}!</h2>
-      <div style="white-space: pre-wrap;">{{content}}</div>
-    </div>
-    <div class="footer">
-      <div class="footer-title">F3 Fitness Health Club</div>
-      <div class="footer-address">
-        4th Avenue Plot No 4R-B, Mode, near Mandir Marg,<br>
-        Sector 4, Vidyadhar Nagar, Jaipur, Rajasthan 302039
-      </div>
-      <div class="footer-contact">
-        📞 072300 52193 &nbsp;|&nbsp; 📧 info@f3fitness.in
-      </div>
-      <div class="footer-hours">
-        🕒 Mon–Sat: 5:00 AM – 10:00 PM &nbsp;|&nbsp; Sun: 6:00 AM – 12:00 PM
-      </div>
-      <div>
-        Follow us on Instagram: <a href="https://instagram.com/f3fitnessclub" class="footer-social">@f3fitnessclub</a>
-      </div>
-      <div class="small">
-        © 2026 F3 Fitness Health Club. All rights reserved.
-      </div>
-    </div>
-  </div>
-</div>
-</body>
-</html>"""
+    # Shared branded shell, split once per subject; recipients only add their body
+    prefix, suffix = email_shell(subject)
+    compiled_message = compile_template(request.message)
+    jobs = []
     
     for user in users:
         if user.get("email"):
+            name = user.get("name", "Member")
             # Personalize content
-            personalized_content = request.message.replace("{{name}}", user.get("name", "Member"))
-            personalized_content = personalized_content.replace("{{member_id}}", user.get("member_id", ""))
+            personalized_content = render_compiled(
+                compiled_message, {"name": name, "member_id": user.get("member_id", "")}
+            )
             
             # Create full email body
-            email_body = email_template.replace("{{name}}", user.get("name", "Member"))
-            email_body = email_body.replace("{{content}}", personalized_content.replace("\n", "<br>"))
-            
-            background_tasks.add_task(send_email, user["email"], subject, email_body)
+            email_body = "".join((
+                prefix,
+                f'<h2>Hello, {name}!</h2>\n      <div style="white-space: pre-wrap;">',
+                personalized_content.replace("\n", "<br>"),
+                "</div>",
+                suffix,
+            ))
+            jobs.append(email_job(user["email"], subject, email_body))
             sent_count += 1
         else:
             failed_count += 1
     
+    job = await broadcast_jobs.create(
+        "email", "smtp", jobs, created_by=current_user["id"], message=request.message,
+        target_audience=request.target_audience, skipped=failed_count, subject=subject,
+    )
+    
     # Log activity
-    await log_activity(current_user["id"], "broadcast_email", f"Sent Email broadcast to {sent_count} members")
+    await log_activity(current_user["id"], "broadcast_email", f"Queued Email broadcast to {sent_count} members")
     
     return {
         "message": f"Email broadcast queued for {sent_count} members",
+        "job_id": job["id"],
+        "status": job["status"],
         "sent_count": sent_count,
         "failed_count": failed_count
     }
 
+@api_router.get("/broadcast/jobs")
+async def list_broadcast_jobs(
+    status: Optional[str] = None,
+    limit: int = 20,
+    current_user: dict = Depends(get_admin_user)
+):
+    """Recent broadcasts with sent/failed/remaining counts and ETA"""
+    if status and status not in BROADCAST_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(BROADCAST_STATUSES)}")
+    return await broadcast_jobs.recent(max(1, min(limit, 100)), status)
+
+@api_router.get("/broadcast/jobs/{job_id}")
+async def get_broadcast_job(job_id: str, current_user: dict = Depends(get_admin_user)):
+    return await broadcast_jobs.get(job_id)
+
+@api_router.post("/broadcast/jobs/{job_id}/pause")
+async def pause_broadcast_job(job_id: str, current_user: dict = Depends(get_admin_user)):
+    """Hold the broadcast's unsent messages (a send already in flight still finishes)"""
+    job = await broadcast_jobs.pause(job_id)
+    await log_activity(current_user["id"], "broadcast_paused", f"Paused {job['channel']} broadcast {job_id}")
+    return job
+
+@api_router.post("/broadcast/jobs/{job_id}/resume")
+async def resume_broadcast_job(job_id: str, current_user: dict = Depends(get_admin_user)):
+    job = await broadcast_jobs.resume(job_id)
+    await log_activity(current_user["id"], "broadcast_resumed", f"Resumed {job['channel']} broadcast {job_id}")
+    return job
+
+@api_router.post("/broadcast/jobs/{job_id}/cancel")
+async def cancel_broadcast_job(job_id: str, current_user: dict = Depends(get_admin_user)):
+    """Drop the broadcast's unsent messages"""
+    job = await broadcast_jobs.cancel(job_id)
+    await log_activity(current_user["id"], "broadcast_cancelled", f"Cancelled {job['channel']} broadcast {job_id}")
+    return job
+
 
 # ==================== SEED DATA ROUTE ====================
 
@@ -6263,10 +6362,11 @@ async def seed_data():
         "email": "admin@f3fitness.com",
         "phone_number": "9999999999",
         "country_code": "+91",
-        "password_hash": hash_password("admin123"),
+        "password_hash": await hash_password("admin123"),
         "role": "admin",
         "gender": "male",
         "date_of_birth": "1990-01-01",
+        **dob_keys("1990-01-01"),
         "address": "4th avenue Plot No 4R-B, Sector 4",
         "city": "Jaipur",
         "zip_code": "302039",
@@ -6288,10 +6388,11 @@ async def seed_data():
         "email": "trainer@f3fitness.com",
         "phone_number": "9888888888",
         "country_code": "+91",
-        "password_hash": hash_password("trainer123"),
+        "password_hash": await hash_password("trainer123"),
         "role": "trainer",
         "gender": "male",
         "date_of_birth": "1992-05-15",
+        **dob_keys("1992-05-15"),
         "address": "Vidyadhar Nagar",
         "city": "Jaipur",
         "zip_code": "302039",
@@ -6378,6 +6479,7 @@ async def seed_data():
         "sandbox_url": "https://timberwolf-mastiff-9776.twil.io/demo-reply"
     }
     await db.settings.update_one({"id": "1"}, {"$set": settings_doc}, upsert=True)
+    invalidate_settings_cache()
     
     return {
         "message": "Data seeded successfully",
@@ -6389,6 +6491,7 @@ async def seed_data():
 
 # Include the router in the main app
 app.include_router(api_router)
+app.router.lifespan_context = lifespan
 
 app.add_middleware(
     CORSMiddleware,
@@ -6396,8 +6499,5 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Has-More"],
 )
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
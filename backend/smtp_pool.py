@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Pooled, authenticated SMTP sessions.
+
+``aiosmtplib.send`` connects, negotiates TLS and logs in for every message.
+``SMTPPool`` keeps up to ``max_size`` logged-in sessions and hands them out
+one message at a time:
+
+* a session idle for longer than ``idle_timeout`` is closed instead of
+  reused (most servers drop idle clients after a minute or so)
+* a session is retired after ``max_messages`` sends
+* if a reused session turns out to be dead, the send is retried once on a
+  fresh connection
+* sessions belong to one SMTP configuration; after the admin changes the
+  SMTP settings, old sessions are closed as they come back
+
+The pool is per process and bounded, so ``max_size`` is also the email
+concurrency per worker.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean "this connection is gone", not "this message was refused"
+_DISCONNECT_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, ConnectionError)
+
+
+def connection_options(settings: dict) -> dict:
+    """aiosmtplib connection kwargs for the stored SMTP settings.
+
+    Port 587 uses STARTTLS, port 465 direct TLS, any other port follows
+    ``smtp_secure`` (STARTTLS when true).
+    """
+    port = settings["smtp_port"]
+    options = {
+        "hostname": settings["smtp_host"],
+        "port": port,
+        "username": settings.get("smtp_user") or None,
+        "password": settings.get("smtp_pass") or None,
+    }
+    if port == 587:
+        options["start_tls"] = True
+    elif port == 465:
+        options["use_tls"] = True
+    else:
+        options["start_tls"] = settings.get("smtp_secure", True)
+    return options
+
+
+def _config_key(options: dict) -> str:
+    raw = "|".join(f"{k}={options.get(k)}" for k in sorted(options))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class _Session:
+    __slots__ = ("smtp", "key", "created", "last_used", "sent")
+
+    def __init__(self, smtp: aiosmtplib.SMTP, key: str):
+        self.smtp = smtp
+        self.key = key
+        self.created = self.last_used = time.monotonic()
+        self.sent = 0
+
+
+class SMTPPool:
+    def __init__(self, max_size: int = 4, idle_timeout: float = 60.0, max_messages: int = 100,
+                 timeout: float = 60.0):
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout = float(idle_timeout)
+        self.max_messages = max(1, int(max_messages))
+        self.timeout = float(timeout)
+        self._idle: Deque[_Session] = deque()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.counters: Dict[str, int] = {"connects": 0, "reused": 0, "sent": 0, "failed": 0, "reconnects": 0, "expired": 0}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_size)
+        return self._slots
+
+    async def _close(self, session: _Session) -> None:
+        try:
+            if session.smtp.is_connected:
+                await asyncio.wait_for(session.smtp.quit(), timeout=5)
+        except Exception:
+            session.smtp.close()
+
+    async def _connect(self, options: dict, key: str) -> _Session:
+        smtp = aiosmtplib.SMTP(timeout=self.timeout, **options)
+        await smtp.connect()
+        self.counters["connects"] += 1
+        return _Session(smtp, key)
+
+    async def _checkout(self, options: dict, key: str) -> Tuple[_Session, bool]:
+        """(session, reused) - an idle session for this config, else a new one."""
+        now = time.monotonic()
+        while self._idle:
+            session = self._idle.pop()  # most recently used first
+            if session.key == key and now - session.last_used < self.idle_timeout and session.smtp.is_connected:
+                self.counters["reused"] += 1
+                return session, True
+            self.counters["expired"] += 1
+            await self._close(session)
+        return await self._connect(options, key), False
+
+    def _checkin(self, session: _Session) -> None:
+        session.last_used = time.monotonic()
+        self._idle.append(session)
+
+    async def send(self, settings: dict, message) -> None:
+        """Send an ``email.message.Message``; raises aiosmtplib errors on failure."""
+        options = connection_options(settings)
+        key = _config_key(options)
+        async with self._semaphore():
+            session, reused = await self._checkout(options, key)
+            try:
+                await session.smtp.send_message(message)
+            except _DISCONNECT_ERRORS as e:
+                await self._close(session)
+                if not reused:
+                    self.counters["failed"] += 1
+                    raise
+                # Server dropped the idle connection; one retry on a fresh one
+                logger.info(f"SMTP session dropped ({e}); reconnecting")
+                self.counters["reconnects"] += 1
+                session = await self._connect(options, key)
+                try:
+                    await session.smtp.send_message(message)
+                except Exception:
+                    self.counters["failed"] += 1
+                    await self._close(session)
+                    raise
+            except aiosmtplib.SMTPRecipientsRefused:
+                # Message-level refusal; the session itself is fine
+                self.counters["failed"] += 1
+                self._checkin(session)
+                raise
+            except Exception:
+                self.counters["failed"] += 1
+                await self._close(session)
+                raise
+            session.sent += 1
+            self.counters["sent"] += 1
+            if session.sent >= self.max_messages:
+                await self._close(session)
+            else:
+                self._checkin(session)
+
+    async def close(self) -> None:
+        sessions, self._idle = list(self._idle), deque()
+        for session in sessions:
+            await self._close(session)
+
+    def stats(self) -> dict:
+        return {"max_size": self.max_size, "idle": len(self._idle), **self.counters}
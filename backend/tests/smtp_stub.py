@@ -0,0 +1,101 @@
+"""
+Local SMTP stand-in (aiosmtpd) for SMTP pool tests and benchmarks.
+
+Runs in its own thread, accepts AUTH PLAIN/LOGIN without TLS for the
+configured credentials, keeps every message in memory and counts sessions
+(EHLOs), logins and messages so callers can assert on connection reuse.
+
+    with LocalSMTPServer() as smtp:
+        settings = smtp.settings()   # shape of the stored SMTP settings
+        ...
+        assert smtp.sessions == 1
+"""
+import asyncio
+import socket
+import logging
+import threading
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult, LoginPassword
+
+# aiosmtpd logs a deprecation warning about its own login_data on every AUTH
+logging.getLogger("mail.log").setLevel(logging.ERROR)
+
+STUB_USER = "stub@f3fitness.local"
+STUB_PASSWORD = "stub-password"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class _Handler:
+    def __init__(self, server):
+        self.server = server
+
+    async def handle_EHLO(self, smtp, session, envelope, hostname, responses):
+        session.host_name = hostname
+        with self.server.lock:
+            self.server.sessions += 1
+        return responses
+
+    async def handle_DATA(self, smtp, session, envelope):
+        if self.server.latency:
+            await asyncio.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.messages.append(envelope)
+        return "250 Message accepted for delivery"
+
+
+class LocalSMTPServer:
+    def __init__(self, user=STUB_USER, password=STUB_PASSWORD, latency=0.0):
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.port = _free_port()
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.logins = 0
+        self.messages = []
+        self._controller = Controller(
+            _Handler(self),
+            hostname="127.0.0.1",
+            port=self.port,
+            authenticator=self._authenticate,
+            auth_require_tls=False,
+        )
+
+    def _authenticate(self, server, session, envelope, mechanism, auth_data):
+        if isinstance(auth_data, LoginPassword) and \
+                auth_data.login.decode() == self.user and auth_data.password.decode() == self.password:
+            with self.lock:
+                self.logins += 1
+            return AuthResult(success=True)
+        return AuthResult(success=False, handled=False)
+
+    def settings(self, **overrides):
+        """SMTP settings document as stored by PUT /settings/smtp."""
+        return {
+            "smtp_host": "127.0.0.1",
+            "smtp_port": self.port,
+            "smtp_user": self.user,
+            "smtp_pass": self.password,
+            "smtp_secure": False,
+            "sender_email": self.user,
+            **overrides,
+        }
+
+    def start(self):
+        self._controller.start()
+        return self
+
+    def stop(self):
+        self._controller.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
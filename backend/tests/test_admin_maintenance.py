@@ -0,0 +1,140 @@
+"""
+Test Admin Maintenance Endpoints:
+- GET /admin/db/indexes - Dry-run index reconciliation report
+- GET /admin/runtime/stats, /admin/outbox/* - Runtime counters and notification outbox
+- GET /admin/db/collection-sizes, /admin/retention - Storage report and log retention
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_EMAIL = "admin@f3fitness.com"
+ADMIN_PASSWORD = "admin123"
+
+
+@pytest.fixture(scope="module")
+def admin_token():
+    """Get admin token for authenticated requests"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email_or_phone": ADMIN_EMAIL,
+        "password": ADMIN_PASSWORD
+    })
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return response.json()["token"]
+
+
+@pytest.fixture(scope="module")
+def admin_headers(admin_token):
+    """Headers with admin token"""
+    return {"Authorization": f"Bearer {admin_token}", "Content-Type": "application/json"}
+
+
+class TestIndexReport:
+    """Test GET /admin/db/indexes endpoint"""
+
+    def test_index_report_is_dry_run(self, admin_headers):
+        """Report should never create indexes and should cover hot collections"""
+        response = requests.get(f"{BASE_URL}/api/admin/db/indexes", headers=admin_headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["dry_run"] is True
+        for name in ["users", "memberships", "attendance", "payments", "lead_tasks"]:
+            assert name in data["collections"], f"Missing {name} in index report"
+            entry = data["collections"][name]
+            assert entry["created"] == []
+            assert "missing" in entry
+            assert "unused" in entry
+
+    def test_startup_created_declared_indexes(self, admin_headers):
+        """Server startup reconciles indexes, so nothing should be missing"""
+        response = requests.get(f"{BASE_URL}/api/admin/db/indexes", headers=admin_headers)
+        assert response.status_code == 200
+        for name, entry in response.json()["collections"].items():
+            assert entry["missing"] == [], f"{name} has missing indexes: {entry['missing']}"
+
+    def test_index_report_requires_admin(self):
+        """Endpoint should reject unauthenticated requests"""
+        response = requests.get(f"{BASE_URL}/api/admin/db/indexes")
+        assert response.status_code in [401, 403]
+
+
+class TestRuntimeStats:
+    """Test GET /admin/runtime/stats endpoint"""
+
+    def test_activity_logger_counters(self, admin_headers):
+        """Buffered activity logger exposes flushed/dropped counters"""
+        response = requests.get(f"{BASE_URL}/api/admin/runtime/stats", headers=admin_headers)
+        assert response.status_code == 200, response.text
+        logger_stats = response.json()["activity_logger"]
+        for key in ["buffered", "enqueued", "flushed", "dropped"]:
+            assert key in logger_stats
+        # The admin login above was logged through the buffer
+        assert logger_stats["enqueued"] >= 1
+
+
+class TestNotificationOutbox:
+    """Test /admin/outbox endpoints"""
+
+    def test_outbox_stats(self, admin_headers):
+        """Counts per channel/status plus the worker pool state"""
+        response = requests.get(f"{BASE_URL}/api/admin/outbox/stats", headers=admin_headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert isinstance(data["counts"], dict)
+        assert data["workers"]["running"] is True
+        for key in ["in_flight", "enqueued", "sent", "retried", "dead"]:
+            assert key in data["workers"]
+
+    def test_dead_letters_omit_bodies(self, admin_headers):
+        """Dead-letter listing never returns message bodies or attachments"""
+        response = requests.get(f"{BASE_URL}/api/admin/outbox/dead", headers=admin_headers)
+        assert response.status_code == 200, response.text
+        for job in response.json():
+            assert job["status"] == "dead"
+            assert "body" not in job.get("payload", {})
+            assert "attachments" not in job.get("payload", {})
+
+    def test_retry_unknown_job(self, admin_headers):
+        """Only dead jobs can be requeued"""
+        response = requests.post(f"{BASE_URL}/api/admin/outbox/does-not-exist/retry", headers=admin_headers)
+        assert response.status_code == 404
+
+    def test_outbox_requires_admin(self):
+        response = requests.get(f"{BASE_URL}/api/admin/outbox/stats")
+        assert response.status_code in [401, 403]
+
+
+class TestStorageAndRetention:
+    """Test /admin/db/collection-sizes and /admin/retention endpoints"""
+
+    def test_collection_sizes(self, admin_headers):
+        """Sizes are reported per collection, largest first, with totals"""
+        response = requests.get(f"{BASE_URL}/api/admin/db/collection-sizes", headers=admin_headers)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        rows = [row for row in data["collections"] if "error" not in row]
+        assert "users" in [row["collection"] for row in rows]
+        footprints = [row["storage_size"] + row["index_size"] for row in rows]
+        assert footprints == sorted(footprints, reverse=True)
+        assert data["totals"]["count"] >= 1
+        assert {p["collection"] for p in data["retention"]} >= {"email_logs", "whatsapp_logs", "activity_logs", "otps"}
+
+    def test_retention_policies(self, admin_headers):
+        """OTPs expire without being archived; TTL indexes are declared"""
+        response = requests.get(f"{BASE_URL}/api/admin/retention", headers=admin_headers)
+        assert response.status_code == 200, response.text
+        policies = {p["collection"]: p for p in response.json()["policies"]}
+        assert policies["otps"]["archive"] is False
+        indexes = requests.get(f"{BASE_URL}/api/admin/db/indexes", headers=admin_headers).json()["collections"]
+        for name, policy in policies.items():
+            if policy["ttl_seconds"]:
+                assert indexes[name]["missing"] == [], f"{name} TTL index missing"
+
+    def test_storage_endpoints_require_admin(self):
+        """Endpoints should reject unauthenticated requests"""
+        for path in ["/api/admin/db/collection-sizes", "/api/admin/retention"]:
+            assert requests.get(f"{BASE_URL}{path}").status_code in [401, 403]
+        assert requests.post(f"{BASE_URL}/api/admin/retention/run").status_code in [401, 403]
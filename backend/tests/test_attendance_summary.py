@@ -0,0 +1,208 @@
+"""
+Test the incremental attendance summary against a full rebuild (no running backend needed):
+- record_check_in over a sequence of visits matches build_summary of the same visits
+- same-day repeats, gaps, a first visit and backdated check-ins
+- only one worker runs the boot-time backfill, and only once
+"""
+import asyncio
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+
+from attendance_summary import (  # noqa: E402
+    SUMMARY_COLLECTION, build_summary, ensure_attendance_summaries, record_check_in,
+)
+
+
+def _matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = doc.get(key)
+        if not isinstance(cond, dict):
+            if value != cond:
+                return False
+            continue
+        for op, arg in cond.items():
+            comparable = value is not None and arg is not None
+            if op == "$ne" and value == arg:
+                return False
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$lt" and not (comparable and value < arg):
+                return False
+            if op == "$gte" and not (comparable and value >= arg):
+                return False
+    return True
+
+
+class _Result:
+    def __init__(self, matched, upserted_id=None):
+        self.matched_count = self.modified_count = matched
+        self.upserted_id = upserted_id
+
+
+class MemoryCollection:
+    """Single-document updates with the operators the summary code uses."""
+
+    def __init__(self, docs=None, unique="user_id"):
+        self.docs = list(docs or [])
+        self.unique = unique
+
+    def _apply(self, doc, update, inserting=False):
+        doc.update(update.get("$set", {}))
+        if inserting:
+            doc.update(update.get("$setOnInsert", {}))
+        for field, step in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + step
+        for field, value in update.get("$max", {}).items():
+            if doc.get(field) is None or value > doc[field]:
+                doc[field] = value
+        for field, spec in update.get("$push", {}).items():
+            doc[field] = (doc.get(field) or []) + spec["$each"]
+            if "$slice" in spec:
+                doc[field] = doc[field][spec["$slice"]:]
+
+    async def find_one(self, query, projection=None, sort=None):
+        matches = [d for d in self.docs if _matches(d, query)]
+        for field, direction in reversed(sort or []):
+            matches.sort(key=lambda d: d.get(field), reverse=direction < 0)
+        return dict(matches[0]) if matches else None
+
+    async def update_one(self, query, update, upsert=False):
+        doc = next((d for d in self.docs if _matches(d, query)), None)
+        if doc is not None:
+            self._apply(doc, update)
+            return _Result(1)
+        if not upsert:
+            return _Result(0)
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        if any(d.get(self.unique) == doc.get(self.unique) for d in self.docs):
+            raise DuplicateKeyError("duplicate key")
+        self._apply(doc, update, inserting=True)
+        self.docs.append(doc)
+        return _Result(0, upserted_id=doc.get(self.unique))
+
+    async def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            self.docs = [d for d in self.docs if not _matches(d, op._filter)]
+            self.docs.append(dict(op._doc))
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+    async def distinct(self, field, query):
+        return sorted({d[field] for d in self.docs if _matches(d, query)})
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        """$match on user_id + $group check-in times by user (rebuild_attendance_summaries)."""
+        docs = self.docs
+        for stage in pipeline:
+            if "$match" in stage:
+                docs = [d for d in docs if _matches(d, stage["$match"])]
+        groups = {}
+        for doc in docs:
+            groups.setdefault(doc["user_id"], []).append(doc["check_in_time"])
+
+        async def _rows():
+            for user_id, times in groups.items():
+                yield {"_id": user_id, "times": times}
+        return _rows()
+
+
+class MemoryDB:
+    def __init__(self):
+        self.collections = {
+            SUMMARY_COLLECTION: MemoryCollection(),
+            "attendance": MemoryCollection(unique="id"),
+            "maintenance_locks": MemoryCollection(unique="_id"),
+        }
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+    @property
+    def attendance(self):
+        return self.collections["attendance"]
+
+
+async def _check_in(db, user_id, check_in_time):
+    """What mark_attendance does: store the visit, then fold it into the summary."""
+    db.attendance.docs.append({"id": f"{user_id}-{check_in_time}", "user_id": user_id, "check_in_time": check_in_time})
+    await record_check_in(db, user_id, check_in_time)
+
+
+def _summary(db, user_id="u1"):
+    doc = next(d for d in db[SUMMARY_COLLECTION].docs if d["user_id"] == user_id)
+    return {k: v for k, v in doc.items() if k != "_id"}
+
+
+def _replay(times):
+    db = MemoryDB()
+
+    async def run():
+        for t in times:
+            await _check_in(db, "u1", t)
+    asyncio.run(run())
+    return db
+
+
+def _day(n, hour=9):
+    return f"{(date(2026, 1, 1) + timedelta(days=n)).isoformat()}T{hour:02d}:00:00"
+
+
+class TestRecordCheckIn:
+    def test_first_visit(self):
+        assert _summary(_replay([_day(0)])) == build_summary("u1", [_day(0)])
+
+    def test_consecutive_days_then_gap(self):
+        times = [_day(0), _day(1), _day(2), _day(5), _day(6)]
+        summary = _summary(_replay(times))
+        assert summary == build_summary("u1", times)
+        assert (summary["current_streak"], summary["longest_streak"]) == (2, 3)
+
+    def test_same_day_repeat_is_a_no_op(self):
+        db = _replay([_day(0), _day(1)])
+        before = _summary(db)
+        asyncio.run(record_check_in(db, "u1", _day(1, hour=18)))
+        assert _summary(db) == before
+
+    def test_backdated_check_in_rebuilds(self):
+        times = [_day(0), _day(1), _day(2), _day(9), _day(5)]
+        summary = _summary(_replay(times))
+        assert summary == build_summary("u1", times)
+        assert summary["last_check_in_date"] == _day(9)[:10]  # never moves backwards
+
+    def test_long_history_keeps_recent_dates_window(self):
+        times = [_day(n) for n in range(40) if n % 7 != 3]
+        assert _summary(_replay(times)) == build_summary("u1", times)
+
+
+class TestBackfill:
+    def test_only_one_worker_rebuilds_once(self):
+        db = MemoryDB()
+        db.attendance.docs = [{"id": str(n), "user_id": f"u{n % 3}", "check_in_time": _day(n)} for n in range(9)]
+        rebuilt = []
+        bulk_write = db[SUMMARY_COLLECTION].bulk_write
+
+        async def counting_bulk_write(ops, ordered=True):
+            rebuilt.append(len(ops))
+            await asyncio.sleep(0)  # let the other workers try for the lease mid-rebuild
+            await bulk_write(ops, ordered)
+        db[SUMMARY_COLLECTION].bulk_write = counting_bulk_write
+
+        async def run():
+            await asyncio.gather(*(ensure_attendance_summaries(db) for _ in range(4)))
+            await ensure_attendance_summaries(db)
+        asyncio.run(run())
+
+        assert rebuilt[0] == 3  # one full rebuild; the follow-up only touches the latest visitor
+        assert len(rebuilt) == 2
+        assert _summary(db, "u0") == build_summary("u0", [_day(n) for n in range(0, 9, 3)])
+        assert db["maintenance_locks"].docs[0]["last_run"] == "done"
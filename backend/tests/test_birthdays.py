@@ -0,0 +1,83 @@
+"""
+Test the indexed birthday lookups (no running backend needed):
+- dob_doy ranges split in two when the window wraps from Dec into Jan
+- Feb 29 birthdays are found on Mar 1 in common years, on Feb 29 in leap years
+"""
+import asyncio
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from birthdays import dob_keys, doy_ranges, find_birthdays  # noqa: E402
+
+
+def _in_range(doy, clause):
+    return clause["$gte"] <= doy <= clause["$lte"]
+
+
+class Users:
+    """users collection stand-in evaluating the dob_doy range filter."""
+
+    def __init__(self, users):
+        self.users = [{**user, **dob_keys(user["date_of_birth"])} for user in users]
+
+    def find(self, query, projection=None):
+        clauses = [c["dob_doy"] for c in query["$or"]] if "$or" in query else [query["dob_doy"]]
+        rows = [dict(u) for u in self.users if any(_in_range(u["dob_doy"], c) for c in clauses)]
+
+        class _Cursor:
+            async def to_list(self, length):
+                return rows[:length]
+        return _Cursor()
+
+
+class DB:
+    def __init__(self, users):
+        self.users = Users(users)
+
+
+def names(rows):
+    return [(row["name"], row["days_until"]) for row in rows]
+
+
+MEMBERS = [
+    {"name": "Dec30", "date_of_birth": "1990-12-30"},
+    {"name": "Jan02", "date_of_birth": "1992-01-02"},
+    {"name": "Leap", "date_of_birth": "1996-02-29"},
+    {"name": "Feb28", "date_of_birth": "1991-02-28"},
+    {"name": "Mar01", "date_of_birth": "1993-03-01"},
+]
+
+
+class TestDoyRanges:
+    def test_single_range_within_a_year(self):
+        assert doy_ranges(date(2026, 6, 1), 6) == [(153, 159)]
+
+    def test_window_wrapping_into_january_splits(self):
+        assert doy_ranges(date(2026, 12, 28), 7) == [(363, 366), (1, 4)]
+
+    def test_common_year_window_from_march_first_adds_leap_day(self):
+        assert doy_ranges(date(2026, 3, 1), 0) == [(61, 61), (60, 60)]
+
+    def test_leap_year_window_from_march_first_does_not(self):
+        assert doy_ranges(date(2028, 3, 1), 0) == [(61, 61)]
+
+
+class TestFindBirthdays:
+    def test_dec_to_jan_wrap(self):
+        rows = asyncio.run(find_birthdays(DB(MEMBERS), date(2026, 12, 29), 7))
+        assert names(rows) == [("Dec30", 1), ("Jan02", 4)]
+
+    def test_leap_day_celebrated_on_march_first_in_common_year(self):
+        rows = asyncio.run(find_birthdays(DB(MEMBERS), date(2026, 3, 1), 0))
+        assert names(rows) == [("Leap", 0), ("Mar01", 0)]
+
+    def test_leap_day_not_doubled_in_common_year_window(self):
+        rows = asyncio.run(find_birthdays(DB(MEMBERS), date(2026, 2, 27), 3))
+        assert names(rows) == [("Feb28", 1), ("Leap", 2), ("Mar01", 2)]
+
+    def test_leap_day_on_its_own_date_in_leap_year(self):
+        assert names(asyncio.run(find_birthdays(DB(MEMBERS), date(2028, 2, 29), 0))) == [("Leap", 0)]
+        assert names(asyncio.run(find_birthdays(DB(MEMBERS), date(2028, 3, 1), 0))) == [("Mar01", 0)]
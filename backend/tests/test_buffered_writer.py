@@ -0,0 +1,83 @@
+"""
+Test BufferedWriter flush failures (no running backend needed):
+- a partially applied insert_many is retried without stalling on duplicate keys
+- documents rejected by the server are dropped instead of blocking the buffer
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId  # noqa: E402
+from pymongo.errors import AutoReconnect, BulkWriteError  # noqa: E402
+
+from buffered_writer import BufferedWriter  # noqa: E402
+
+
+class FlakyCollection:
+    """insert_many stand-in: assigns _id like pymongo, can fail part-way or reject documents."""
+
+    def __init__(self, fail_after=None, reject=()):
+        self.docs = {}
+        self.fail_after = fail_after
+        self.reject = set(reject)
+
+    async def insert_many(self, batch, ordered=True):
+        for doc in batch:
+            doc.setdefault("_id", ObjectId())
+        errors = []
+        for i, doc in enumerate(batch):
+            if self.fail_after is not None and len(self.docs) >= self.fail_after:
+                self.fail_after = None
+                raise AutoReconnect("connection reset mid-batch")
+            if doc["_id"] in self.docs:
+                errors.append({"index": i, "code": 11000, "errmsg": "duplicate key"})
+            elif doc.get("n") in self.reject:
+                errors.append({"index": i, "code": 121, "errmsg": "Document failed validation"})
+            else:
+                self.docs[doc["_id"]] = doc
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+class TestBufferedWriter:
+    """Retry and drop behaviour of flush()"""
+
+    def test_partial_insert_retry_drains(self):
+        collection = FlakyCollection(fail_after=3)
+        flushed = []
+
+        async def on_flush(batch):
+            flushed.extend(doc["n"] for doc in batch)
+
+        writer = BufferedWriter(lambda: collection, max_batch=10, on_flush=on_flush)
+
+        async def run():
+            for n in range(6):
+                writer.add({"n": n})
+            first = await writer.flush()
+            second = await writer.flush()
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert (first, second) == (0, 3)
+        assert sorted(doc["n"] for doc in collection.docs.values()) == list(range(6))
+        assert writer.stats()["buffered"] == 0
+        assert writer.counters["duplicates"] == 3
+        assert writer.counters["failed_batches"] == 1
+        assert flushed == [3, 4, 5]
+
+    def test_rejected_documents_are_dropped(self):
+        collection = FlakyCollection(reject={2})
+        writer = BufferedWriter(lambda: collection, max_batch=10)
+
+        async def run():
+            for n in range(4):
+                writer.add({"n": n})
+            return await writer.flush()
+
+        assert asyncio.run(run()) == 3
+        assert writer.stats()["buffered"] == 0
+        assert writer.counters["rejected"] == 1
+        assert sorted(doc["n"] for doc in collection.docs.values()) == [0, 1, 3]
@@ -0,0 +1,104 @@
+"""
+Test ConnectionMonitor with scripted probes (no running backend needed):
+- state is cached and on_change fires only when "known disconnected" flips
+- failing probes back off; an inactive provider never blocks
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection_monitor import ConnectionMonitor  # noqa: E402
+
+
+def state(connected, instance_name="f3fitness"):
+    return {"instance_name": instance_name, "connected": connected, "state": "open" if connected else "close"}
+
+
+class ScriptedProbe:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class TestConnectionMonitor:
+    """Cached state, change notifications and backoff"""
+
+    def test_disconnect_and_reconnect_notify_once_each(self):
+        changes = []
+        probe = ScriptedProbe(state(True), state(False), state(False), state(True))
+        monitor = ConnectionMonitor(probe, interval=30, on_change=changes.append)
+
+        async def run():
+            for _ in range(4):
+                assert await monitor.check() == 30
+                yield monitor.known_disconnected()
+
+        async def collect():
+            return [blocked async for blocked in run()]
+
+        assert asyncio.run(collect()) == [False, True, True, False]
+        assert changes == [True, False]
+
+    def test_other_instance_is_not_blocked(self):
+        monitor = ConnectionMonitor(ScriptedProbe(state(False)))
+        asyncio.run(monitor.check())
+        assert monitor.known_disconnected("f3fitness") is True
+        assert monitor.known_disconnected("renamed") is False
+        assert monitor.latest("renamed") is None
+
+    def test_failures_back_off_and_unknown_does_not_block(self):
+        probe = ScriptedProbe(RuntimeError("unreachable"))
+        monitor = ConnectionMonitor(probe, interval=10, max_interval=60)
+
+        async def run():
+            return [await monitor.check() for _ in range(4)]
+
+        assert asyncio.run(run()) == [20, 40, 60, 60]
+        assert monitor.error == "unreachable"
+        assert monitor.known_disconnected() is False
+
+    def test_stale_disconnect_stops_blocking(self):
+        changes = []
+        probe = ScriptedProbe(state(False), RuntimeError("unreachable"))
+        monitor = ConnectionMonitor(probe, stale_after=0.05, on_change=changes.append)
+
+        async def run():
+            await monitor.check()
+            await asyncio.sleep(0.1)
+            await monitor.check()
+
+        asyncio.run(run())
+        assert changes == [True, False]
+
+    def test_inactive_provider(self):
+        monitor = ConnectionMonitor(ScriptedProbe(None))
+        asyncio.run(monitor.check())
+        assert monitor.active is False
+        assert monitor.known_disconnected() is False
+
+    def test_wake_probes_immediately(self):
+        probe = ScriptedProbe(state(True))
+        monitor = ConnectionMonitor(probe, interval=3600)
+
+        async def run():
+            monitor.start()
+            await asyncio.sleep(0.01)
+            monitor.wake()
+            await asyncio.sleep(0.01)
+            snapshot = monitor.snapshot()
+            await monitor.stop()
+            return snapshot
+
+        snapshot = asyncio.run(run())
+        assert probe.calls == 2
+        assert snapshot["running"] is True
+        assert snapshot["active"] is True
@@ -0,0 +1,199 @@
+"""
+Test the incremental dashboard read model against a full rebuild (no running backend needed):
+- after a sequence of member, membership and payment events, the daily_stats counters
+  kept current by bump_daily_stats / stats_* equal a fresh build_dashboard_snapshot
+- increments never create a day document that was not built yet
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# server.py connects lazily; nothing is sent to this address
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:1")
+os.environ.setdefault("DB_NAME", "test_daily_stats")
+
+import pytest  # noqa: E402
+
+import server  # noqa: E402
+from daily_stats import DAILY_STATS_COLLECTION, bump_daily_stats, load_daily_stats, store_daily_stats  # noqa: E402
+
+COUNTERS = ("total_members", "active_memberships", "active_holders", "today_collection", "payments_count",
+            "present_today", "present_active_holders")
+
+
+def _matches(doc, query):
+    for key, cond in query.items():
+        value = doc.get(key)
+        if isinstance(cond, dict):
+            if "$regex" in cond and not str(value or "").startswith(cond["$regex"].lstrip("^")):
+                return False
+            if "$in" in cond and value not in cond["$in"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length):
+        return self.rows
+
+
+class MemoryCollection:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    async def delete_many(self, query):
+        self.docs = [d for d in self.docs if not _matches(d, query)]
+
+    async def count_documents(self, query):
+        return sum(1 for d in self.docs if _matches(d, query))
+
+    async def distinct(self, field, query):
+        return list({d[field] for d in self.docs if _matches(d, query)})
+
+    async def find_one(self, query, projection=None):
+        doc = next((d for d in self.docs if _matches(d, query)), None)
+        return {k: v for k, v in doc.items() if k != "_id"} if doc else None
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs = [d for d in self.docs if not _matches(d, query)] + [dict(doc)]
+
+    async def update_one(self, query, update):
+        doc = next((d for d in self.docs if _matches(d, query)), None)
+        if doc is None:
+            return
+        doc.update(update.get("$set", {}))
+        for field, step in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + step
+        for field, cond in update.get("$pull", {}).items():
+            doc[field] = [item for item in doc.get(field, []) if item != cond and not (
+                isinstance(cond, dict) and isinstance(item, dict) and _matches(item, cond))]
+        for field, value in update.get("$addToSet", {}).items():
+            if value not in doc.setdefault(field, []):
+                doc[field].append(value)
+
+    def aggregate(self, pipeline):
+        """$match + $group {_id: None} with $sum (the snapshot's collection total)."""
+        docs = [d for d in self.docs if _matches(d, pipeline[0]["$match"])]
+        if not docs:
+            return _Cursor([])
+        row = {"_id": None}
+        for name, spec in pipeline[1]["$group"].items():
+            if name == "_id":
+                continue
+            value = spec["$sum"]
+            row[name] = sum(d[value[1:]] for d in docs) if isinstance(value, str) else value * len(docs)
+        return _Cursor([row])
+
+
+class MemoryDB:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, MemoryCollection())
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    memory = MemoryDB()
+    monkeypatch.setattr(server, "db", memory)
+
+    async def _section():
+        return {}
+
+    async def _no_absentees(days=7, limit=None):
+        return []
+    # List sections are flagged stale and recomputed on read, never incremented
+    monkeypatch.setattr(server, "_dashboard_birthdays", _section)
+    monkeypatch.setattr(server, "_dashboard_renewals", _section)
+    monkeypatch.setattr(server, "query_regular_absentees", _no_absentees)
+    return memory
+
+
+def _counters(doc):
+    return {field: doc.get(field, 0) for field in COUNTERS}
+
+
+async def _add_member(db, user_id):
+    """What registration does: insert the user, then bump the day's member count."""
+    await db.users.insert_one({"id": user_id, "role": "member"})
+    await bump_daily_stats(db, server.stats_day(), inc={"total_members": 1})
+
+
+async def _set_membership(db, membership_id, user_id, status):
+    existing = next((m for m in db.memberships.docs if m["id"] == membership_id), None)
+    old_status = existing["status"] if existing else None
+    if existing:
+        existing["status"] = status
+    else:
+        await db.memberships.insert_one({"id": membership_id, "user_id": user_id, "status": status})
+    await server.stats_membership_status_changed(user_id, old_status, status)
+
+
+async def _pay(db, amount, day=None):
+    payment = {"id": f"p{len(db.payments.docs)}", "amount_paid": amount,
+               "payment_date": f"{day or server.stats_day()}T10:00:00"}
+    await db.payments.insert_one(payment)
+    await server.stats_record_payment(payment)
+
+
+async def _remove_member(db, user_id):
+    """What user deletion does: adjust the counters first, then delete."""
+    await server.stats_user_removed({"id": user_id, "role": "member"})
+    await db.users.delete_many({"id": user_id})
+    await db.memberships.delete_many({"user_id": user_id})
+
+
+class TestDailyStats:
+    def test_increments_match_a_full_rebuild(self, db):
+        async def run():
+            day = server.stats_day()
+            await db.users.insert_one({"id": "staff", "role": "admin"})
+            await _add_member(db, "u1")
+            await _set_membership(db, "m1", "u1", "active")
+            await _pay(db, 1500)
+            await store_daily_stats(db, day, await server.build_dashboard_snapshot(), server.get_ist_now())
+
+            await _add_member(db, "u2")
+            await _add_member(db, "u3")
+            await _set_membership(db, "m2", "u2", "active")
+            await _pay(db, 2000)
+            await _set_membership(db, "m3", "u1", "active")      # second active plan, same holder
+            await _set_membership(db, "m1", "u1", "cancelled")   # still holds m3
+            await _set_membership(db, "m4", "u3", "active")
+            await _set_membership(db, "m4", "u3", "revoked")
+            await _set_membership(db, "m5", "u3", "active")
+            await _pay(db, 750.5)
+            await _pay(db, 999, day="2020-01-01")                 # another day's document: untouched
+            await _remove_member(db, "u2")
+
+            incremental = await load_daily_stats(db, day)
+            rebuilt = await server.build_dashboard_snapshot()
+            return incremental, rebuilt
+
+        incremental, rebuilt = asyncio.run(run())
+        assert _counters(incremental) == _counters(rebuilt)
+        assert _counters(rebuilt)["active_holders"] == 2
+        assert _counters(rebuilt)["today_collection"] == 4250.5
+        assert "renewals" in incremental["stale_sections"]
+
+    def test_increments_do_not_create_the_day(self, db):
+        async def run():
+            await _add_member(db, "u1")
+            await _pay(db, 100)
+        asyncio.run(run())
+        assert db[DAILY_STATS_COLLECTION].docs == []
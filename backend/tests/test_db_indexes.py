@@ -0,0 +1,67 @@
+"""
+Test index reconciliation with fake collections (no running backend needed):
+- a dry run reports missing and undeclared indexes but never creates or drops any
+- --drop-undeclared drops undeclared indexes only on a real run
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_indexes import INDEX_SPECS, reconcile_indexes  # noqa: E402
+
+
+class FakeCollection:
+    """Has only _id_ and one undeclared index; records every write."""
+
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    async def index_information(self):
+        return {
+            "_id_": {"key": [("_id", 1)]},
+            "legacy_undeclared": {"key": [("legacy_field_nobody_declares", 1)]},
+        }
+
+    def aggregate(self, pipeline):
+        raise RuntimeError("$indexStats not supported")
+
+    async def create_indexes(self, models):
+        self.calls.append(("create", self.name, models[0].document["name"]))
+
+    async def drop_index(self, name):
+        self.calls.append(("drop", self.name, name))
+
+
+class FakeDB:
+    def __init__(self):
+        self.calls = []
+
+    def __getitem__(self, name):
+        return FakeCollection(name, self.calls)
+
+    async def command(self, *args, **kwargs):
+        self.calls.append(("command",) + args)
+
+
+class TestReconcileIndexes:
+    def test_dry_run_never_writes(self):
+        db = FakeDB()
+        report = asyncio.run(reconcile_indexes(db, dry_run=True, drop_undeclared=True))
+        assert db.calls == []
+        entry = report["collections"]["users"]
+        assert entry["missing"] and entry["created"] == []
+        assert entry["undeclared"] == ["legacy_undeclared"] and entry["dropped"] == []
+
+    def test_real_run_drops_undeclared_only_when_asked(self):
+        db = FakeDB()
+        asyncio.run(reconcile_indexes(db))
+        assert not [call for call in db.calls if call[0] == "drop"]
+
+        db = FakeDB()
+        report = asyncio.run(reconcile_indexes(db, drop_undeclared=True))
+        drops = [call for call in db.calls if call[0] == "drop"]
+        assert len(drops) == len(INDEX_SPECS)
+        assert report["collections"]["users"]["dropped"] == ["legacy_undeclared"]
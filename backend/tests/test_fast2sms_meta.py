@@ -0,0 +1,122 @@
+"""
+Test Fast2SMSMetadata against an in-process httpx transport (no running backend needed):
+- concurrent sender lookups share one provider request
+- the copy persisted in settings is reused; a new API key is not
+- failed lookups are remembered briefly, refresh always asks the provider
+- invalidate (a WhatsApp settings save) forgets a remembered failure
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fast2sms_meta import Fast2SMSMetadata, Fast2SMSMetadataError, METADATA_FIELD, pick_sender  # noqa: E402
+
+ROWS = [
+    {"number": "91 88888 88888", "phone_number_id": "PN-OFF", "connection_status": "DISCONNECTED"},
+    {"number": "919999999999", "phone_number_id": "PN-ON", "connection_status": "CONNECTED"},
+]
+
+
+class FakeFast2SMS:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.requests = 0
+        self.persisted = []
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+    async def handle(self, request):
+        self.requests += 1
+        await asyncio.sleep(0.01)
+        return httpx.Response(self.status_code, json=ROWS if self.status_code < 400 else {"message": "Invalid key"})
+
+    async def persist(self, entry):
+        self.persisted.append(entry)
+
+    def metadata(self, **kwargs):
+        return Fast2SMSMetadata(lambda: self.client, self.persist, **kwargs)
+
+
+SETTINGS = {"fast2sms_api_key": "test-key"}
+
+
+class TestFast2SMSMetadata:
+    """Sender resolution and caching"""
+
+    def test_pick_sender_prefers_configured_number(self):
+        assert pick_sender(ROWS, "+91 8888888888")["phone_number_id"] == "PN-OFF"
+        assert pick_sender(ROWS)["phone_number_id"] == "PN-ON"
+        assert pick_sender({"raw": "error"}) is None
+
+    def test_concurrent_sends_do_one_lookup(self):
+        async def run():
+            provider = FakeFast2SMS()
+            metadata = provider.metadata()
+            results = await asyncio.gather(*[metadata.resolve_sender(SETTINGS, "", "") for _ in range(100)])
+            return provider, results
+
+        provider, results = asyncio.run(run())
+        assert provider.requests == 1
+        assert set(results) == {("919999999999", "PN-ON", True)}
+        assert len(provider.persisted) == 1
+        assert provider.persisted[0]["sender"]["connection_status"] == "CONNECTED"
+
+    def test_persisted_copy_is_reused(self):
+        async def run():
+            provider = FakeFast2SMS()
+            await provider.metadata().get(SETTINGS)
+            stored = {**SETTINGS, METADATA_FIELD: provider.persisted[0]}
+            _, cached = await provider.metadata().get(stored)
+            # Another account's key must not reuse it
+            await provider.metadata().get({**stored, "fast2sms_api_key": "other-key"})
+            return provider, cached
+
+        provider, cached = asyncio.run(run())
+        assert cached is True
+        assert provider.requests == 2
+
+    def test_failures_are_cached_briefly(self):
+        async def run():
+            provider = FakeFast2SMS(status_code=401)
+            metadata = provider.metadata(failure_ttl=60)
+            for _ in range(10):
+                assert await metadata.resolve_sender(SETTINGS, "", "") == ("", "", False)
+            try:
+                await metadata.get(SETTINGS)
+            except Fast2SMSMetadataError as e:
+                return provider, e.status_code
+
+        provider, status_code = asyncio.run(run())
+        assert provider.requests == 1
+        assert status_code == 401
+
+    def test_refresh_asks_the_provider(self):
+        async def run():
+            provider = FakeFast2SMS()
+            metadata = provider.metadata()
+            await metadata.get(SETTINGS)
+            _, cached = await metadata.get(SETTINGS, refresh=True)
+            return provider, cached
+
+        provider, cached = asyncio.run(run())
+        assert cached is False
+        assert provider.requests == 2
+
+    def test_invalidate_forgets_a_failure(self):
+        async def run():
+            provider = FakeFast2SMS(status_code=401)
+            metadata = provider.metadata(failure_ttl=60)
+            await metadata.resolve_sender(SETTINGS, "", "")
+            provider.status_code = 200  # the account was fixed on the Fast2SMS side
+            before = await metadata.resolve_sender(SETTINGS, "", "")
+            metadata.invalidate()
+            after = await metadata.resolve_sender(SETTINGS, "", "")
+            return provider, before, after
+
+        provider, before, after = asyncio.run(run())
+        assert before == ("", "", False)
+        assert after == ("919999999999", "PN-ON", True)
+        assert provider.requests == 2
@@ -0,0 +1,99 @@
+"""
+Test the invoice PDF cache (no running backend needed):
+- one render per content version, shared by concurrent requests
+- a changed input yields a new version and a re-render
+- weak ETag comparison for If-None-Match
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from invoice_cache import InvoiceCache, content_version, etag_for, etag_matches  # noqa: E402
+
+
+class MemoryArtifacts:
+    """invoice_pdfs collection stand-in keyed by _id."""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return doc if doc and doc["version"] == query["version"] else None
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = doc
+
+    async def delete_many(self, query):
+        self.docs = {k: v for k, v in self.docs.items() if v["user_id"] != query["user_id"]}
+
+
+class SlowRenderer:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return b"%PDF-" + str(self.calls).encode(), "F3_Invoice_R1.pdf"
+
+
+class TestInvoiceCache:
+    """get_or_render and version/ETag helpers"""
+
+    def test_concurrent_requests_share_one_render(self):
+        store = MemoryArtifacts()
+        cache = InvoiceCache(lambda: store)
+        render = SlowRenderer()
+
+        async def run():
+            return await asyncio.gather(*[cache.get_or_render("pay1", "v1", "u1", render) for _ in range(10)])
+
+        results = asyncio.run(run())
+        assert render.calls == 1
+        assert {pdf for pdf, _ in results} == {b"%PDF-1"}
+        assert store.docs["pay1"]["size"] == 6
+
+    def test_new_version_rerenders_and_store_survives_restart(self):
+        store = MemoryArtifacts()
+        render = SlowRenderer()
+
+        async def run():
+            await InvoiceCache(lambda: store).get_or_render("pay1", "v1", "u1", render)
+            # A fresh process finds the stored artifact
+            restarted = InvoiceCache(lambda: store)
+            cached, _ = await restarted.get_or_render("pay1", "v1", "u1", render)
+            updated, _ = await restarted.get_or_render("pay1", "v2", "u1", render)
+            return cached, updated, restarted.stats()
+
+        cached, updated, stats = asyncio.run(run())
+        assert cached == b"%PDF-1"
+        assert updated == b"%PDF-2"
+        assert stats["stored_hits"] == 1 and stats["renders"] == 1
+
+    def test_forget_user(self):
+        store = MemoryArtifacts()
+        cache = InvoiceCache(lambda: store)
+
+        async def run():
+            await cache.get_or_render("pay1", "v1", "u1", SlowRenderer())
+            await cache.get_or_render("pay2", "v1", "u2", SlowRenderer())
+            await cache.forget_user("u1")
+
+        asyncio.run(run())
+        assert list(store.docs) == ["pay2"]
+
+    def test_version_and_etag(self):
+        payment = {"id": "pay1", "amount_paid": 3000}
+        membership = {"id": "m1", "end_date": "2026-12-30"}
+        version = content_version(payment, None, membership, None, {"gym_name": "F3"})
+        assert version == content_version(dict(payment), None, dict(membership), None, {"gym_name": "F3"})
+        assert version != content_version(payment, None, {**membership, "end_date": "2027-01-30"}, None, {"gym_name": "F3"})
+        etag = etag_for(version)
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", "{version}"', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches('W/"other"', etag)
+        assert not etag_matches(None, etag)
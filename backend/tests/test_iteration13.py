@@ -174,6 +174,26 @@ class TestPDFInvoice(TestAuth):
         assert response.status_code == 404, f"Expected 404 for invalid payment, got: {response.status_code}"
         print("Correctly returned 404 for invalid payment ID")
 
+    def test_invoice_pdf_conditional_get(self, auth_headers):
+        """Cached invoice PDFs carry an ETag; re-opening an unchanged invoice returns 304"""
+        payments_response = requests.get(f"{BASE_URL}/api/payments", headers=auth_headers, params={"limit": 1})
+        if payments_response.status_code != 200 or not payments_response.json():
+            pytest.skip("No payments available for PDF testing")
+        url = f"{BASE_URL}/api/invoices/{payments_response.json()[0]['id']}/pdf"
+
+        first = requests.get(url, headers=auth_headers)
+        assert first.status_code == 200
+        etag = first.headers.get("etag")
+        assert etag, "Invoice PDF should carry an ETag"
+
+        second = requests.get(url, headers=auth_headers)
+        assert second.headers.get("etag") == etag
+        assert second.content == first.content, "Cached PDF should be served unchanged"
+
+        revalidated = requests.get(url, headers={**auth_headers, "If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+
 
 class TestInvoiceAPI(TestAuth):
     """Test Invoice data API"""
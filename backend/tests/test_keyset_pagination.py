@@ -0,0 +1,156 @@
+"""
+Test keyset (cursor) pagination on list endpoints:
+- GET /payments?limit=&cursor= with X-Next-Cursor / X-Has-More headers
+- GET /attendance?limit=&cursor=&include_photos=
+- GET /email-logs, /whatsapp-logs?after=&status=&provider=&recipient=&date_from=&date_to=
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+# Test credentials
+ADMIN_EMAIL = "admin@f3fitness.com"
+ADMIN_PASSWORD = "admin123"
+
+
+@pytest.fixture(scope="module")
+def admin_headers():
+    """Headers with admin token"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email_or_phone": ADMIN_EMAIL,
+        "password": ADMIN_PASSWORD
+    })
+    assert response.status_code == 200, f"Admin login failed: {response.text}"
+    return {"Authorization": f"Bearer {response.json()['token']}", "Content-Type": "application/json"}
+
+
+class TestPaymentsPagination:
+    """Test GET /payments keyset pagination"""
+
+    def test_unpaged_request_keeps_list_shape(self, admin_headers):
+        """Without limit the endpoint still returns a plain list"""
+        response = requests.get(f"{BASE_URL}/api/payments", headers=admin_headers)
+        assert response.status_code == 200
+        assert isinstance(response.json(), list)
+        assert response.headers.get("X-Has-More") in ["true", "false"]
+
+    def test_pages_do_not_overlap(self, admin_headers):
+        """Walking pages via X-Next-Cursor never repeats a payment"""
+        seen = []
+        cursor = None
+        for _ in range(5):
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = requests.get(f"{BASE_URL}/api/payments", params=params, headers=admin_headers)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 2
+            seen.extend(p["id"] for p in page)
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert len(seen) == len(set(seen))
+
+    def test_payments_are_enriched(self, admin_headers):
+        """Batched user lookup still attaches user_name"""
+        response = requests.get(f"{BASE_URL}/api/payments", params={"limit": 5}, headers=admin_headers)
+        assert response.status_code == 200
+        for payment in response.json():
+            assert "user_name" in payment
+
+    def test_page_size_is_capped(self, admin_headers):
+        """A huge limit is clamped instead of returning the whole history"""
+        response = requests.get(f"{BASE_URL}/api/payments", params={"limit": 100000}, headers=admin_headers)
+        assert response.status_code == 200
+        assert len(response.json()) <= 500
+
+    def test_invalid_cursor_rejected(self, admin_headers):
+        response = requests.get(f"{BASE_URL}/api/payments", params={"cursor": "not-a-cursor"}, headers=admin_headers)
+        assert response.status_code == 400
+
+
+class TestAttendancePagination:
+    """Test GET /attendance keyset pagination and photo opt-in"""
+
+    def test_pages_do_not_overlap(self, admin_headers):
+        seen = []
+        cursor = None
+        for _ in range(5):
+            params = {"limit": 3}
+            if cursor:
+                params["cursor"] = cursor
+            response = requests.get(f"{BASE_URL}/api/attendance", params=params, headers=admin_headers)
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 3
+            seen.extend(a["id"] for a in page)
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert len(seen) == len(set(seen))
+
+    def test_page_size_is_capped(self, admin_headers):
+        """No limit gives the default page; a huge limit is clamped to 500"""
+        response = requests.get(f"{BASE_URL}/api/attendance", headers=admin_headers)
+        assert response.status_code == 200
+        assert len(response.json()) <= 50
+        response = requests.get(f"{BASE_URL}/api/attendance", params={"limit": 100000}, headers=admin_headers)
+        assert response.status_code == 200
+        assert len(response.json()) <= 500
+
+    def test_photos_omitted_by_default(self, admin_headers):
+        response = requests.get(f"{BASE_URL}/api/attendance", params={"limit": 20}, headers=admin_headers)
+        assert response.status_code == 200
+        for record in response.json():
+            assert record.get("profile_photo_url") is None
+            assert record.get("user_name")
+
+
+class TestLogPagination:
+    """Test keyset pagination and filters on the delivery log endpoints"""
+
+    @pytest.mark.parametrize("path", ["/api/email-logs", "/api/whatsapp-logs"])
+    def test_after_pages_do_not_overlap(self, admin_headers, path):
+        """Walking pages via pagination.next_after never repeats a log and stays newest first"""
+        seen, stamps = [], []
+        after = None
+        for _ in range(5):
+            params = {"limit": 3}
+            if after:
+                params["after"] = after
+            response = requests.get(f"{BASE_URL}{path}", params=params, headers=admin_headers)
+            assert response.status_code == 200, response.text
+            data = response.json()
+            assert set(data["stats"]) >= {"total", "sent", "failed", "pending"}
+            seen.extend(log["id"] for log in data["logs"])
+            stamps.extend(log["timestamp"] for log in data["logs"])
+            after = data["pagination"]["next_after"]
+            assert data["pagination"]["has_more"] is bool(after)
+            if not after:
+                break
+        assert len(seen) == len(set(seen))
+        assert stamps == sorted(stamps, reverse=True)
+
+    def test_skip_still_supported(self, admin_headers):
+        """Old clients paging with skip get the same response shape"""
+        response = requests.get(f"{BASE_URL}/api/whatsapp-logs", params={"limit": 2, "skip": 2}, headers=admin_headers)
+        assert response.status_code == 200
+        pagination = response.json()["pagination"]
+        assert pagination["skip"] == 2
+        assert "total" in pagination
+
+    def test_filters(self, admin_headers):
+        """Status and date range filters only return matching logs"""
+        params = {"status": "failed", "date_from": "2026-01-01", "date_to": "2026-12-31", "limit": 20}
+        response = requests.get(f"{BASE_URL}/api/whatsapp-logs", params=params, headers=admin_headers)
+        assert response.status_code == 200
+        for log in response.json()["logs"]:
+            assert log["status"] == "failed"
+            assert "2026-01-01" <= log["timestamp"] < "2027-01-01"
+
+    def test_invalid_after_rejected(self, admin_headers):
+        response = requests.get(f"{BASE_URL}/api/email-logs", params={"after": "not-a-cursor"}, headers=admin_headers)
+        assert response.status_code == 400
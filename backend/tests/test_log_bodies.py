@@ -0,0 +1,74 @@
+"""
+Test compact email log bodies (no running backend needed):
+- shell-wrapped and raw HTML round-trip exactly through body_ref + expand
+- identical bodies are stored once
+- the list preview is readable text, not the shell's markup
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_shell import wrap_email  # noqa: E402
+from log_bodies import BodyStore, decompress, preview_text  # noqa: E402
+
+
+class MemoryBodies:
+    """BufferedWriter + collection stand-in keyed by _id."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def add(self, doc):
+        self.docs.setdefault(doc["_id"], doc)
+        return True
+
+    def find(self, query):
+        docs = [self.docs[i] for i in query["_id"]["$in"] if i in self.docs]
+
+        class _Cursor:
+            async def to_list(self, length):
+                return docs
+        return _Cursor()
+
+
+def make_store():
+    memory = MemoryBodies()
+    return BodyStore(memory, lambda: memory), memory
+
+
+class TestLogBodies:
+    """body_ref storage and preview rebuild"""
+
+    def test_round_trip(self):
+        store, _ = make_store()
+        bodies = [
+            wrap_email("<h2>Hello, Asha!</h2><p>Your plan ends on 12 Mar.</p>", "Renewal reminder"),
+            wrap_email("<!DOCTYPE html><html><body style='background:#000'>Custom</body></html>", "Custom"),
+            "<p>Plain body without a shell</p>",
+        ]
+        logs = [{"body_ref": store.email_ref(html)} for html in bodies]
+        assert [log["body_ref"]["shell"] for log in logs] == ["branded", "minimal", None]
+        asyncio.run(store.expand(logs))
+        assert [log["body_html"] for log in logs] == bodies
+
+    def test_identical_bodies_stored_once(self):
+        store, memory = make_store()
+        html = wrap_email("<p>The gym is closed this Sunday.</p>", "Holiday notice")
+        refs = {store.email_ref(html)["hash"] for _ in range(50)}
+        assert len(refs) == 1
+        assert len(memory.docs) == 1
+        stored = next(iter(memory.docs.values()))
+        assert decompress(stored["z"]) == "<p>The gym is closed this Sunday.</p>"
+
+    def test_legacy_logs_left_alone(self):
+        store, _ = make_store()
+        logs = [{"body_html": "<p>old</p>"}, {"body_preview": "older"}]
+        asyncio.run(store.expand(logs))
+        assert logs == [{"body_html": "<p>old</p>"}, {"body_preview": "older"}]
+
+    def test_preview_is_text(self):
+        html = wrap_email("<h2>Hello, Ravi!</h2><p>Your OTP is <b>482913</b> &amp; valid for 10 min.</p>", "OTP")
+        assert preview_text(html) == "Hello, Ravi! Your OTP is 482913 & valid for 10 min."
+        assert len(preview_text("<p>" + "x" * 500 + "</p>")) == 303
@@ -0,0 +1,117 @@
+"""
+Test the delivery log counters (no running backend needed):
+- a flushed batch becomes one $inc/$push on the counters document
+- reads are served from the counters and cached until the next local flush
+- the $facet snapshot replaces the counters when they are missing or a day old
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_stats import LogStats, facet_pipeline  # noqa: E402
+
+TODAY = datetime(2026, 10, 17)
+
+
+class Recorder:
+    """Counters/log collection stand-in that records calls."""
+
+    def __init__(self, doc=None, facets=None):
+        self.doc = doc
+        self.facets = facets or {}
+        self.updates = []
+        self.finds = 0
+        self.aggregations = 0
+
+    async def update_one(self, query, update):
+        self.updates.append(update)
+
+    async def find_one(self, query):
+        self.finds += 1
+        return self.doc
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.doc = doc
+
+    def aggregate(self, pipeline):
+        self.aggregations += 1
+        facets = self.facets
+
+        class _Cursor:
+            async def to_list(self, length):
+                return [facets]
+        return _Cursor()
+
+
+def make_stats(counters, logs=None):
+    logs = logs or Recorder()
+    return LogStats(lambda: logs, lambda: counters, "whatsapp_logs", lambda: TODAY), logs
+
+
+class TestLogStats:
+    """record/get on the rolling counters"""
+
+    def test_batch_is_one_update(self):
+        counters = Recorder()
+        stats, _ = make_stats(counters)
+        batch = [
+            {"_id": 1, "status": "sent", "timestamp": "2026-10-17T09:00:00+05:30"},
+            {"_id": 2, "status": "failed", "timestamp": "2026-10-17T09:01:00+05:30", "error": "closed"},
+            {"_id": 3, "status": "sent", "timestamp": "2026-10-16T23:59:00+05:30"},
+        ]
+        asyncio.run(stats.record(batch))
+        assert len(counters.updates) == 1
+        update = counters.updates[0]
+        assert update["$inc"] == {
+            "by_status.sent": 2, "by_status.failed": 1,
+            "days.2026-10-17.sent": 1, "days.2026-10-17.failed": 1, "days.2026-10-16.sent": 1,
+        }
+        pushed = update["$push"]["recent_failures"]
+        assert pushed["$each"] == [{"status": "failed", "timestamp": "2026-10-17T09:01:00+05:30", "error": "closed"}]
+        assert pushed["$slice"] == 10
+
+    def test_reads_cached_until_flush(self):
+        counters = Recorder({
+            "by_status": {"sent": 7, "failed": 3, "pending": 0},
+            "days": {"2026-10-17": {"sent": 2}},
+            "recent_failures": [],
+            "built_at": datetime.now().astimezone().isoformat(),
+        })
+        stats, logs = make_stats(counters)
+
+        async def run():
+            first = await stats.get()
+            await stats.get()
+            await stats.record([{"status": "sent", "timestamp": "2026-10-17T10:00:00+05:30"}])
+            await stats.get()
+            return first
+
+        first = asyncio.run(run())
+        assert first["total"] == 10
+        assert first["by_status"] == {"sent": 7, "failed": 3}
+        assert first["today"] == {"sent": 2}
+        assert counters.finds == 2
+        assert logs.aggregations == 0
+
+    def test_snapshot_rebuilds_stale_day(self):
+        counters = Recorder({"by_status": {"sent": 1}, "days": {"2026-10-16": {"sent": 1}},
+                             "built_at": datetime.now().astimezone().isoformat()})
+        facets = {
+            "by_status": [{"_id": "sent", "count": 40}, {"_id": "failed", "count": 2}],
+            "today": [{"_id": "failed", "count": 1}],
+            "recent_failures": [{"id": "f1"}],
+        }
+        stats, logs = make_stats(counters, Recorder(facets=facets))
+        result = asyncio.run(stats.get())
+        assert logs.aggregations == 1
+        assert result == {"total": 42, "by_status": {"sent": 40, "failed": 2}, "today": {"failed": 1},
+                          "recent_failures": [{"id": "f1"}]}
+        assert counters.doc["days"] == {"2026-10-17": {"failed": 1}}
+
+    def test_single_facet_stage(self):
+        pipeline = facet_pipeline("2026-10-17T00:00:00")
+        assert len(pipeline) == 1
+        assert set(pipeline[0]["$facet"]) == {"by_status", "today", "recent_failures"}
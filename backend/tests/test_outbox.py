@@ -0,0 +1,270 @@
+"""
+Test the notification outbox in-process (no running backend needed):
+- claiming honours priority, due time and expired leases
+- failed sends back off exponentially, then land in the dead letter queue
+- PermanentFailure is dead-lettered on the first attempt
+- ProviderUnavailable is put back without using up an attempt
+- sent and cancelled jobs drop their payload and get finished_at
+- a repeated idempotency_key returns the job already queued
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+
+from outbox import Outbox, PermanentFailure, ProviderUnavailable  # noqa: E402
+
+
+def _matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = doc.get(key)
+        if not isinstance(cond, dict):
+            if value != cond:
+                return False
+            continue
+        for op, arg in cond.items():
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$nin" and value in arg:
+                return False
+            if op == "$lt" and not (value is not None and value < arg):
+                return False
+            if op == "$lte" and not (value is not None and value <= arg):
+                return False
+    return True
+
+
+class _Result:
+    def __init__(self, count):
+        self.matched_count = self.modified_count = count
+
+
+class MemoryOutbox:
+    """notification_outbox stand-in: unique idempotency_key, $set/$unset/$inc updates."""
+
+    def __init__(self):
+        self.docs = []
+
+    async def insert_one(self, doc):
+        key = doc.get("idempotency_key")
+        if key and any(d.get("idempotency_key") == key for d in self.docs):
+            raise DuplicateKeyError("duplicate idempotency_key")
+        self.docs.append(dict(doc))
+
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            await self.insert_one(doc)
+
+    async def find_one(self, query, projection=None):
+        return next((dict(d) for d in self.docs if _matches(d, query)), None)
+
+    def _apply(self, doc, update):
+        doc.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+        for field, step in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + step
+
+    async def find_one_and_update(self, query, update, projection=None, sort=None):
+        matches = [d for d in self.docs if _matches(d, query)]
+        for field, direction in reversed(sort or []):
+            matches.sort(key=lambda d: d[field], reverse=direction < 0)
+        if not matches:
+            return None
+        before = dict(matches[0])
+        self._apply(matches[0], update)
+        return before
+
+    async def update_one(self, query, update):
+        doc = next((d for d in self.docs if _matches(d, query)), None)
+        if doc is not None:
+            self._apply(doc, update)
+        return _Result(int(doc is not None))
+
+    async def update_many(self, query, update):
+        docs = [d for d in self.docs if _matches(d, query)]
+        for doc in docs:
+            self._apply(doc, update)
+        return _Result(len(docs))
+
+    def job(self, job_id):
+        return next(d for d in self.docs if d["id"] == job_id)
+
+
+def make_outbox(handler=None, **kwargs):
+    collection = MemoryOutbox()
+    outbox = Outbox(lambda: collection, backoff_base=10, backoff_max=100, **kwargs)
+    outbox.register("email", handler or _ok)
+    return outbox, collection
+
+
+async def _ok(payload):
+    return True
+
+
+async def _failing(payload):
+    return False
+
+
+async def _claim_and_run(outbox):
+    job = await outbox._claim()
+    await outbox._run_job(job)
+    return job
+
+
+class TestClaim:
+    def test_priority_then_due_time(self):
+        outbox, collection = make_outbox()
+
+        async def run():
+            bulk = await outbox.enqueue("email", {"n": 1})
+            collection.job(bulk)["priority"] = 10
+            transactional = await outbox.enqueue("email", {"n": 2})
+            later = await outbox.enqueue("email", {"n": 3}, delay=3600)
+            first, second, third = await outbox._claim(), await outbox._claim(), await outbox._claim()
+            return bulk, transactional, later, first, second, third
+
+        bulk, transactional, later, first, second, third = asyncio.run(run())
+        assert [first["id"], second["id"]] == [transactional, bulk]
+        assert third is None  # not due yet
+        assert first["attempts"] == 1
+        assert collection.job(transactional)["status"] == "processing"
+        assert collection.job(later)["status"] == "pending"
+
+    def test_expired_lease_is_reclaimed(self):
+        outbox, collection = make_outbox()
+
+        async def run():
+            job_id = await outbox.enqueue("email", {})
+            await outbox._claim()
+            assert await outbox._claim() is None  # leased
+            collection.job(job_id)["locked_until"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+            return await outbox._claim()
+
+        reclaimed = asyncio.run(run())
+        assert reclaimed is not None and reclaimed["attempts"] == 2
+
+
+class TestBackoffAndDeadLetter:
+    def test_backoff_grows_and_caps(self):
+        outbox, _ = make_outbox()
+        assert 8 <= outbox.backoff(1) <= 12
+        assert 32 <= outbox.backoff(3) <= 48
+        assert outbox.backoff(10) <= 120
+
+    def test_failure_is_rescheduled_with_backoff(self):
+        outbox, collection = make_outbox(_failing)
+
+        async def run():
+            job_id = await outbox.enqueue("email", {"to_email": "a@example.com"})
+            await _claim_and_run(outbox)
+            return collection.job(job_id)
+
+        job = asyncio.run(run())
+        assert job["status"] == "pending"
+        assert job["last_error"] == "provider reported failure"
+        assert job["next_attempt_at"] >= datetime.now(timezone.utc) + timedelta(seconds=7)
+        assert job["payload"] == {"to_email": "a@example.com"}
+
+    def test_dead_after_max_attempts_then_retry(self):
+        outbox, collection = make_outbox(_failing, max_attempts=2)
+
+        async def run():
+            job_id = await outbox.enqueue("email", {"to_email": "a@example.com"})
+            await _claim_and_run(outbox)
+            collection.job(job_id)["next_attempt_at"] = datetime.now(timezone.utc)
+            await _claim_and_run(outbox)
+            dead = dict(collection.job(job_id))
+            retried = await outbox.retry(job_id)
+            return dead, retried, collection.job(job_id)
+
+        dead, retried, job = asyncio.run(run())
+        assert dead["status"] == "dead" and dead["attempts"] == 2
+        assert dead["finished_at"] is not None
+        assert dead["payload"]  # kept so the job can be retried
+        assert retried
+        assert job["status"] == "pending" and job["attempts"] == 0 and job["finished_at"] is None
+
+    def test_permanent_failure_is_not_retried(self):
+        async def invalid_recipient(payload):
+            raise PermanentFailure("Recipient number is invalid")
+
+        outbox, collection = make_outbox(invalid_recipient)
+
+        async def run():
+            job_id = await outbox.enqueue("email", {})
+            await _claim_and_run(outbox)
+            return collection.job(job_id)
+
+        job = asyncio.run(run())
+        assert job["status"] == "dead" and job["attempts"] == 1
+        assert job["last_error"] == "Recipient number is invalid"
+        assert outbox.counters["permanent_failures"] == 1
+
+    def test_unavailable_provider_is_deferred_not_dead(self):
+        async def not_configured(payload):
+            raise ProviderUnavailable("SMTP not configured")
+
+        outbox, collection = make_outbox(not_configured, max_attempts=2)
+
+        async def run():
+            job_id = await outbox.enqueue("email", {"to_email": "a@example.com"})
+            for _ in range(3):
+                collection.job(job_id)["next_attempt_at"] = datetime.now(timezone.utc)
+                await _claim_and_run(outbox)
+            return collection.job(job_id)
+
+        job = asyncio.run(run())
+        assert job["status"] == "pending" and job["attempts"] == 0
+        assert job["last_error"] == "SMTP not configured"
+        assert job["next_attempt_at"] >= datetime.now(timezone.utc) + timedelta(seconds=99)
+        assert job["payload"] == {"to_email": "a@example.com"}
+        assert outbox.counters["deferred"] == 3 and outbox.counters["dead"] == 0
+
+
+class TestFinishedJobs:
+    def test_sent_job_drops_payload(self):
+        outbox, collection = make_outbox()
+
+        async def run():
+            job_id = await outbox.enqueue("email", {"body": "Your OTP is 123456"})
+            await _claim_and_run(outbox)
+            return collection.job(job_id)
+
+        job = asyncio.run(run())
+        assert job["status"] == "sent"
+        assert "payload" not in job
+        assert job["finished_at"] == job["sent_at"]
+
+    def test_cancelled_batch_drops_payload(self):
+        outbox, collection = make_outbox()
+
+        async def run():
+            await outbox.enqueue_many([{"channel": "email", "payload": {"n": n}, "batch_id": "b1"} for n in range(3)])
+            return await outbox.cancel_batch("b1")
+
+        assert asyncio.run(run()) == 3
+        assert all(d["status"] == "cancelled" and "payload" not in d and d["finished_at"] for d in collection.docs)
+
+
+class TestIdempotency:
+    def test_same_key_returns_existing_job(self):
+        outbox, collection = make_outbox()
+
+        async def run():
+            first = await outbox.enqueue("email", {"n": 1}, idempotency_key="welcome:u1")
+            second = await outbox.enqueue("email", {"n": 2}, idempotency_key="welcome:u1")
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first == second
+        assert len(collection.docs) == 1
+        assert outbox.counters["deduplicated"] == 1
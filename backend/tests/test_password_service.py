@@ -0,0 +1,60 @@
+"""
+Test bcrypt hashing on the password thread pool (no running backend needed):
+- hash/verify round-trip through the executor, on bcrypt threads
+- malformed or empty hashes fail verification instead of raising
+- password_service_from_env reads PASSWORD_HASH_WORKERS and BCRYPT_ROUNDS
+"""
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt  # noqa: E402
+
+from password_service import PasswordService, _hash_sync, password_service_from_env  # noqa: E402
+
+
+class TestPasswordService:
+    def test_round_trip_runs_on_executor(self):
+        service = PasswordService(max_workers=2, rounds=4)
+        threads = []
+        real_hash = bcrypt.hashpw
+
+        def recording_hashpw(password, salt):
+            threads.append(threading.current_thread().name)
+            return real_hash(password, salt)
+
+        async def run():
+            hashed = await service.hash("s3cret")
+            return hashed, await service.verify("s3cret", hashed), await service.verify("wrong", hashed)
+
+        bcrypt.hashpw = recording_hashpw
+        try:
+            hashed, ok, wrong = asyncio.run(run())
+        finally:
+            bcrypt.hashpw = real_hash
+            service.shutdown()
+        assert ok and not wrong
+        assert hashed.startswith("$2b$04$")
+        assert threads and threads[0].startswith("bcrypt")
+        assert service.verify_sync("s3cret", hashed)
+
+    def test_bad_hashes_fail_closed(self):
+        service = PasswordService(max_workers=1, rounds=4)
+        try:
+            assert not asyncio.run(service.verify("s3cret", ""))
+            assert not asyncio.run(service.verify("s3cret", "not-a-bcrypt-hash"))
+        finally:
+            service.shutdown()
+
+    def test_reads_env(self, monkeypatch):
+        monkeypatch.setenv("PASSWORD_HASH_WORKERS", "3")
+        monkeypatch.setenv("BCRYPT_ROUNDS", "5")
+        service = password_service_from_env()
+        assert (service.max_workers, service.rounds) == (3, 5)
+        assert _hash_sync("x", service.rounds).startswith("$2b$05$")
+
+        monkeypatch.setenv("PASSWORD_HASH_WORKERS", "0")
+        assert password_service_from_env().max_workers == min(4, os.cpu_count() or 1)
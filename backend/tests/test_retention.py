@@ -0,0 +1,101 @@
+"""
+Test log archival with an in-memory collection (no running backend needed):
+- expired documents (new stored_at dates and legacy ISO timestamps) land in gzip NDJSON, then are deleted
+- recent documents stay; the TTL index fires after the archive grace period
+"""
+import asyncio
+import gzip
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import json_util  # noqa: E402
+from retention import RetentionPolicy, archive_collection, ttl_index_models  # noqa: E402
+
+NOW = datetime(2026, 6, 1, 3, 0, tzinfo=timezone.utc)
+
+
+def expired(doc, cutoff):
+    stored_at = doc.get("stored_at")
+    if stored_at is not None:
+        return stored_at < cutoff
+    return doc.get("timestamp", "") < cutoff.isoformat()
+
+
+class MemoryCollection:
+    """Just enough of a motor collection for archive_collection."""
+
+    def __init__(self, docs, policy):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.cutoff = policy.cutoff(NOW)
+        self.deletes = 0
+
+    def find(self, query):
+        matches = sorted((d for d in self.docs.values() if expired(d, self.cutoff)), key=lambda d: d["_id"])
+
+        class _Cursor:
+            def sort(self, *args):
+                return self
+
+            def batch_size(self, n):
+                return self
+
+            def __aiter__(self):
+                return self._iter()
+
+            async def _iter(self):
+                for doc in matches:
+                    yield dict(doc)
+        return _Cursor()
+
+    async def delete_many(self, query):
+        self.deletes += 1
+        ids = [i for i in query["_id"]["$in"] if i in self.docs]
+        for i in ids:
+            del self.docs[i]
+
+        class _Result:
+            deleted_count = len(ids)
+        return _Result()
+
+
+class TestRetention:
+    """archive_collection and the TTL declarations"""
+
+    def test_archive_then_delete(self, tmp_path):
+        policy = RetentionPolicy("email_logs", days=90)
+        docs = [{"_id": i, "id": f"old-{i}", "stored_at": NOW - timedelta(days=100 + i)} for i in range(5)]
+        docs.append({"_id": 10, "id": "legacy", "timestamp": (NOW - timedelta(days=200)).isoformat()})
+        docs.append({"_id": 11, "id": "recent", "stored_at": NOW - timedelta(days=3)})
+        collection = MemoryCollection(docs, policy)
+
+        result = asyncio.run(archive_collection({"email_logs": collection}, policy, NOW, tmp_path, batch_size=2))
+        assert result["archived"] == result["deleted"] == 6
+        assert collection.deletes == 3  # one delete per archived batch
+        assert [d["id"] for d in collection.docs.values()] == ["recent"]
+
+        with gzip.open(result["file"], "rt") as handle:
+            archived = [json_util.loads(line, json_options=json_util.JSONOptions(tz_aware=True)) for line in handle]
+        assert [d["id"] for d in archived] == ["old-0", "old-1", "old-2", "old-3", "old-4", "legacy"]
+        assert archived[0]["stored_at"] == NOW - timedelta(days=100)
+        assert not list(tmp_path.rglob("*.part"))
+
+    def test_nothing_expired_writes_no_file(self, tmp_path):
+        policy = RetentionPolicy("whatsapp_logs", days=90)
+        collection = MemoryCollection([{"_id": 1, "stored_at": NOW}], policy)
+        result = asyncio.run(archive_collection({"whatsapp_logs": collection}, policy, NOW, tmp_path))
+        assert result == {"collection": "whatsapp_logs", "archived": 0, "deleted": 0, "file": None}
+        assert not list(tmp_path.iterdir())
+
+    def test_ttl_backstop(self):
+        policies = {
+            "email_logs": RetentionPolicy("email_logs", days=90, grace_days=3),
+            "otps": RetentionPolicy("otps", days=1, archive=False, legacy_field="expires_at"),
+            "activity_logs": RetentionPolicy("activity_logs", days=0),
+        }
+        models = {name: m[0].document for name, m in ttl_index_models(policies).items()}
+        assert models["email_logs"]["expireAfterSeconds"] == 93 * 86400
+        assert models["otps"]["expireAfterSeconds"] == 86400
+        assert "activity_logs" not in models  # 0 days keeps documents forever
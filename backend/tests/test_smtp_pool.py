@@ -0,0 +1,118 @@
+"""
+Test SMTPPool against a local aiosmtpd stand-in (no running backend needed):
+- sessions are reused across sends and bounded by max_size
+- idle expiry, settings changes and dropped sessions reconnect
+"""
+import asyncio
+import os
+import sys
+from email.mime.text import MIMEText
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from smtp_pool import SMTPPool  # noqa: E402
+from smtp_stub import LocalSMTPServer  # noqa: E402
+
+
+def make_message(i):
+    message = MIMEText(f"<p>Hello member {i}</p>", "html")
+    message["From"] = "F3 FITNESS HEALTH CLUB <stub@f3fitness.local>"
+    message["To"] = f"member{i}@example.com"
+    message["Subject"] = f"Test {i}"
+    return message
+
+
+@pytest.fixture
+def smtp_server():
+    with LocalSMTPServer() as server:
+        yield server
+
+
+class TestSMTPPool:
+    """Connection reuse and recovery"""
+
+    def test_sequential_sends_share_one_session(self, smtp_server):
+        async def run():
+            pool = SMTPPool(max_size=4)
+            for i in range(20):
+                await pool.send(smtp_server.settings(), make_message(i))
+            await pool.close()
+            return pool.stats()
+
+        stats = asyncio.run(run())
+        assert len(smtp_server.messages) == 20
+        assert smtp_server.logins == 1
+        assert stats["connects"] == 1
+        assert stats["reused"] == 19
+
+    def test_concurrency_bounded_by_pool_size(self, smtp_server):
+        async def run():
+            pool = SMTPPool(max_size=3)
+            await asyncio.gather(*(pool.send(smtp_server.settings(), make_message(i)) for i in range(30)))
+            await pool.close()
+            return pool.stats()
+
+        stats = asyncio.run(run())
+        assert len(smtp_server.messages) == 30
+        assert stats["connects"] <= 3
+
+    def test_idle_sessions_expire(self, smtp_server):
+        async def run():
+            pool = SMTPPool(idle_timeout=0)
+            for i in range(3):
+                await pool.send(smtp_server.settings(), make_message(i))
+            await pool.close()
+            return pool.stats()
+
+        stats = asyncio.run(run())
+        assert stats["connects"] == 3
+        assert stats["expired"] == 2
+
+    def test_session_retired_after_max_messages(self, smtp_server):
+        async def run():
+            pool = SMTPPool(max_messages=5)
+            for i in range(12):
+                await pool.send(smtp_server.settings(), make_message(i))
+            await pool.close()
+            return pool.stats()
+
+        assert asyncio.run(run())["connects"] == 3
+
+    def test_settings_change_opens_new_session(self, smtp_server):
+        async def run():
+            pool = SMTPPool()
+            await pool.send(smtp_server.settings(), make_message(0))
+            await pool.send(smtp_server.settings(sender_email="other@f3fitness.local"), make_message(1))
+            await pool.send(smtp_server.settings(smtp_host="localhost"), make_message(2))
+            await pool.close()
+            return pool.stats()
+
+        stats = asyncio.run(run())
+        # sender_email is not part of the connection; the host is
+        assert stats["connects"] == 2
+
+    def test_dropped_session_is_replaced(self, smtp_server):
+        async def run():
+            pool = SMTPPool()
+            await pool.send(smtp_server.settings(), make_message(0))
+            # Simulate the server silently closing the idle connection
+            pool._idle[0].smtp.close()
+            await pool.send(smtp_server.settings(), make_message(1))
+            await pool.close()
+            return pool.stats()
+
+        stats = asyncio.run(run())
+        assert len(smtp_server.messages) == 2
+        assert stats["connects"] == 2
+
+    def test_bad_credentials_raise(self, smtp_server):
+        async def run():
+            pool = SMTPPool()
+            await pool.send(smtp_server.settings(smtp_pass="wrong"), make_message(0))
+
+        with pytest.raises(Exception):
+            asyncio.run(run())
+        assert smtp_server.messages == []
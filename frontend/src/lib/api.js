@@ -85,6 +85,17 @@ export const membershipsAPI = {
 // Payments APIs
 export const paymentsAPI = {
   getAll: (params) => api.get('/payments', { params }),
+  // Follows X-Next-Cursor until the (keyset paginated) history is exhausted
+  getAllPages: async (params) => {
+    const payments = [];
+    let cursor = null;
+    do {
+      const res = await api.get('/payments', { params: { ...params, limit: 500, ...(cursor && { cursor }) } });
+      payments.push(...res.data);
+      cursor = res.headers['x-next-cursor'];
+    } while (cursor);
+    return { data: payments };
+  },
   getTodayCollection: () => api.get('/payments/today-collection'),
   getSummary: (period, date) => api.get('/payments/summary', { params: { period, date } }),
   create: (data) => api.post('/payments', data)
@@ -121,6 +132,17 @@ export const paymentRequestsAPI = {
 // Attendance APIs
 export const attendanceAPI = {
   getAll: (params) => api.get('/attendance', { params }),
+  // Follows X-Next-Cursor until the (keyset paginated) check-ins are exhausted
+  getAllPages: async (params) => {
+    const attendance = [];
+    let cursor = null;
+    do {
+      const res = await api.get('/attendance', { params: { ...params, limit: 500, ...(cursor && { cursor }) } });
+      attendance.push(...res.data);
+      cursor = res.headers['x-next-cursor'];
+    } while (cursor);
+    return { data: attendance };
+  },
   getToday: () => api.get('/attendance/today'),
   getUserHistory: (userId) => api.get(`/attendance/user/${userId}`),
   mark: (memberId) => api.post('/attendance', { member_id: memberId })
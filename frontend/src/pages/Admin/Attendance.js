@@ -40,7 +40,7 @@ export const MarkAttendance = () => {
 
   const fetchRecentAttendance = async () => {
     try {
-      const response = await attendanceAPI.getAll({ date: selectedDate });
+      const response = await attendanceAPI.getAllPages({ date: selectedDate });
       setRecentAttendance(response.data);
     } catch (error) {
       console.error('Failed to fetch attendance');
@@ -21,6 +21,9 @@ export const EmailLogsSettings = () => {
   const [filter, setFilter] = useState('all');
   const [page, setPage] = useState(0);
   const [total, setTotal] = useState(0);
+  // cursors[n] is the `after` token that loads page n (keyset pagination)
+  const [cursors, setCursors] = useState([null]);
+  const [hasMore, setHasMore] = useState(false);
   const [selectedLog, setSelectedLog] = useState(null);
   const limit = 20;
 
@@ -32,11 +35,22 @@ export const EmailLogsSettings = () => {
   const fetchLogs = async () => {
     try {
       setLoading(true);
-      const params = { limit, skip: page * limit };
+      const params = { limit };
+      if (cursors[page]) params.after = cursors[page];
+      else params.skip = page * limit;
       if (filter !== 'all') params.status = filter;
       const res = await emailLogsAPI.getAll(params);
       setLogs(res.data.logs);
       setTotal(res.data.pagination.total);
+      setHasMore(res.data.pagination.has_more ?? (page + 1) * limit < res.data.pagination.total);
+      const nextAfter = res.data.pagination.next_after;
+      if (nextAfter) {
+        setCursors(prev => {
+          const next = prev.slice(0, page + 1);
+          next[page + 1] = nextAfter;
+          return next;
+        });
+      }
     } catch (error) {
       toast.error('Failed to load Email logs');
     } finally {
@@ -223,7 +237,7 @@ export const EmailLogsSettings = () => {
               <CardDescription>View delivery status and errors for all emails</CardDescription>
             </div>
             <div className="flex items-center gap-2">
-              <Select value={filter} onValueChange={(value) => { setFilter(value); setPage(0); }}>
+              <Select value={filter} onValueChange={(value) => { setFilter(value); setCursors([null]); setPage(0); }}>
                 <SelectTrigger className="w-[140px]">
                   <SelectValue placeholder="Filter" />
                 </SelectTrigger>
@@ -337,7 +351,7 @@ export const EmailLogsSettings = () => {
                     variant="outline" 
                     size="sm" 
                     onClick={() => setPage(p => p + 1)}
-                    disabled={(page + 1) * limit >= total}
+                    disabled={!hasMore}
                   >
                     Next
                     <ChevronRight size={16} />
@@ -11,7 +11,7 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '.
 import { InvoiceModal } from '../../components/InvoiceModal';
 import { 
   Search, Plus, CreditCard, Calendar, TrendingUp, 
-  DollarSign, CheckCircle, XCircle, Clock, FileText
+  DollarSign, CheckCircle, XCircle, Clock, FileText, ChevronLeft, ChevronRight
 } from 'lucide-react';
 import { toast } from 'sonner';
 
@@ -19,22 +19,38 @@ export const PaymentsList = () => {
   const [payments, setPayments] = useState([]);
   const [loading, setLoading] = useState(true);
   const [dateFilter, setDateFilter] = useState('');
+  const [page, setPage] = useState(0);
+  // cursors[n] is the X-Next-Cursor token that loads page n (keyset pagination)
+  const [cursors, setCursors] = useState([null]);
+  const [hasMore, setHasMore] = useState(false);
   const [selectedPaymentId, setSelectedPaymentId] = useState(null);
   const [showInvoice, setShowInvoice] = useState(false);
+  const limit = 50;
 
   useEffect(() => {
     fetchPayments();
-  }, [dateFilter]);
+  }, [dateFilter, page]);
 
   const fetchPayments = async () => {
     try {
-      const params = {};
+      setLoading(true);
+      const params = { limit };
+      if (cursors[page]) params.cursor = cursors[page];
       if (dateFilter) {
         params.date_from = dateFilter;
         params.date_to = dateFilter + 'T23:59:59';
       }
       const response = await paymentsAPI.getAll(params);
       setPayments(response.data);
+      setHasMore(response.headers['x-has-more'] === 'true');
+      const nextCursor = response.headers['x-next-cursor'];
+      if (nextCursor) {
+        setCursors(prev => {
+          const next = prev.slice(0, page + 1);
+          next[page + 1] = nextCursor;
+          return next;
+        });
+      }
     } catch (error) {
       toast.error('Failed to load payments');
     } finally {
@@ -42,6 +58,12 @@ export const PaymentsList = () => {
     }
   };
 
+  const handleDateFilterChange = (value) => {
+    setCursors([null]);
+    setPage(0);
+    setDateFilter(value);
+  };
+
   const handleViewInvoice = (paymentId) => {
     setSelectedPaymentId(paymentId);
     setShowInvoice(true);
@@ -62,7 +84,7 @@ export const PaymentsList = () => {
               type="date"
               className="input-dark w-40"
               value={dateFilter}
-              onChange={(e) => setDateFilter(e.target.value)}
+              onChange={(e) => handleDateFilterChange(e.target.value)}
               data-testid="date-filter"
             />
           </div>
@@ -122,6 +144,35 @@ export const PaymentsList = () => {
               </tbody>
             </table>
           </div>
+          {(page > 0 || hasMore) && (
+            <div className="flex items-center justify-between px-6 py-4">
+              <p className="text-sm text-muted-foreground">
+                Showing {page * limit + 1} - {page * limit + payments.length}
+              </p>
+              <div className="flex items-center gap-2">
+                <Button
+                  variant="outline"
+                  size="sm"
+                  onClick={() => setPage(p => Math.max(0, p - 1))}
+                  disabled={page === 0 || loading}
+                  data-testid="payments-prev"
+                >
+                  <ChevronLeft size={16} />
+                  Previous
+                </Button>
+                <Button
+                  variant="outline"
+                  size="sm"
+                  onClick={() => setPage(p => p + 1)}
+                  disabled={!hasMore || loading}
+                  data-testid="payments-next"
+                >
+                  Next
+                  <ChevronRight size={16} />
+                </Button>
+              </div>
+            </div>
+          )}
         </Card>
       </div>
 
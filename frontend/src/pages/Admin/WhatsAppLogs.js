@@ -20,6 +20,9 @@ export const WhatsAppLogsSettings = () => {
   const [filter, setFilter] = useState('all');
   const [page, setPage] = useState(0);
   const [total, setTotal] = useState(0);
+  // cursors[n] is the `after` token that loads page n (keyset pagination)
+  const [cursors, setCursors] = useState([null]);
+  const [hasMore, setHasMore] = useState(false);
   const limit = 20;
 
   useEffect(() => {
@@ -30,11 +33,22 @@ export const WhatsAppLogsSettings = () => {
   const fetchLogs = async () => {
     try {
       setLoading(true);
-      const params = { limit, skip: page * limit };
+      const params = { limit };
+      if (cursors[page]) params.after = cursors[page];
+      else params.skip = page * limit;
       if (filter !== 'all') params.status = filter;
       const res = await whatsappLogsAPI.getAll(params);
       setLogs(res.data.logs);
       setTotal(res.data.pagination.total);
+      setHasMore(res.data.pagination.has_more ?? (page + 1) * limit < res.data.pagination.total);
+      const nextAfter = res.data.pagination.next_after;
+      if (nextAfter) {
+        setCursors(prev => {
+          const next = prev.slice(0, page + 1);
+          next[page + 1] = nextAfter;
+          return next;
+        });
+      }
     } catch (error) {
       toast.error('Failed to load WhatsApp logs');
     } finally {
@@ -208,7 +222,7 @@ export const WhatsAppLogsSettings = () => {
               <CardDescription>View delivery status and errors for all WhatsApp messages</CardDescription>
             </div>
             <div className="flex items-center gap-2">
-              <Select value={filter} onValueChange={(value) => { setFilter(value); setPage(0); }}>
+              <Select value={filter} onValueChange={(value) => { setFilter(value); setCursors([null]); setPage(0); }}>
                 <SelectTrigger className="w-[140px]">
                   <SelectValue placeholder="Filter" />
                 </SelectTrigger>
@@ -314,7 +328,7 @@ export const WhatsAppLogsSettings = () => {
                     variant="outline" 
                     size="sm" 
                     onClick={() => setPage(p => p + 1)}
-                    disabled={(page + 1) * limit >= total}
+                    disabled={!hasMore}
                   >
                     Next
                     <ChevronRight size={16} />
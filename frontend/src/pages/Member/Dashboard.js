@@ -39,7 +39,7 @@ export const MemberDashboard = () => {
         attendanceAPI.getUserHistory(user.id),
         announcementsAPI.getAll(),
         holidaysAPI.getAll(),
-        paymentsAPI.getAll({ user_id: user.id })
+        paymentsAPI.getAll({ user_id: user.id, limit: 1 })
       ]);
       setMembership(membershipRes.data);
       setAttendance(attendanceRes.data);
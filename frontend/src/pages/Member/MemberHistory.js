@@ -32,7 +32,7 @@ export const MemberHistory = () => {
     try {
       const [membershipRes, paymentsRes] = await Promise.all([
         membershipsAPI.getAll(user.id),
-        paymentsAPI.getAll({ user_id: user.id })
+        paymentsAPI.getAllPages({ user_id: user.id })
       ]);
       setMemberships(membershipRes.data);
       setPayments(paymentsRes.data);
@@ -51,7 +51,7 @@ export const ReceptionistDashboard = () => {
 
   const fetchRecentAttendance = async () => {
     try {
-      const response = await attendanceAPI.getAll({ date: selectedDate });
+      const response = await attendanceAPI.getAllPages({ date: selectedDate });
       setRecentAttendance(response.data);
     } catch (error) {
       console.error('Failed to fetch attendance');